@@ -1,38 +1,104 @@
 # backend/auth.py
-from passlib.hash import argon2
-from database import get_conn, USE_MEMORY_DB, find_user_by_email
+import hmac
+import os
 
-def login_user(email: str, senha: str):
+from fastapi import Header, HTTPException
+from fastapi.concurrency import run_in_threadpool
+
+from database import get_conn, USE_MEMORY_DB, find_user_by_email, update_user_hash
+from hashing import verify_password, verify_password_async
+
+# token das rotas administrativas que alteram estado (Authorization: Bearer <token>);
+# sem ele configurado essas rotas ficam desligadas
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+
+def _buscar_credenciais(email: str):
+    """Linha do usuário com o hash da senha (ou None)."""
     # Modo memória (usando o mesmo argon2 que o create_user)
     if USE_MEMORY_DB:
-        row = find_user_by_email(email)
-        if row and argon2.verify(senha, row["senha_hash"]):
-            return {
-                "id_usuario": row["id_usuario"],
-                "nome": row["nome"],
-                "email": row["email"],
-            }
-        return None
+        return find_user_by_email(email)
 
     # Modo PostgreSQL
-    conn = get_conn()
-    cur = conn.cursor()
-    try:
-        cur.execute(
-            "SELECT id_usuario, nome, email, senha_hash FROM usuarios WHERE email=%s",
-            (email,),
-        )
-        row = cur.fetchone()
-    finally:
-        cur.close()
-        conn.close()
+    with get_conn() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute(
+                "SELECT id_usuario, nome, email, senha_hash FROM usuarios WHERE email=%s",
+                (email,),
+            )
+            return cur.fetchone()
+        finally:
+            cur.close()
 
+
+def _regravar_hash(row, novo_hash: str):
+    """Parâmetros do Argon2 mudaram: regrava o hash com os atuais."""
+    if USE_MEMORY_DB:
+        update_user_hash(row["id_usuario"], novo_hash)
+        return
+
+    with get_conn() as conn:
+        cur = conn.cursor()
+        try:
+            # só troca se ninguém mudou a senha nesse meio tempo
+            cur.execute(
+                "UPDATE usuarios SET senha_hash=%s WHERE id_usuario=%s AND senha_hash=%s",
+                (novo_hash, row["id_usuario"], row["senha_hash"]),
+            )
+            conn.commit()
+        finally:
+            cur.close()
+
+
+def _usuario(row):
     # row vem como RealDictRow (mapeamento), então acesse por nomes de coluna
-    if row and argon2.verify(senha, row["senha_hash"]):
-        return {
-            "id_usuario": row["id_usuario"],
-            "nome": row["nome"],
-            "email": row["email"],
-        }
-
-    return None
+    return {
+        "id_usuario": row["id_usuario"],
+        "nome": row["nome"],
+        "email": row["email"],
+    }
+
+
+def login_user(email: str, senha: str):
+    row = _buscar_credenciais(email)
+    if not row:
+        return None
+
+    # a conexão já voltou ao pool enquanto o Argon2 roda
+    ok, novo_hash = verify_password(senha, row["senha_hash"])
+    if not ok:
+        return None
+    if novo_hash:
+        _regravar_hash(row, novo_hash)
+    return _usuario(row)
+
+
+async def login_user_async(email: str, senha: str):
+    """
+    `login_user` para rotas async: só as idas ao banco usam o threadpool;
+    a espera pelo Argon2 é um `await` no pool de `hashing`.
+    """
+    row = await run_in_threadpool(_buscar_credenciais, email)
+    if not row:
+        return None
+
+    ok, novo_hash = await verify_password_async(senha, row["senha_hash"])
+    if not ok:
+        return None
+    if novo_hash:
+        await run_in_threadpool(_regravar_hash, row, novo_hash)
+    return _usuario(row)
+
+
+def require_admin(authorization: str | None = Header(None)):
+    """Dependência das rotas /admin que escrevem em disco ou mexem no estado."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Rotas administrativas desligadas (defina ADMIN_TOKEN).")
+    esperado = f"Bearer {ADMIN_TOKEN}".encode()
+    if authorization is None or not hmac.compare_digest(authorization.encode(), esperado):
+        raise HTTPException(
+            status_code=401,
+            detail="Token de administração inválido.",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
@@ -0,0 +1,97 @@
+"""
+Benchmark da serialização de `/musicas` com 10 mil linhas.
+
+Compara o caminho padrão do FastAPI (jsonable_encoder + json da stdlib) com
+o `fast_json` (orjson direto), tanto só a codificação quanto a requisição
+inteira pelo ASGI. Roda no modo memória, sem Postgres:
+
+    cd backend && python benchmarks/bench_json.py [--rows 10000] [--repeat 20]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BACKEND = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND))
+
+os.environ.setdefault("USE_MEMORY_DB", "1")
+os.environ.setdefault("APP_MEDIA_DIR", tempfile.mkdtemp(prefix="bench-media-"))
+os.environ["CACHE_ENABLED"] = "0"  # mede a serialização, não o cache
+os.environ["PAGE_SIZE_MAX"] = "1000000"
+
+import json  # noqa: E402
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.routing import APIRoute  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+from crud.musicas import listar_musicas  # noqa: E402
+from database import add_musica, create_album, add_user  # noqa: E402
+from fast_json import dumps  # noqa: E402
+from main import app  # noqa: E402
+
+
+def seed(rows):
+    user = add_user("Bench", "bench@example.com", "x")
+    album = create_album("Bench", 2024, user["id_usuario"])
+    generos = ["Rock", "Pop", "Jazz", "Samba", "Forró", "Indie"]
+    for i in range(rows):
+        add_musica(f"Música número {i}", generos[i % len(generos)], 180 + i % 240, album["id_album"], user["id_usuario"])
+
+
+def timeit(fn, repeat):
+    fn()  # aquecimento
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(samples), min(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    seed(args.rows)
+    page = listar_musicas(limit=args.rows)
+    assert len(page) == args.rows
+
+    # mesma rota, mas com o APIRoute padrão (jsonable_encoder + JSONResponse)
+    def musicas_padrao(limit: int):
+        return listar_musicas(limit=limit)
+
+    app.router.add_api_route(
+        "/_bench/musicas",
+        musicas_padrao,
+        methods=["GET"],
+        route_class_override=APIRoute,
+    )
+    client = TestClient(app)
+    url = f"?limit={args.rows}"
+    assert client.get("/musicas" + url).json() == client.get("/_bench/musicas" + url).json()
+
+    cases = [
+        ("encode: jsonable_encoder + json", lambda: json.dumps(jsonable_encoder(page)).encode()),
+        ("encode: fast_json.dumps", lambda: dumps(page)),
+        ("GET /musicas (APIRoute padrão)", lambda: client.get("/_bench/musicas" + url)),
+        ("GET /musicas (FastJSONRoute)", lambda: client.get("/musicas" + url)),
+    ]
+    results = {name: timeit(fn, args.repeat) for name, fn in cases}
+
+    print(f"{args.rows} linhas, {args.repeat} repetições (ms: mediana / mínimo)")
+    for name, (med, best) in results.items():
+        print(f"  {name:<34} {med:8.2f} / {best:8.2f}")
+    names = list(results)
+    for base, fast in ((names[0], names[1]), (names[2], names[3])):
+        print(f"  ganho {fast.split(':')[0].split(' (')[0]}: {results[base][0] / results[fast][0]:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
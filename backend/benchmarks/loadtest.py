@@ -0,0 +1,416 @@
+"""
+Teste de carga de ponta a ponta: usuários virtuais refazendo as jornadas das
+páginas de `frontend/` contra o app, com vários usuários ao mesmo tempo.
+
+Cada usuário virtual é uma task asyncio que sorteia uma jornada (ouvinte,
+artista, curador), executa-a e repete até acabar o tempo. As jornadas usam
+as mesmas chamadas que o front-end faz (login, catálogo, playlists,
+streaming com Range, upload, inclusão em lote). Ao final sai, por rota
+(template), vazão e latência p50/p95/p99, e o resultado vai para um JSON
+que pode ser comparado entre commits:
+
+    cd backend
+    python benchmarks/loadtest.py run --users 50 --duration 30
+    python benchmarks/loadtest.py run --transport socket --db postgres
+    python benchmarks/loadtest.py compare antes.json depois.json
+
+`--transport asgi` chama o app em processo (httpx.ASGITransport), sem rede;
+`--transport socket` sobe o uvicorn numa porta local e vai por TCP.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+
+BACKEND = Path(__file__).resolve().parents[1]
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+GENEROS = ["Rock", "Pop", "Jazz", "Samba", "Forró", "Indie", "MPB", "Eletrônica"]
+PALAVRAS = ["amor", "noite", "mar", "cancao", "sol", "estrada", "saudade", "cidade"]
+AUDIO = bytes(range(256)) * 256  # 64 KiB de "áudio"
+
+
+def percentile(sorted_values, p):
+    """Percentil por interpolação linear (mesmo método do numpy)."""
+    if not sorted_values:
+        return None
+    k = (len(sorted_values) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+class Recorder:
+    """Latências (ms) e status por rota, em memória durante o teste."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.errors = defaultdict(int)
+        self.bytes = defaultdict(int)
+
+    async def call(self, client, route, method, url, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            resp = await client.request(method, url, **kwargs)
+        except Exception as exc:  # conexão recusada, timeout...
+            self.errors[route] += 1
+            self.statuses[route][type(exc).__name__] += 1
+            return None
+        self.latencies[route].append((time.perf_counter() - t0) * 1000)
+        self.statuses[route][str(resp.status_code)] += 1
+        self.bytes[route] += len(resp.content)
+        return resp
+
+    def summary(self, elapsed):
+        routes = {}
+        for route in sorted(set(self.latencies) | set(self.statuses)):
+            lat = sorted(self.latencies[route])
+            count = sum(self.statuses[route].values())
+            routes[route] = {
+                "requests": count,
+                "throughput_rps": round(count / elapsed, 2),
+                "statuses": dict(self.statuses[route]),
+                "errors": self.errors[route],
+                "bytes": self.bytes[route],
+                "latency_ms": {
+                    "min": round(lat[0], 3) if lat else None,
+                    "p50": round(percentile(lat, 50), 3) if lat else None,
+                    "p95": round(percentile(lat, 95), 3) if lat else None,
+                    "p99": round(percentile(lat, 99), 3) if lat else None,
+                    "max": round(lat[-1], 3) if lat else None,
+                    "mean": round(sum(lat) / len(lat), 3) if lat else None,
+                },
+            }
+        todas = sorted(x for v in self.latencies.values() for x in v)
+        total = sum(r["requests"] for r in routes.values())
+        return {
+            "routes": routes,
+            "total": {
+                "requests": total,
+                "throughput_rps": round(total / elapsed, 2),
+                "errors": sum(self.errors.values()),
+                "non_2xx": sum(
+                    n for st in self.statuses.values() for code, n in st.items()
+                    if not (code.isdigit() and code[0] in "23")
+                ),
+                "latency_ms": {p: round(percentile(todas, int(p[1:])), 3) if todas else None
+                               for p in ("p50", "p95", "p99")},
+            },
+        }
+
+
+# Jornadas ---------------------------------------------------------------------
+
+class Catalogo:
+    """O que o seed criou e as jornadas reutilizam (ids válidos)."""
+
+    def __init__(self):
+        self.usuarios = []  # (id_usuario, email, senha)
+        self.albuns = []
+        self.musicas = []
+        self.playlists = []
+
+
+async def login(rec, client, cat, rng):
+    id_usuario, email, senha = rng.choice(cat.usuarios)
+    await rec.call(client, "POST /login", "POST", "/login", json={"email": email, "senha": senha})
+    await rec.call(client, "GET /usuarios/{id_usuario}", "GET", f"/usuarios/{id_usuario}")
+    return id_usuario
+
+
+async def jornada_ouvinte(rec, client, cat, rng):
+    """tela_inicial/musicas/playlists.html: navegar, buscar, abrir playlist, ouvir."""
+    id_usuario = await login(rec, client, cat, rng)
+    resp = await rec.call(client, "GET /musicas", "GET", "/musicas", params={"limit": 50})
+    cursor = resp is not None and resp.headers.get("x-next-cursor")
+    if cursor:
+        await rec.call(client, "GET /musicas", "GET", "/musicas", params={"limit": 50, "cursor": cursor})
+    await rec.call(client, "GET /musicas?nome", "GET", "/musicas", params={"nome": rng.choice(PALAVRAS)})
+    await rec.call(client, "GET /musicas/genero/{genero}", "GET", f"/musicas/genero/{rng.choice(GENEROS)}")
+    await rec.call(client, "GET /usuarios/{id_usuario}/playlists/resumo", "GET",
+                   f"/usuarios/{id_usuario}/playlists/resumo")
+    if cat.playlists:
+        pid = rng.choice(cat.playlists)
+        await rec.call(client, "GET /playlists/{id_playlist}/musicas", "GET", f"/playlists/{pid}/musicas")
+    for mid in rng.sample(cat.musicas, min(3, len(cat.musicas))):
+        # o <audio> do navegador pede primeiro o início e depois pula
+        await rec.call(client, "GET /musicas/{id_musica}/stream", "GET", f"/musicas/{mid}/stream",
+                       headers={"Range": "bytes=0-16383"})
+        await rec.call(client, "GET /musicas/{id_musica}/stream", "GET", f"/musicas/{mid}/stream",
+                       headers={"Range": f"bytes={rng.randrange(len(AUDIO) // 2)}-"})
+
+
+async def jornada_artista(rec, client, cat, rng):
+    """minhas_musicas.html: enviar música, listar o álbum, editar metadados."""
+    id_usuario = await login(rec, client, cat, rng)
+    id_album = rng.choice(cat.albuns)
+    resp = await rec.call(
+        client, "POST /musicas/criar", "POST", "/musicas/criar",
+        data={
+            "nome": f"{rng.choice(PALAVRAS)} {rng.randrange(10**6)}",
+            "genero": rng.choice(GENEROS),
+            "duracao_seg": str(rng.randrange(90, 400)),
+            "id_album": str(id_album),
+            "id_usuario": str(id_usuario),
+        },
+        files={"arquivo": ("faixa.mp3", AUDIO, "audio/mpeg")},
+    )
+    await rec.call(client, "GET /albuns/{id_album}/musicas", "GET", f"/albuns/{id_album}/musicas")
+    if resp is not None and resp.status_code == 200:
+        mid = resp.json()["id_musica"]
+        cat.musicas.append(mid)
+        await rec.call(client, "PUT /musicas/{id_musica}/metadata", "PUT", f"/musicas/{mid}/metadata",
+                       data={"nome": f"{rng.choice(PALAVRAS)} (remaster)", "genero": rng.choice(GENEROS)})
+
+
+async def jornada_curador(rec, client, cat, rng):
+    """playlists.html: criar playlist, adicionar em lote, conferir, remover uma."""
+    id_usuario = await login(rec, client, cat, rng)
+    resp = await rec.call(client, "POST /playlists/{id_dono}", "POST", f"/playlists/{id_usuario}",
+                          params={"nome": f"mix {rng.randrange(10**6)}"})
+    if resp is None or resp.status_code != 200:
+        return
+    pid = resp.json()["id_playlist"]
+    cat.playlists.append(pid)
+    ids = rng.sample(cat.musicas, min(20, len(cat.musicas)))
+    await rec.call(client, "POST /playlists/{id_playlist}/musicas/bulk", "POST",
+                   f"/playlists/{pid}/musicas/bulk", json={"add": ids})
+    await rec.call(client, "GET /playlists/{id_playlist}/musicas", "GET", f"/playlists/{pid}/musicas")
+    if ids:
+        await rec.call(client, "DELETE /playlists/{id_playlist}/musicas/{id_musica}", "DELETE",
+                       f"/playlists/{pid}/musicas/{ids[0]}")
+
+
+JORNADAS = {
+    "ouvinte": (jornada_ouvinte, 0.7),
+    "artista": (jornada_artista, 0.1),
+    "curador": (jornada_curador, 0.2),
+}
+
+
+async def seed(client, cat, usuarios, musicas, rng):
+    """Cria usuários, álbuns e músicas pela própria API (fora das medições)."""
+    for i in range(usuarios):
+        email, senha = f"carga{i}-{rng.randrange(10**9)}@example.com", "senha-de-teste"
+        resp = await client.post("/register", json={"nome": f"Carga {i}", "email": email, "senha": senha})
+        resp.raise_for_status()
+        uid = resp.json()["id_usuario"]
+        cat.usuarios.append((uid, email, senha))
+        resp = await client.post("/albuns", params={"titulo": f"Álbum {i}", "ano": 2000 + i % 25, "id_usuario": uid})
+        resp.raise_for_status()
+        cat.albuns.append(resp.json()["id_album"])
+    for i in range(musicas):
+        uid = cat.usuarios[i % len(cat.usuarios)][0]
+        resp = await client.post(
+            "/musicas/criar",
+            data={
+                "nome": f"{PALAVRAS[i % len(PALAVRAS)]} {i}",
+                "genero": GENEROS[i % len(GENEROS)],
+                "duracao_seg": str(120 + i % 300),
+                "id_album": str(cat.albuns[i % len(cat.albuns)]),
+                "id_usuario": str(uid),
+            },
+            files={"arquivo": (f"{i}.mp3", AUDIO, "audio/mpeg")},
+        )
+        resp.raise_for_status()
+        cat.musicas.append(resp.json()["id_musica"])
+    for uid, _, _ in cat.usuarios[: max(1, usuarios // 2)]:
+        resp = await client.post(f"/playlists/{uid}", params={"nome": "favoritas"})
+        resp.raise_for_status()
+        pid = resp.json()["id_playlist"]
+        cat.playlists.append(pid)
+        await client.post(f"/playlists/{pid}/musicas/bulk", json={"add": rng.sample(cat.musicas, min(30, len(cat.musicas)))})
+
+
+async def virtual_user(n, rec, client, cat, deadline, seed_value):
+    rng = random.Random(seed_value * 1000 + n)
+    nomes = list(JORNADAS)
+    pesos = [JORNADAS[j][1] for j in nomes]
+    jornadas = defaultdict(int)
+    while time.monotonic() < deadline:
+        nome = rng.choices(nomes, pesos)[0]
+        await JORNADAS[nome][0](rec, client, cat, rng)
+        jornadas[nome] += 1
+    return jornadas
+
+
+# Transportes --------------------------------------------------------------------
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class SocketServer:
+    """uvicorn numa thread, ouvindo numa porta local livre."""
+
+    def __init__(self, app):
+        import uvicorn
+
+        self.port = _free_port()
+        config = uvicorn.Config(app, host="127.0.0.1", port=self.port, log_level="warning", lifespan="on")
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return f"http://127.0.0.1:{self.port}"
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join(10)
+
+
+def make_client(app, transport, base_url, users):
+    import httpx
+
+    limits = httpx.Limits(max_connections=users, max_keepalive_connections=users)
+    if transport == "asgi":
+        return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://loadtest", timeout=60)
+    return httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60)
+
+
+async def run_load(app, args, base_url):
+    rec = Recorder()
+    cat = Catalogo()
+    rng = random.Random(args.seed)
+    async with make_client(app, args.transport, base_url, args.users) as client:
+        await seed(client, cat, args.seed_users, args.seed_songs, rng)
+        t0 = time.monotonic()
+        deadline = t0 + args.duration
+        por_usuario = await asyncio.gather(*(
+            virtual_user(n, rec, client, cat, deadline, args.seed) for n in range(args.users)
+        ))
+        elapsed = time.monotonic() - t0
+    jornadas = defaultdict(int)
+    for contagem in por_usuario:
+        for nome, n in contagem.items():
+            jornadas[nome] += n
+    result = rec.summary(elapsed)
+    result["journeys"] = dict(jornadas)
+    result["elapsed_s"] = round(elapsed, 3)
+    return result
+
+
+def _git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND, capture_output=True, text=True)
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def cmd_run(args):
+    # o modo do banco é lido no import de `database`, então o ambiente vem antes
+    os.environ["USE_MEMORY_DB"] = "1" if args.db == "memory" else "0"
+    os.environ.setdefault("APP_MEDIA_DIR", tempfile.mkdtemp(prefix="loadtest-media-"))
+    sys.path.insert(0, str(BACKEND))
+    from main import app
+
+    if args.transport == "socket":
+        with SocketServer(app) as base_url:
+            result = asyncio.run(run_load(app, args, base_url))
+    else:
+        result = asyncio.run(run_load(app, args, None))
+
+    commit = _git_commit()
+    result["meta"] = {
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "transport": args.transport,
+        "db": args.db,
+        "users": args.users,
+        "duration_s": args.duration,
+        "seed": args.seed,
+        "seed_users": args.seed_users,
+        "seed_songs": args.seed_songs,
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+    }
+
+    out = Path(args.out) if args.out else RESULTS_DIR / f"{commit or 'local'}-{args.transport}-{args.db}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(result, indent=2, ensure_ascii=False))
+
+    print_table(result)
+    print(f"\nresultado salvo em {out}")
+
+
+def print_table(result):
+    print(f"{'rota':<52} {'req':>7} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8}  status")
+    for route, r in result["routes"].items():
+        lat = r["latency_ms"]
+        fmt = lambda v: f"{v:8.1f}" if v is not None else f"{'-':>8}"  # noqa: E731
+        status = " ".join(f"{k}:{v}" for k, v in sorted(r["statuses"].items()))
+        print(f"{route:<52} {r['requests']:>7} {r['throughput_rps']:>8.1f} "
+              f"{fmt(lat['p50'])} {fmt(lat['p95'])} {fmt(lat['p99'])}  {status}")
+    t = result["total"]
+    print(f"{'TOTAL':<52} {t['requests']:>7} {t['throughput_rps']:>8.1f} "
+          f"{t['latency_ms']['p50'] or 0:8.1f} {t['latency_ms']['p95'] or 0:8.1f} {t['latency_ms']['p99'] or 0:8.1f}")
+
+
+def cmd_compare(args):
+    antes = json.loads(Path(args.antes).read_text())
+    depois = json.loads(Path(args.depois).read_text())
+    print(f"{'rota':<52} {'p95 antes':>10} {'p95 depois':>11} {'Δ%':>7} {'req/s Δ%':>9}")
+    regressoes = 0
+    for route in sorted(set(antes["routes"]) | set(depois["routes"])):
+        a, d = antes["routes"].get(route), depois["routes"].get(route)
+        if not a or not d or a["latency_ms"]["p95"] is None or d["latency_ms"]["p95"] is None:
+            print(f"{route:<52} {'(só em um dos dois)':>30}")
+            continue
+        pa, pd = a["latency_ms"]["p95"], d["latency_ms"]["p95"]
+        delta = (pd - pa) / pa * 100 if pa else 0.0
+        rps = (d["throughput_rps"] - a["throughput_rps"]) / a["throughput_rps"] * 100 if a["throughput_rps"] else 0.0
+        marca = ""
+        if delta > args.threshold:
+            marca = "  <- regressão"
+            regressoes += 1
+        print(f"{route:<52} {pa:>10.1f} {pd:>11.1f} {delta:>+7.1f} {rps:>+9.1f}{marca}")
+    return 1 if regressoes and args.fail_on_regression else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Teste de carga com as jornadas do front-end")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    run = sub.add_parser("run", help="executa o teste e salva o JSON")
+    run.add_argument("--transport", choices=("asgi", "socket"), default="asgi")
+    run.add_argument("--db", choices=("memory", "postgres"), default="memory")
+    run.add_argument("--users", type=int, default=20, help="usuários virtuais simultâneos")
+    run.add_argument("--duration", type=float, default=15, help="segundos de carga")
+    run.add_argument("--seed", type=int, default=42)
+    run.add_argument("--seed-users", type=int, default=10)
+    run.add_argument("--seed-songs", type=int, default=200)
+    run.add_argument("--out", help=f"arquivo de saída (padrão: {RESULTS_DIR.name}/<commit>-<transporte>-<db>.json)")
+
+    cmp_ = sub.add_parser("compare", help="compara dois resultados (p95 e vazão por rota)")
+    cmp_.add_argument("antes")
+    cmp_.add_argument("depois")
+    cmp_.add_argument("--threshold", type=float, default=10.0, help="piora de p95 (%%) considerada regressão")
+    cmp_.add_argument("--fail-on-regression", action="store_true", help="sai com código 1 se houver regressão")
+
+    args = parser.parse_args(argv)
+    if args.cmd == "run":
+        cmd_run(args)
+        return 0
+    return cmd_compare(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
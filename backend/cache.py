@@ -0,0 +1,257 @@
+"""
+Cache de leituras do catálogo com invalidação pelas escritas.
+
+Cada entrada guarda o resultado já pronto para serializar, o cursor da
+próxima página e uma ETag calculada uma única vez, e é marcada com tags de
+entidade (`album:3`, `genero:Rock`, `playlist:7`, `musica:42`, ...). Os
+caminhos de escrita chamam `invalidate(...)` com as tags que afetaram, e
+só as entradas marcadas com elas caem.
+
+Backend padrão: LRU em processo com TTL. Com `CACHE_REDIS_URL` (e o pacote
+`redis` instalado) o cache passa a ser compartilhado entre workers; a
+invalidação por tag usa contadores de versão no próprio Redis.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+
+from fastapi import Request, Response
+
+from database import USE_MEMORY_DB
+from fast_json import dumps
+from media import etag_matches
+from pagination import Page, set_next_link
+
+try:
+    import redis
+except ImportError:  # noqa: W0705 - cache compartilhado é opcional
+    redis = None
+
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "1") != "0"
+CACHE_TTL = float(os.getenv("CACHE_TTL", "30"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "2048"))
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL")
+
+
+class CacheEntry(NamedTuple):
+    value: object
+    next_cursor: str | None
+    etag: str
+    body: bytes  # JSON já serializado: um acerto no cache não codifica nada
+
+
+def make_entry(value) -> CacheEntry:
+    next_cursor = getattr(value, "next_cursor", None)
+    if USE_MEMORY_DB and isinstance(value, list):
+        # cópia: as linhas do MemoryDB são os próprios dicts da "tabela"
+        value = [dict(r) if isinstance(r, dict) else r for r in value]
+    body = dumps(value)
+    digest = hashlib.sha1(body)
+    digest.update((next_cursor or "").encode())
+    return CacheEntry(value, next_cursor, '"' + digest.hexdigest() + '"', body)
+
+
+class LocalCache:
+    """LRU com TTL e índice tag -> chaves, seguro entre threads."""
+
+    def __init__(self, maxsize=CACHE_MAX_ENTRIES, ttl=CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (entry, expira_em, tags)
+        self._tags = {}
+        self._lock = threading.Lock()
+        # muda a cada invalidação; uma leitura que começou antes não é guardada
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _drop(self, key):
+        _, _, tags = self._data.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[1] < time.monotonic():
+                if item is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def set(self, key, entry: CacheEntry, tags, generation=None):
+        tags = frozenset(tags)
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            if key in self._data:
+                self._drop(key)
+            self._data[key] = (entry, time.monotonic() + self.ttl, tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._data) > self.maxsize:
+                self._drop(next(iter(self._data)))
+
+    def invalidate(self, tags):
+        with self._lock:
+            self.generation += 1
+            for tag in tags:
+                for key in list(self._tags.get(tag, ())):
+                    self._drop(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._tags.clear()
+
+    def stats(self):
+        return {"backend": "local", "entries": len(self._data), "hits": self.hits, "misses": self.misses}
+
+
+class RedisCache:
+    """
+    Cache compartilhado: cada entrada lembra a versão das suas tags no
+    momento da escrita; `invalidate` só incrementa as versões (O(tags)), e
+    uma leitura com versão defasada conta como miss.
+
+    Como no `LocalCache`, uma geração global (incrementada por toda
+    invalidação, de qualquer worker) é lida antes do loader e conferida no
+    `set` sob WATCH: se algo foi invalidado enquanto o loader rodava, o
+    valor pode ser o antigo e não é guardado. As tags só são conhecidas
+    depois do loader, por isso a conferência é pela geração e não por elas.
+    """
+
+    def __init__(self, url, ttl=CACHE_TTL, prefix="odaw:cache:"):
+        self._r = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+        self._gen_key = f"{prefix}gen"
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def generation(self):
+        return int(self._r.get(self._gen_key) or 0)
+
+    def _versions(self, tags):
+        if not tags:
+            return []
+        return [int(v or 0) for v in self._r.mget([f"{self.prefix}tag:{t}" for t in tags])]
+
+    def get(self, key):
+        raw = self._r.get(f"{self.prefix}k:{key}")
+        if raw is not None:
+            data = json.loads(raw)
+            if data["versions"] == self._versions(data["tags"]):
+                self.hits += 1
+                body = data["body"].encode()
+                value = json.loads(body)
+                if data["page"]:
+                    value = Page(value, data["next_cursor"])
+                return CacheEntry(value, data["next_cursor"], data["etag"], body)
+        self.misses += 1
+        return None
+
+    def set(self, key, entry: CacheEntry, tags, generation=None):
+        tags = sorted(set(tags))
+        with self._r.pipeline() as pipe:
+            try:
+                # WATCH: uma invalidação entre a conferência e o SET aborta a escrita
+                pipe.watch(self._gen_key)
+                if generation is not None and int(pipe.get(self._gen_key) or 0) != generation:
+                    return
+                versions = [int(v or 0) for v in pipe.mget([f"{self.prefix}tag:{t}" for t in tags])] if tags else []
+                data = {
+                    "body": entry.body.decode(),
+                    "next_cursor": entry.next_cursor,
+                    "etag": entry.etag,
+                    "page": isinstance(entry.value, list),
+                    "tags": tags,
+                    "versions": versions,
+                }
+                pipe.multi()
+                pipe.set(f"{self.prefix}k:{key}", json.dumps(data), ex=max(1, int(self.ttl)))
+                pipe.execute()
+            except redis.WatchError:
+                return
+
+    def invalidate(self, tags):
+        pipe = self._r.pipeline()
+        for tag in tags:
+            pipe.incr(f"{self.prefix}tag:{tag}")
+        pipe.incr(self._gen_key)
+        pipe.execute()
+
+    def clear(self):
+        for key in self._r.scan_iter(f"{self.prefix}*"):
+            self._r.delete(key)
+
+    def stats(self):
+        return {"backend": "redis", "hits": self.hits, "misses": self.misses}
+
+
+if CACHE_REDIS_URL and redis is not None:
+    catalog_cache = RedisCache(CACHE_REDIS_URL)
+else:
+    catalog_cache = LocalCache()
+
+
+def invalidate(*tags):
+    tags = [t for t in tags if t]
+    if tags:
+        catalog_cache.invalidate(tags)
+
+
+def musica_tags(rows):
+    return [f"musica:{r['id_musica']}" for r in rows]
+
+
+def playlist_tags(rows):
+    return [f"playlist:{r['id_playlist']}" for r in rows]
+
+
+def cached_response(request: Request | None, response: Response | None, key, loader, tags):
+    """
+    Devolve o resultado de `loader()` passando pelo cache. `tags(valor)`
+    diz de quais entidades a entrada depende. Com a requisição em mãos
+    responde direto com o JSON guardado (ETag/Link nos headers), ou 304 se
+    o cliente já tem a versão atual; chamado sem ela devolve o valor.
+    """
+    if not CACHE_ENABLED:
+        entry = make_entry(loader())
+    else:
+        key = json.dumps(key, default=str)
+        entry = catalog_cache.get(key)
+        if entry is None:
+            generation = catalog_cache.generation
+            value = loader()
+            entry = make_entry(value)
+            catalog_cache.set(key, entry, [t for t in tags(value) if t], generation)
+
+    value = entry.value
+    if isinstance(value, list) and not isinstance(value, Page):
+        value = Page(value, entry.next_cursor)
+
+    if request is None:
+        set_next_link(request, response, value)
+        return value
+
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+    inm = request.headers.get("if-none-match")
+    if inm is not None and etag_matches(inm, entry.etag):
+        out = Response(status_code=304, headers=headers)
+    else:
+        out = Response(entry.body, media_type="application/json", headers=headers)
+    set_next_link(request, out, value)
+    return out
@@ -0,0 +1,574 @@
+"""
+Catálogo sintético em escala, carga em lote e exportação/importação NDJSON.
+
+`gerar()` produz um catálogo realista e enviesado: gêneros, donos de álbuns e
+a presença das faixas em playlists seguem uma distribuição de Zipf (poucos
+gêneros e faixas concentram quase tudo, como em produção). Tudo sai como um
+fluxo de pares (tabela, linha) em ordem de chave estrangeira — usuarios,
+albuns, musicas, playlists, musica_playlist — sem montar o catálogo em
+memória, e esse mesmo fluxo é o formato de troca:
+
+- NDJSON: uma linha `{"<tabela>": {...}}` por registro (`.gz` comprimido);
+  `linhas_do_banco()` lê do banco em uso (cursor do lado do servidor) e
+  `ler_ndjson()` devolve o fluxo de um arquivo. A exportação é só pela
+  linha de comando: o fluxo leva `senha_hash` e não sai pela API.
+- PostgreSQL: `COPY ... FROM STDIN` por tabela, numa transação, com os
+  índices secundários e o trigger de agregados desligados durante a carga
+  (recriados e recalculados uma vez no fim, em vez de uma vez por linha).
+- SQLite: `executemany` numa transação, com o mesmo tratamento de índices
+  e triggers.
+- `MemoryDB`: tabelas montadas direto e índices refeitos de uma vez por
+  `database.restaurar_memoria`; com `MEMORY_DB_DIR` o resultado vira um
+  snapshot do `memory_store`, restaurado em segundos no próximo start.
+
+Os agregados das playlists (qtd_musicas, duracao_total_seg) não viajam no
+fluxo: são derivados e recalculados no destino.
+
+    cd backend
+    python catalogo.py gerar --musicas 1000000 --playlists 200000 --faixas 50 -o catalogo.ndjson.gz
+    python catalogo.py importar catalogo.ndjson.gz --truncar
+    python catalogo.py gerar --musicas 100000 --carregar --midia media/songs
+    python catalogo.py exportar backup.ndjson.gz
+"""
+import argparse
+import gzip
+import io
+import itertools
+import json
+import os
+import random
+import sys
+import time
+from array import array
+from bisect import bisect_right
+from datetime import datetime, timezone
+from math import gcd
+from operator import itemgetter
+from pathlib import Path
+
+import database
+from database import DB_STREAM_BATCH, POSICAO_PASSO, em_lotes, memory_db, stream_query
+from fast_json import stream_json
+
+try:
+    import orjson
+except ImportError:  # noqa: W0705 - sem orjson usa o json da stdlib
+    orjson = None
+
+# colunas trocadas por tabela, em ordem de chave estrangeira (created_at e os
+# agregados ficam com o default/recálculo do destino)
+COLUNAS = {
+    "usuarios": ("id_usuario", "nome", "email", "senha_hash"),
+    "albuns": ("id_album", "titulo", "ano", "id_usuario"),
+    "musicas": ("id_musica", "nome", "genero", "duracao_seg", "id_album", "id_usuario"),
+    "playlists": ("id_playlist", "nome", "id_dono"),
+    "musica_playlist": ("id_playlist", "id_musica", "posicao"),
+}
+# tabela -> atributo da MemoryDB e contador de id
+_MEMORIA = {
+    "usuarios": ("users", "user_seq"),
+    "albuns": ("albums", "album_seq"),
+    "musicas": ("musicas", "music_seq"),
+    "playlists": ("playlists", "playlist_seq"),
+}
+
+GENEROS = [
+    "Pop", "Rock", "Sertanejo", "Funk", "MPB", "Eletrônica", "Hip-Hop", "Samba",
+    "Forró", "Indie", "Jazz", "Pagode", "Reggae", "Blues", "Clássica", "Bossa Nova",
+]
+PALAVRAS = [
+    "amor", "noite", "mar", "canção", "sol", "estrada", "saudade", "cidade", "coração",
+    "lua", "verão", "chuva", "céu", "fogo", "sonho", "tempo", "vento", "rio", "luz",
+    "segredo", "caminho", "janela", "silêncio", "estrela", "manhã", "adeus", "festa",
+]
+SENHA_PADRAO = "senha123"
+
+# ~1 s de MP3 "mudo" (frames MPEG-1 Layer III, 128 kbps, zerados) atrás de um ID3 vazio
+_MP3_MUDO = b"ID3\x03\x00\x00\x00\x00\x00\x00" + (b"\xff\xfb\x90\x64" + bytes(413)) * 38
+
+
+# Geração ----------------------------------------------------------------------
+
+class Zipf:
+    """
+    Amostra postos 0..n-1 com peso 1/(k+1)^s. Com `espalhar` o posto vira um
+    índice fixo mas espalhado (k * passo mod n), para as faixas populares não
+    serem justamente as de id baixo.
+    """
+
+    def __init__(self, n: int, s: float, rnd: random.Random, espalhar: bool = False):
+        self.n = n
+        self._cum = list(itertools.accumulate((k + 1) ** -s for k in range(n)))
+        self._rnd = rnd
+        passo = 1
+        if espalhar and n > 2:
+            passo = int(n * 0.6180339887) or 1  # razão áurea: vizinhos de posto ficam longe
+            while gcd(passo, n) != 1:
+                passo += 1
+        self._passo = passo
+
+    def __call__(self) -> int:
+        k = bisect_right(self._cum, self._rnd.random() * self._cum[-1])
+        return min(k, self.n - 1) * self._passo % self.n
+
+
+def _nome(rnd: random.Random, palavras: int) -> str:
+    return " ".join(rnd.choice(PALAVRAS) for _ in range(palavras)).capitalize()
+
+
+def gerar(usuarios=1000, albuns=5000, musicas=50000, playlists=10000, faixas=30,
+          zipf=1.1, seed=42, senha_hash=None):
+    """
+    Fluxo de (tabela, linha) de um catálogo sintético, determinístico para a
+    mesma `seed`. `faixas` é o tamanho médio das playlists (exponencial), então
+    musica_playlist tem cerca de `playlists * faixas` linhas. Todos os
+    usuários entram com a mesma `senha_hash` (padrão: hash de SENHA_PADRAO,
+    calculado uma vez só).
+    """
+    if min(usuarios, albuns, musicas) < 1:
+        raise ValueError("usuarios, albuns e musicas precisam ser >= 1")
+    rnd = random.Random(seed)
+    if senha_hash is None:
+        from hashing import hash_password
+        senha_hash = hash_password(SENHA_PADRAO)
+    ano_max = datetime.now(timezone.utc).year
+
+    for uid in range(1, usuarios + 1):
+        yield "usuarios", {"id_usuario": uid, "nome": f"Usuário {uid}",
+                           "email": f"usuario{uid}@exemplo.com", "senha_hash": senha_hash}
+
+    # poucos artistas têm muitos álbuns; cada álbum tem um gênero principal
+    dono_zipf = Zipf(usuarios, zipf, rnd, espalhar=True)
+    genero_zipf = Zipf(len(GENEROS), zipf, rnd)
+    donos = array("q", bytes(8 * albuns))
+    generos = array("B", bytes(albuns))
+    for i in range(albuns):
+        donos[i] = dono_zipf() + 1
+        generos[i] = genero_zipf()
+        yield "albuns", {"id_album": i + 1, "titulo": _nome(rnd, 2), "ano": rnd.randint(1960, ano_max),
+                         "id_usuario": donos[i]}
+
+    for mid in range(1, musicas + 1):
+        a = rnd.randrange(albuns)
+        # 85% das faixas no gênero do álbum, o resto sorteado (também Zipf)
+        genero = generos[a] if rnd.random() < 0.85 else genero_zipf()
+        duracao = min(900, max(30, int(rnd.gauss(215, 60))))
+        yield "musicas", {"id_musica": mid, "nome": _nome(rnd, rnd.randint(1, 3)), "genero": GENEROS[genero],
+                          "duracao_seg": duracao, "id_album": a + 1, "id_usuario": donos[a]}
+    del donos, generos
+
+    for pid in range(1, playlists + 1):
+        yield "playlists", {"id_playlist": pid, "nome": f"Mix {pid}", "id_dono": rnd.randint(1, usuarios)}
+
+    # faixas populares aparecem em muitas playlists (cauda longa quase nunca)
+    faixa_zipf = Zipf(musicas, zipf, rnd, espalhar=True)
+    for pid in range(1, playlists + 1):
+        tamanho = min(musicas, max(1, int(rnd.expovariate(1 / faixas)))) if faixas > 0 else 0
+        vistas = set()
+        tentativas = 4 * tamanho
+        while len(vistas) < tamanho and tentativas:
+            tentativas -= 1
+            mid = faixa_zipf() + 1
+            if mid in vistas:
+                continue
+            vistas.add(mid)
+            yield "musica_playlist", {"id_playlist": pid, "id_musica": mid,
+                                      "posicao": len(vistas) * POSICAO_PASSO}
+
+
+def gerar_midia(musicas: int, index) -> int:
+    """
+    Arquivo de áudio de mentira para as faixas 1..`musicas` no `MediaIndex`
+    `index`. Todos são hard links para um mesmo modelo (oculto, então o
+    índice o ignora): milhões de faixas não ocupam mais disco que uma.
+    """
+    index.root.mkdir(parents=True, exist_ok=True)
+    modelo = index.root / ".placeholder.mp3"
+    if not modelo.exists():
+        modelo.write_bytes(_MP3_MUDO)
+    criados = 0
+    for mid in range(1, musicas + 1):
+        destino = index.path_for(mid, ".mp3")
+        if destino.exists():
+            continue
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.link(modelo, destino)
+        except OSError:  # sistema de arquivos sem hard link
+            destino.write_bytes(_MP3_MUDO)
+        criados += 1
+    return criados
+
+
+# NDJSON ---------------------------------------------------------------------
+
+def _abrir(path, modo: str):
+    path = Path(path)
+    if path.suffix == ".gz":
+        return gzip.open(path, modo, compresslevel=3)
+    return open(path, modo)
+
+
+def _loads(linha):
+    return orjson.loads(linha) if orjson is not None else json.loads(linha)
+
+
+def ler_ndjson(path):
+    """Fluxo (tabela, linha) de um arquivo NDJSON (`.gz` ou não), linha a linha."""
+    with _abrir(path, "rb") as f:
+        for n, linha in enumerate(f, 1):
+            if not linha.strip():
+                continue
+            registro = _loads(linha)
+            if not isinstance(registro, dict) or len(registro) != 1:
+                raise ValueError(f"linha {n}: esperado {{\"<tabela>\": {{...}}}}")
+            ((tabela, row),) = registro.items()
+            if tabela not in COLUNAS:
+                raise ValueError(f"linha {n}: tabela desconhecida {tabela!r}")
+            yield tabela, row
+
+
+def em_registros(linhas, batch_size: int = DB_STREAM_BATCH):
+    """(tabela, linha) -> listas de `{"<tabela>": linha}` para `fast_json.stream_json`."""
+    it = iter(linhas)
+    while True:
+        lote = [{tabela: row} for tabela, row in itertools.islice(it, batch_size)]
+        if not lote:
+            return
+        yield lote
+
+
+def gravar_ndjson(linhas, path) -> int:
+    """Grava o fluxo em `path` (NDJSON, `.gz` comprimido); devolve o número de registros."""
+    total = 0
+    with _abrir(path, "wb") as f:
+        for lote in em_registros(linhas):
+            total += len(lote)
+            f.write(b"".join(stream_json([lote], "ndjson")))
+    return total
+
+
+def _contar(linhas, progresso):
+    for n, item in enumerate(linhas, 1):
+        if n % 1_000_000 == 0:
+            progresso(n)
+        yield item
+
+
+def linhas_do_banco(batch_size: int = DB_STREAM_BATCH):
+    """
+    O catálogo do banco em uso como fluxo (tabela, linha): no PostgreSQL e no
+    SQLite por `stream_query` (um lote em memória por vez), no modo memória
+    direto das tabelas.
+    """
+    if database.USE_MEMORY_DB:
+        for tabela, (atributo, _) in _MEMORIA.items():
+            cols = COLUNAS[tabela]
+            tabela_mem = getattr(memory_db, atributo)
+            for rows in em_lotes(tabela_mem, tabela_mem.keys(), batch_size):
+                for row in rows:
+                    yield tabela, {c: row.get(c) for c in cols}
+        for pid in sorted(tuple(memory_db.playlist_ordem)):
+            for pos, mid in memory_db.playlist_ordem.get(pid, ()):
+                yield "musica_playlist", {"id_playlist": pid, "id_musica": mid, "posicao": pos}
+        return
+
+    for tabela, cols in COLUNAS.items():
+        ordem = ", ".join(cols[:2]) if tabela == "musica_playlist" else cols[0]
+        sql = f"SELECT {', '.join(cols)} FROM {tabela} ORDER BY {ordem};"
+        for rows in stream_query(sql, None, batch_size):
+            for row in rows:
+                yield tabela, row
+
+
+# Carga ----------------------------------------------------------------------
+
+def _por_tabela(linhas):
+    """Agrupa o fluxo em (tabela, iterador de linhas) para cada trecho contíguo."""
+    for tabela, grupo in itertools.groupby(linhas, key=itemgetter(0)):
+        if tabela not in COLUNAS:
+            raise ValueError(f"tabela desconhecida {tabela!r}")
+        yield tabela, (row for _, row in grupo)
+
+
+def carregar_memoria(linhas) -> dict:
+    """
+    Substitui o conteúdo da `MemoryDB` pelo fluxo: as tabelas são montadas
+    direto e os índices refeitos uma vez (`restaurar_memoria`), sem passar
+    pelos helpers linha a linha nem pelo log. Devolve a contagem por tabela.
+    """
+    tabelas = {atributo: {} for atributo, _ in _MEMORIA.values()}
+    pids, mids, posicoes = array("q"), array("q"), array("q")
+    qtd, duracao = {}, {}
+    agora = datetime.now(timezone.utc)
+    contagem = dict.fromkeys(COLUNAS, 0)
+    for tabela, rows in _por_tabela(linhas):
+        if tabela == "musica_playlist":
+            musicas = tabelas["musicas"]
+            for row in rows:
+                pid, mid = row["id_playlist"], row["id_musica"]
+                pids.append(pid)
+                mids.append(mid)
+                posicoes.append(row["posicao"])
+                qtd[pid] = qtd.get(pid, 0) + 1
+                duracao[pid] = duracao.get(pid, 0) + (musicas[mid]["duracao_seg"] or 0)
+                contagem[tabela] += 1
+            continue
+        atributo, _ = _MEMORIA[tabela]
+        destino = tabelas[atributo]
+        cols = COLUNAS[tabela]
+        chave = cols[0]
+        for row in rows:
+            destino[row[chave]] = {c: row.get(c) for c in cols}
+            contagem[tabela] += 1
+
+    for pid, pl in tabelas["playlists"].items():
+        pl.update(qtd_musicas=qtd.get(pid, 0), duracao_total_seg=duracao.get(pid, 0), atualizada_em=agora)
+    seqs = {seq: max(tabelas[atributo], default=0) + 1 for atributo, seq in _MEMORIA.values()}
+    with memory_db.lock:
+        database.restaurar_memoria(tabelas, zip(pids, mids, posicoes), seqs)
+    return contagem
+
+
+class _LeitorCopy(io.RawIOBase):
+    """Arquivo só de leitura que produz o formato texto do COPY a partir das linhas, sob demanda."""
+
+    _ESCAPE = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+    def __init__(self, rows, cols):
+        self._rows = iter(rows)
+        self._cols = cols
+        self._buf = b""
+        self.linhas = 0
+
+    def readable(self):
+        return True
+
+    @classmethod
+    def valor(cls, v) -> str:
+        if v is None:
+            return "\\N"
+        if isinstance(v, str):
+            return v.translate(cls._ESCAPE)
+        if isinstance(v, bool):
+            return "t" if v else "f"
+        return str(v)
+
+    def _linha(self, row) -> str:
+        return "\t".join([self.valor(row.get(c)) for c in self._cols]) + "\n"
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = sys.maxsize
+        partes, n = [self._buf], len(self._buf)
+        while n < size:
+            bloco = "".join(self._linha(row) for row in itertools.islice(self._rows, 1000))
+            if not bloco:
+                break
+            self.linhas += bloco.count("\n")
+            dados = bloco.encode("utf-8")
+            partes.append(dados)
+            n += len(dados)
+        dados = b"".join(partes)
+        self._buf = dados[size:] if n > size else b""
+        return dados[:size]
+
+
+_AGREGADOS_SQL = """
+    UPDATE playlists
+    SET qtd_musicas = a.n, duracao_total_seg = a.d
+    FROM (
+        SELECT mp.id_playlist, count(*) AS n, COALESCE(sum(m.duracao_seg), 0) AS d
+        FROM musica_playlist mp JOIN musicas m ON m.id_musica = mp.id_musica
+        GROUP BY mp.id_playlist
+    ) AS a
+    WHERE playlists.id_playlist = a.id_playlist;
+"""
+
+
+def carregar_postgres(linhas, truncar: bool = False) -> dict:
+    """
+    Carrega o fluxo com `COPY FROM STDIN` (uma por tabela) numa transação.
+    Os índices que não sustentam constraints e os triggers de usuário de
+    musica_playlist (agregados) ficam fora durante a carga; depois os
+    agregados são calculados numa passada, os índices recriados e as
+    sequências ajustadas. Devolve a contagem por tabela.
+    """
+    tabelas = list(COLUNAS)
+    contagem = dict.fromkeys(COLUNAS, 0)
+    with database.get_conn() as conn:
+        cur = conn.cursor()
+        try:
+            # mais memória para recriar os índices dentro desta transação
+            cur.execute("SET LOCAL maintenance_work_mem = '512MB';")
+            if truncar:
+                cur.execute(f"TRUNCATE {', '.join(tabelas)} RESTART IDENTITY CASCADE;")
+            cur.execute(
+                """
+                SELECT indexname, indexdef FROM pg_indexes
+                WHERE schemaname = current_schema() AND tablename = ANY(%s)
+                  AND indexname NOT IN (SELECT conname FROM pg_constraint);
+                """,
+                (tabelas,),
+            )
+            indices = cur.fetchall()
+            for idx in indices:
+                cur.execute(f'DROP INDEX "{idx["indexname"]}";')
+            cur.execute("ALTER TABLE musica_playlist DISABLE TRIGGER USER;")
+
+            for tabela, rows in _por_tabela(linhas):
+                cols = COLUNAS[tabela]
+                leitor = _LeitorCopy(rows, cols)
+                cur.copy_expert(f"COPY {tabela} ({', '.join(cols)}) FROM STDIN;", leitor, size=1 << 20)
+                contagem[tabela] += leitor.linhas
+
+            cur.execute("ALTER TABLE musica_playlist ENABLE TRIGGER USER;")
+            cur.execute(_AGREGADOS_SQL)
+            for idx in indices:
+                cur.execute(idx["indexdef"] + ";")
+            for tabela, cols in COLUNAS.items():
+                if tabela != "musica_playlist":
+                    chave = cols[0]
+                    cur.execute(
+                        f"SELECT setval(pg_get_serial_sequence('{tabela}', '{chave}'), "
+                        f"COALESCE((SELECT MAX({chave}) FROM {tabela}), 0) + 1, false);"
+                    )
+            conn.commit()
+        finally:
+            cur.close()
+    return contagem
+
+
+def carregar_sqlite(linhas, path: str, truncar: bool = False) -> dict:
+    """
+    Carrega o fluxo no arquivo SQLite `path` numa transação (`executemany`
+    por tabela), com índices e triggers das tabelas do catálogo removidos
+    durante a carga e recriados no fim. Devolve a contagem por tabela.
+    """
+    import sqlite_db
+
+    raw = sqlite_db.connect(path).raw
+    tabelas = list(COLUNAS)
+    contagem = dict.fromkeys(COLUNAS, 0)
+    raw.execute("BEGIN IMMEDIATE")
+    try:
+        if truncar:
+            for tabela in reversed(tabelas):
+                raw.execute(f"DELETE FROM {tabela}")
+            raw.execute("DELETE FROM sqlite_sequence")
+        marca = ", ".join("?" * len(tabelas))
+        objetos = raw.execute(
+            f"SELECT type, name, sql FROM sqlite_master "
+            f"WHERE type IN ('index', 'trigger') AND sql IS NOT NULL AND tbl_name IN ({marca})",
+            tabelas,
+        ).fetchall()
+        for obj in objetos:
+            raw.execute(f'DROP {obj["type"].upper()} "{obj["name"]}"')
+
+        for tabela, rows in _por_tabela(linhas):
+            cols = COLUNAS[tabela]
+            valores = (tuple(row.get(c) for c in cols) for row in rows)
+            cur = raw.executemany(
+                f"INSERT INTO {tabela} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})", valores,
+            )
+            contagem[tabela] += cur.rowcount
+            cur.close()
+
+        raw.execute(_AGREGADOS_SQL)
+        for obj in objetos:
+            raw.execute(obj["sql"])
+        raw.execute("COMMIT")
+    except BaseException:
+        raw.execute("ROLLBACK")
+        raise
+    return contagem
+
+
+def carregar(linhas, truncar: bool = False, memory_dir=None) -> dict:
+    """
+    Carrega o fluxo no banco configurado (ver `database`). No modo memória,
+    com `memory_dir` (padrão: MEMORY_DB_DIR), grava também um snapshot
+    do `memory_store` para o app restaurar o catálogo ao subir.
+    """
+    if database.USE_MEMORY_DB:
+        import memory_store
+
+        memory_dir = memory_dir or memory_store.MEMORY_DB_DIR
+        store = memory_store.MemoryStore(memory_dir, snapshot_seconds=0).abrir() if memory_dir else None
+        if store is not None and not truncar and memory_db.musicas:
+            store.fechar(snapshot=False)
+            raise ValueError(f"{memory_dir} já tem um catálogo (use truncar para substituir)")
+        try:
+            contagem = carregar_memoria(linhas)
+            if store is not None:
+                # a carga não passa pelo log: sem force, um diretório que já
+                # tinha snapshot ficaria com o catálogo antigo
+                store.snapshot(force=True)
+        finally:
+            if store is not None:
+                store.fechar(snapshot=False)
+        return contagem
+    if database.USE_SQLITE:
+        return carregar_sqlite(linhas, database.SQLITE_PATH, truncar)
+    return carregar_postgres(linhas, truncar)
+
+
+# CLI ------------------------------------------------------------------------
+
+def _progresso(n):
+    print(f"  {n:,} registros...", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    g = sub.add_parser("gerar", help="gera um catálogo sintético")
+    g.add_argument("--usuarios", type=int, default=1000)
+    g.add_argument("--albuns", type=int, default=5000)
+    g.add_argument("--musicas", type=int, default=50000)
+    g.add_argument("--playlists", type=int, default=10000)
+    g.add_argument("--faixas", type=float, default=30, help="tamanho médio das playlists")
+    g.add_argument("--zipf", type=float, default=1.1, help="expoente da distribuição de Zipf")
+    g.add_argument("--seed", type=int, default=42)
+    g.add_argument("-o", "--saida", help="arquivo NDJSON (.gz comprime)")
+    g.add_argument("--carregar", action="store_true", help="carrega direto no banco configurado")
+    g.add_argument("--truncar", action="store_true", help="apaga o catálogo atual antes de carregar")
+    g.add_argument("--midia", help="pasta de músicas onde criar arquivos de áudio de mentira")
+
+    i = sub.add_parser("importar", help="carrega um NDJSON no banco configurado")
+    i.add_argument("arquivo")
+    i.add_argument("--truncar", action="store_true")
+
+    e = sub.add_parser("exportar", help="grava o catálogo do banco configurado em NDJSON")
+    e.add_argument("arquivo")
+
+    args = parser.parse_args(argv)
+    t0 = time.perf_counter()
+    if args.comando == "gerar":
+        if not args.saida and not args.carregar:
+            parser.error("use -o/--saida e/ou --carregar")
+        linhas = _contar(gerar(args.usuarios, args.albuns, args.musicas, args.playlists, args.faixas,
+                               args.zipf, args.seed), _progresso)
+        if args.saida and args.carregar:
+            gravar_ndjson(linhas, args.saida)
+            resultado = carregar(ler_ndjson(args.saida), args.truncar)
+        elif args.saida:
+            resultado = {"registros": gravar_ndjson(linhas, args.saida)}
+        else:
+            resultado = carregar(linhas, args.truncar)
+        if args.midia:
+            from media import MediaIndex
+
+            sharded = os.getenv("MEDIA_SHARDED", "0") != "0"
+            resultado["midia"] = gerar_midia(args.musicas, MediaIndex(Path(args.midia), sharded=sharded))
+    elif args.comando == "importar":
+        resultado = carregar(_contar(ler_ndjson(args.arquivo), _progresso), args.truncar)
+    else:
+        resultado = {"registros": gravar_ndjson(linhas_do_banco(), args.arquivo)}
+    resultado["segundos"] = round(time.perf_counter() - t0, 1)
+    print(json.dumps(resultado, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
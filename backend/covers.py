@@ -0,0 +1,152 @@
+"""
+Derivadas das capas de álbum: tamanhos fixos em formatos modernos.
+
+A capa original fica no `MediaIndex` de capas como sempre. As variantes
+(`thumb`, `card`, `full`) são geradas sob demanda, na primeira requisição,
+e gravadas em `COVERS_DIR/.variantes/`, com a versão do original no nome do
+arquivo: trocar a capa muda a versão, então uma variante nunca precisa ser
+invalidada e pode ser servida como `immutable`. O formato é negociado pelo
+`Accept` (AVIF > WebP > JPEG).
+
+Sem o Pillow instalado as variantes caem para o próprio original.
+"""
+import os
+import tempfile
+import threading
+from concurrent.futures import Future
+from pathlib import Path
+
+from media import MediaIndex
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:  # noqa: W0705 - sem Pillow serve só o original
+    Image = None
+
+# maior lado, em pixels (o dobro do tamanho exibido, para telas densas)
+SIZES = {"thumb": 128, "card": 512, "full": 1600}
+
+FORMATS = {
+    "avif": ("image/avif", {"quality": 50}),
+    "webp": ("image/webp", {"quality": 80, "method": 4}),
+    "jpeg": ("image/jpeg", {"quality": 85, "optimize": True, "progressive": True}),
+}
+
+VARIANTS_DIRNAME = ".variantes"  # começa com "." para o MediaIndex ignorar
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+def _supported_formats():
+    if Image is None:
+        return set()
+    found = {"jpeg"}
+    for fmt in ("webp", "avif"):
+        if features.check(fmt):
+            found.add(fmt)
+    return found
+
+
+SUPPORTED_FORMATS = _supported_formats()
+
+
+def negotiate_format(accept: str | None) -> str:
+    """Escolhe o formato da variante a partir do header Accept."""
+    accept = (accept or "").lower()
+    for fmt in ("avif", "webp"):
+        if fmt in SUPPORTED_FORMATS and FORMATS[fmt][0] in accept:
+            return fmt
+    return "jpeg"
+
+
+def source_version(entry) -> str:
+    return f"{entry.stat.st_mtime_ns:x}{entry.size:x}"
+
+
+def _render(origem: Path, destino: Path, size: int, fmt: str):
+    with Image.open(origem) as img:
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((size, size), Image.LANCZOS)
+        if fmt == "jpeg" and img.mode not in ("RGB", "L"):
+            # JPEG não tem transparência: achata sobre fundo branco
+            fundo = Image.new("RGB", img.size, "white")
+            fundo.paste(img, mask=img.convert("RGBA").getchannel("A"))
+            img = fundo
+        elif img.mode not in ("RGB", "RGBA", "L"):
+            img = img.convert("RGBA")
+        fd, tmp = tempfile.mkstemp(dir=destino.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                img.save(f, format=fmt.upper(), **FORMATS[fmt][1])
+            os.replace(tmp, destino)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+
+
+class CoverVariants:
+    """Gera, guarda e localiza as variantes das capas de um `MediaIndex`."""
+
+    def __init__(self, index: MediaIndex):
+        self.index = index
+        self.root = index.root / VARIANTS_DIRNAME
+        self._lock = threading.Lock()
+        self._inflight = {}  # caminho -> Future (gerações em andamento)
+
+    def _dir(self, media_id: int) -> Path:
+        digits = f"{media_id:04d}"
+        return self.root / digits[-2:]
+
+    def path_for(self, media_id: int, version: str, size: str, fmt: str) -> Path:
+        return self._dir(media_id) / f"{media_id}-{version}-{size}.{fmt}"
+
+    def get(self, media_id: int, size: str, fmt: str):
+        """
+        Devolve `(caminho, mime, versão)` da variante, gerando-a se preciso,
+        ou None se o álbum não tem capa. Gerações simultâneas da mesma
+        variante viram uma só: quem chega depois espera o resultado.
+        """
+        entry = self.index.get(media_id)
+        if entry is None:
+            return None
+        version = source_version(entry)
+        if Image is None or fmt not in SUPPORTED_FORMATS:
+            return entry.path, entry.mime, version
+
+        destino = self.path_for(media_id, version, size, fmt)
+        if destino.exists():
+            return destino, FORMATS[fmt][0], version
+
+        with self._lock:
+            future = self._inflight.get(destino)
+            leader = future is None
+            if leader:
+                future = self._inflight[destino] = Future()
+
+        if leader:
+            try:
+                destino.parent.mkdir(parents=True, exist_ok=True)
+                _render(entry.path, destino, SIZES[size], fmt)
+                future.set_result(destino)
+            except BaseException as exc:
+                future.set_exception(exc)
+            finally:
+                with self._lock:
+                    self._inflight.pop(destino, None)
+        try:
+            future.result()
+        except OSError:
+            # original que o Pillow não consegue ler: serve ele mesmo
+            return entry.path, entry.mime, version
+        return destino, FORMATS[fmt][0], version
+
+    def purge(self, media_id: int):
+        """Apaga as variantes de um id (capa trocada ou álbum removido)."""
+        pasta = self._dir(media_id)
+        if not pasta.is_dir():
+            return 0
+        removed = 0
+        for path in pasta.glob(f"{media_id}-*"):
+            path.unlink(missing_ok=True)
+            removed += 1
+        return removed
@@ -2,53 +2,173 @@ from database import (
     get_conn,
     USE_MEMORY_DB,
     create_album as mem_create_album,
+    listar_albuns as mem_listar_albuns,
+    memory_db,
+    rows_to_dicts,
     renomear_album as mem_renomear_album,
 )
+from cache import invalidate
+from pagination import clamp_limit, decode_cursor, make_page
+from search import like_escape
 
 
+# invalidação só depois do commit (veja crud/playlists.py)
+
 def criar_album(titulo, ano, id_usuario):
     if USE_MEMORY_DB:
         row = mem_create_album(titulo, ano, id_usuario)
+        invalidate("albuns")
         return {"id_album": row["id_album"], "titulo": row["titulo"], "ano": ano, "id_usuario": id_usuario}
 
-    conn = get_conn()
-    cur = conn.cursor()
-
-    cur.execute(
-        """
-        INSERT INTO albuns (titulo, ano, id_usuario)
-        VALUES (%s, %s, %s)
-        RETURNING id_album, titulo;
-    """,
-        (titulo, ano, id_usuario),
-    )
-
-    row = cur.fetchone()
-    conn.commit()
-    cur.close()
-    conn.close()
+    with get_conn() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute(
+                """
+                INSERT INTO albuns (titulo, ano, id_usuario)
+                VALUES (%s, %s, %s)
+                RETURNING id_album, titulo;
+            """,
+                (titulo, ano, id_usuario),
+            )
+            row = cur.fetchone()
+            conn.commit()
+        finally:
+            cur.close()
+    invalidate("albuns")
     return dict(row) if row else None
 
 
 def atualizar_titulo_album(id_album: int, titulo: str):
     if USE_MEMORY_DB:
-        return mem_renomear_album(id_album, titulo)
-
-    conn = get_conn()
-    cur = conn.cursor()
-    try:
-        cur.execute(
-            """
-            UPDATE albuns
-            SET titulo=%s
-            WHERE id_album=%s
-            RETURNING id_album;
-            """,
-            (titulo, id_album),
-        )
-        row = cur.fetchone()
-        conn.commit()
-        return bool(row)
-    finally:
-        cur.close()
-        conn.close()
+        ok = mem_renomear_album(id_album, titulo)
+        invalidate(f"album:{id_album}")
+        return ok
+
+    with get_conn() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute(
+                """
+                UPDATE albuns
+                SET titulo=%s
+                WHERE id_album=%s
+                RETURNING id_album;
+                """,
+                (titulo, id_album),
+            )
+            row = cur.fetchone()
+            conn.commit()
+        finally:
+            cur.close()
+    invalidate(f"album:{id_album}")
+    return bool(row)
+
+
+def albuns_por_ids(ids):
+    """{id_album: álbum} para vários ids numa consulta só; ids ausentes não aparecem."""
+    ids = list(ids)
+    if not ids:
+        return {}
+    if USE_MEMORY_DB:
+        albums = (memory_db.albums.get(i) for i in ids)
+        return {a["id_album"]: a for a in albums if a is not None}
+
+    with get_conn() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute(
+                "SELECT id_album, titulo, ano, id_usuario FROM albuns WHERE id_album = ANY(%s);",
+                (ids,),
+            )
+            rows = rows_to_dicts(cur.fetchall())
+        finally:
+            cur.close()
+    return {r["id_album"]: r for r in rows}
+
+
+def _com_contagem(album):
+    return {**album, "qtd_musicas": len(memory_db.musicas_by_album.get(album["id_album"], ()))}
+
+
+def listar_albuns(
+    id_usuario: int | None = None,
+    ano_min: int | None = None,
+    ano_max: int | None = None,
+    titulo: str | None = None,
+    limit: int | None = None,
+    cursor: str | None = None,
+):
+    """
+    Álbuns paginados por id, filtrando por dono, faixa de ano e prefixo do
+    título (sem diferenciar maiúsculas), cada um com `qtd_musicas`.
+    """
+    limit = clamp_limit(limit)
+    after = decode_cursor(cursor)
+    after = after[0] if after else None
+    if USE_MEMORY_DB:
+        rows = mem_listar_albuns(id_usuario, ano_min, ano_max, titulo, after, limit + 1)
+        return make_page([_com_contagem(a) for a in rows], limit, lambda r: (r["id_album"],))
+
+    clauses, params = [], []
+    if id_usuario is not None:
+        clauses.append("a.id_usuario = %s")
+        params.append(id_usuario)
+    if ano_min is not None:
+        clauses.append("a.ano >= %s")
+        params.append(ano_min)
+    if ano_max is not None:
+        clauses.append("a.ano <= %s")
+        params.append(ano_max)
+    if titulo:
+        # usa idx_albuns_titulo (text_pattern_ops)
+        clauses.append("lower(a.titulo) LIKE %s")
+        params.append(f"{like_escape(titulo.lower())}%")
+    if after is not None:
+        clauses.append("a.id_album > %s")
+        params.append(after)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+    with get_conn() as conn:
+        cur = conn.cursor()
+        try:
+            # contagem por álbum: varredura só do índice idx_musicas_album
+            cur.execute(
+                f"""
+                SELECT a.id_album, a.titulo, a.ano, a.id_usuario, a.created_at,
+                       (SELECT count(*) FROM musicas m WHERE m.id_album = a.id_album) AS qtd_musicas
+                FROM albuns a
+                {where}
+                ORDER BY a.id_album
+                LIMIT %s;
+                """,
+                (*params, limit + 1),
+            )
+            rows = rows_to_dicts(cur.fetchall())
+        finally:
+            cur.close()
+    return make_page(rows, limit, lambda r: (r["id_album"],))
+
+
+def buscar_albuns(ids: list[int]):
+    """Vários álbuns (com `qtd_musicas`) numa consulta, na ordem de `ids`; ausentes são omitidos."""
+    if USE_MEMORY_DB:
+        albums = (memory_db.albums.get(i) for i in ids)
+        return [_com_contagem(album) for album in albums if album is not None]
+
+    with get_conn() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute(
+                """
+                SELECT a.id_album, a.titulo, a.ano, a.id_usuario, a.created_at,
+                       (SELECT count(*) FROM musicas m WHERE m.id_album = a.id_album) AS qtd_musicas
+                FROM albuns a
+                WHERE a.id_album = ANY(%s);
+                """,
+                (ids,),
+            )
+            por_id = {r["id_album"]: r for r in rows_to_dicts(cur.fetchall())}
+        finally:
+            cur.close()
+    return [por_id[i] for i in ids if i in por_id]
@@ -1,69 +1,237 @@
 from database import (
+    DB_STREAM_BATCH,
+    em_lotes,
     get_conn,
+    stream_query,
     USE_MEMORY_DB,
+    USE_SQLITE,
     listar_musicas as mem_listar,
+    buscar_musicas as mem_buscar,
     listar_por_genero as mem_listar_genero,
     listar_por_artista as mem_listar_artista,
+    musicas_por_album as mem_musicas_album,
+    memory_db,
     rows_to_dicts,
 )
+from includes import projetar, select_list
+from pagination import clamp_limit, decode_cursor, make_page
+from search import WORD_SIMILARITY_THRESHOLD, fold, like_escape
 
 
-def listar_musicas(nome: str | None = None, id_album: int | None = None):
+def _por_id(row):
+    return (row["id_musica"],)
+
+
+def _pagina_mem(rows, limit, campos):
+    page = make_page(rows, limit, _por_id)
+    page[:] = projetar(page, campos)
+    return page
+
+
+def _pagina_simples(where: str, params: tuple, limit, cursor, campos=None):
+    """SELECT paginado por id_musica (keyset) com um filtro de igualdade opcional."""
+    limit = clamp_limit(limit)
+    after = decode_cursor(cursor)
+    clauses = [where] if where else []
+    if after is not None:
+        clauses.append("id_musica > %s")
+        params += after
+    sql = f"SELECT {select_list(campos)} FROM musicas"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY id_musica LIMIT %s;"
+
+    with get_conn() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute(sql, params + (limit + 1,))
+            rows = cur.fetchall()
+        finally:
+            cur.close()
+    return make_page(rows_to_dicts(rows), limit, _por_id)
+
+
+def _buscar_pg(nome: str, id_album, limit, cursor, campos=None):
+    limit = clamp_limit(limit)
+    after = decode_cursor(cursor, size=3)
+    termo = fold(nome)
+    params = {
+        "q": termo,
+        "prefix": f"{like_escape(termo)}%",
+        "sub": f"%{like_escape(termo)}%",
+        "limit": limit + 1,
+    }
+    if USE_SQLITE:
+        # sem pg_trgm: f_unaccent/word_similarity são funções Python da conexão
+        params["limiar"] = WORD_SIMILARITY_THRESHOLD
+        where = "(lower(f_unaccent(m.nome)) LIKE %(sub)s OR word_similarity(%(q)s, m.nome) >= %(limiar)s)"
+    else:
+        # f_unaccent + índice GIN gin_trgm_ops (db/setup.sql): LIKE e <% usam o índice
+        where = "(lower(f_unaccent(m.nome)) LIKE %(sub)s OR %(q)s <%% lower(f_unaccent(m.nome)))"
+    if id_album is not None:
+        where += " AND m.id_album = %(id_album)s"
+        params["id_album"] = id_album
+    keyset = ""
+    if after is not None:
+        keyset = "WHERE (r._tier, r._neg_sim, r.id_musica) > (%(t)s, %(s)s, %(id)s)"
+        params.update(t=after[0], s=after[1], id=after[2])
+
+    tier = """CASE WHEN lower(f_unaccent(m.nome)) = %(q)s THEN 0
+                            WHEN lower(f_unaccent(m.nome)) LIKE %(prefix)s THEN 1
+                            WHEN lower(f_unaccent(m.nome)) LIKE %(sub)s THEN 2
+                            ELSE 3 END"""
+    if USE_SQLITE:
+        # sem LATERAL: a expressão do tier se repete (f_unaccent é determinística)
+        rank = f"""{tier} AS _tier,
+                   CASE WHEN {tier} < 3 THEN -1.0
+                        ELSE -word_similarity(%(q)s, m.nome) END AS _neg_sim
+            FROM musicas m"""
+    else:
+        rank = f"""x._tier,
+                   CASE WHEN x._tier < 3 THEN -1.0
+                        ELSE -word_similarity(%(q)s, x.n) END AS _neg_sim
+            FROM musicas m
+            CROSS JOIN LATERAL (
+                SELECT lower(f_unaccent(m.nome)) AS n,
+                       {tier} AS _tier
+            ) x"""
+    sql = f"""
+        SELECT * FROM (
+            SELECT {select_list(campos, "m")}, {rank}
+            WHERE {where}
+        ) r
+        {keyset}
+        ORDER BY r._tier, r._neg_sim, r.id_musica
+        LIMIT %(limit)s;
+    """
+    with get_conn() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute(sql, params)
+            rows = rows_to_dicts(cur.fetchall())
+        finally:
+            cur.close()
+
+    page = make_page(rows, limit, lambda r: (r["_tier"], float(r["_neg_sim"]), r["id_musica"]))
+    for r in page:
+        del r["_tier"], r["_neg_sim"]
+    return page
+
+
+def listar_musicas(
+    nome: str | None = None,
+    id_album: int | None = None,
+    limit: int | None = None,
+    cursor: str | None = None,
+    campos=None,
+):
+    """
+    Lista músicas, opcionalmente filtrando por álbum e buscando por nome.
+    A busca ignora acentos/maiúsculas, tolera erros de digitação e ordena
+    por relevância (nome igual > prefixo > substring > parecido); sem busca
+    a ordem é por id. Devolve uma `Page` (paginação por cursor); `campos`
+    limita as colunas (ver `includes.parse_fields`).
+    """
     if USE_MEMORY_DB:
-        rows = mem_listar()
+        n = clamp_limit(limit)
         if nome:
-            rows = [
-                r for r in rows
-                if nome.lower() in (r.get("nome") or "").lower()
-            ]
+            after = decode_cursor(cursor, size=3)
+            if id_album is None:
+                hits = mem_buscar(nome, after, n + 1)
+            else:
+                hits = [h for h in mem_buscar(nome, after) if h[1]["id_album"] == id_album][:n + 1]
+            page = make_page(hits, n, lambda hit: hit[0])
+            page[:] = projetar([row for _, row in page], campos)
+            return page
+        after = decode_cursor(cursor)
+        after = after[0] if after else None
         if id_album is not None:
-            rows = [r for r in rows if r.get("id_album") == id_album]
-        return rows
-
-    conn = get_conn()
-    cur = conn.cursor()
-    try:
-        clauses = []
-        params = []
-        if nome:
-            clauses.append("LOWER(nome) LIKE %s")
-            params.append(f"%{nome.lower()}%")
-        if id_album is not None:
-            clauses.append("id_album = %s")
-            params.append(id_album)
+            rows = mem_musicas_album(id_album, after, n + 1)
+        else:
+            rows = mem_listar(after, n + 1)
+        return _pagina_mem(rows, n, campos)
 
-        sql = "SELECT * FROM musicas"
-        if clauses:
-            sql += " WHERE " + " AND ".join(clauses)
-        cur.execute(sql, tuple(params))
-        rows = cur.fetchall()
-        return rows_to_dicts(rows)
-    finally:
-        cur.close()
-        conn.close()
+    if nome:
+        return _buscar_pg(nome, id_album, limit, cursor, campos)
+    if id_album is not None:
+        return _pagina_simples("id_album = %s", (id_album,), limit, cursor, campos)
+    return _pagina_simples("", (), limit, cursor, campos)
 
 
-def listar_por_genero(genero):
+def listar_por_genero(genero, limit: int | None = None, cursor: str | None = None, campos=None):
     if USE_MEMORY_DB:
-        return mem_listar_genero(genero)
+        n = clamp_limit(limit)
+        after = decode_cursor(cursor)
+        rows = mem_listar_genero(genero, after[0] if after else None, n + 1)
+        return _pagina_mem(rows, n, campos)
 
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM musicas WHERE genero=%s;", (genero,))
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
-    return rows_to_dicts(rows)
+    return _pagina_simples("genero = %s", (genero,), limit, cursor, campos)
 
 
-def listar_por_artista(id_usuario):
+def listar_por_artista(id_usuario, limit: int | None = None, cursor: str | None = None, campos=None):
     if USE_MEMORY_DB:
-        return mem_listar_artista(id_usuario)
-
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM musicas WHERE id_usuario=%s;", (id_usuario,))
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
-    return rows_to_dicts(rows)
+        n = clamp_limit(limit)
+        after = decode_cursor(cursor)
+        rows = mem_listar_artista(id_usuario, after[0] if after else None, n + 1)
+        return _pagina_mem(rows, n, campos)
+
+    return _pagina_simples("id_usuario = %s", (id_usuario,), limit, cursor, campos)
+
+
+def listar_musicas_do_album(id_album, limit: int | None = None, cursor: str | None = None, campos=None):
+    if USE_MEMORY_DB:
+        n = clamp_limit(limit)
+        after = decode_cursor(cursor)
+        rows = mem_musicas_album(id_album, after[0] if after else None, n + 1)
+        return _pagina_mem(rows, n, campos)
+
+    return _pagina_simples("id_album = %s", (id_album,), limit, cursor, campos)
+
+
+def exportar_musicas(genero=None, id_album=None, campos=None, batch_size: int = DB_STREAM_BATCH):
+    """
+    Todas as músicas (de um gênero e/ou álbum, se pedidos) em ordem de id,
+    em lotes de até `batch_size`, sem paginação nem a lista inteira em
+    memória: no banco, por um cursor do lado do servidor (`stream_query`).
+    """
+    if USE_MEMORY_DB:
+        if id_album is not None:
+            ids = memory_db.musicas_by_album.get(id_album, ())
+        elif genero is not None:
+            ids = memory_db.musicas_by_genero.get(genero, ())
+        else:
+            ids = memory_db.musicas.keys()
+        for rows in em_lotes(memory_db.musicas, ids, batch_size):
+            if genero is not None and id_album is not None:
+                rows = [row for row in rows if row["genero"] == genero]
+            if rows:
+                yield projetar(rows, campos)
+        return
+
+    clauses, params = [], []
+    if genero is not None:
+        clauses.append("genero = %s")
+        params.append(genero)
+    if id_album is not None:
+        clauses.append("id_album = %s")
+        params.append(id_album)
+    sql = f"SELECT {select_list(campos)} FROM musicas"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    yield from stream_query(sql + " ORDER BY id_musica;", tuple(params), batch_size)
+
+
+def buscar_musicas_por_ids(ids: list[int], campos=None):
+    """Várias músicas numa consulta (`= ANY`), na ordem de `ids`; ausentes são omitidas."""
+    if USE_MEMORY_DB:
+        musicas = (memory_db.musicas.get(i) for i in ids)
+        return projetar([m for m in musicas if m is not None], campos)
+
+    with get_conn() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute(f"SELECT {select_list(campos)} FROM musicas WHERE id_musica = ANY(%s);", (ids,))
+            por_id = {r["id_musica"]: r for r in rows_to_dicts(cur.fetchall())}
+        finally:
+            cur.close()
+    return [por_id[i] for i in ids if i in por_id]
@@ -1,102 +1,435 @@
+import json
+
 from database import (
+    albuns_da_playlist,
     get_conn,
     USE_MEMORY_DB,
+    USE_SQLITE,
+    POSICAO_PASSO,
+    posicao_entre,
     create_playlist as mem_create_playlist,
     add_musica_playlist as mem_add,
-    musicas_da_playlist,
+    add_musicas_playlist as mem_add_lote,
+    remove_musicas_playlist as mem_remove_lote,
+    memory_db,
+    mover_musica_playlist as mem_mover,
+    faixas_da_playlist,
+    playlists_by_user,
     renomear_playlist as mem_renomear,
     rows_to_dicts,
 )
+from cache import invalidate
+from includes import projetar, select_list
+from pagination import clamp_limit, decode_cursor, make_page
+
+# resumo: álbuns distintos (até ALBUNS_RESUMO) das primeiras ALBUNS_AMOSTRA faixas
+ALBUNS_RESUMO = 4
+ALBUNS_AMOSTRA = 20
 
 
+# As escritas invalidam o cache só depois do commit: uma leitura entre a
+# invalidação e o commit recarregaria a linha antiga e a guardaria como atual.
+
 def criar_playlist(nome, id_dono):
     if USE_MEMORY_DB:
         row = mem_create_playlist(nome, id_dono)
+        invalidate(f"usuario:{id_dono}:playlists")
         return {"id_playlist": row["id_playlist"], "nome": row["nome"], "id_dono": id_dono}
 
-    conn = get_conn()
-    cur = conn.cursor()
-
-    cur.execute(
-        """
-        INSERT INTO playlists (nome, id_dono)
-        VALUES (%s, %s)
-        RETURNING id_playlist, nome;
-    """,
-        (nome, id_dono),
-    )
-
-    row = cur.fetchone()
-    conn.commit()
-    cur.close()
-    conn.close()
+    with get_conn() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute(
+                """
+                INSERT INTO playlists (nome, id_dono)
+                VALUES (%s, %s)
+                RETURNING id_playlist, nome;
+            """,
+                (nome, id_dono),
+            )
+            row = cur.fetchone()
+            conn.commit()
+        finally:
+            cur.close()
+    invalidate(f"usuario:{id_dono}:playlists")
     return dict(row) if row else None
 
 
 def adicionar_musica(id_playlist, id_musica):
     if USE_MEMORY_DB:
-        mem_add(id_playlist, id_musica)
+        with memory_db.lock:
+            seq = memory_db.playlist_seq
+            mem_add(id_playlist, id_musica)
+            # o MemoryDB cria a playlist na hora se ela não existe: muda a lista do dono
+            criadas = [memory_db.playlists[p] for p in range(seq, memory_db.playlist_seq) if p in memory_db.playlists]
+        invalidate(f"playlist:{id_playlist}", *(f"usuario:{p['id_dono']}:playlists" for p in criadas))
         return
 
-    conn = get_conn()
-    cur = conn.cursor()
+    with get_conn() as conn:
+        cur = conn.cursor()
+        try:
+            anexar_musica(cur, id_playlist, id_musica)
+            conn.commit()
+        finally:
+            cur.close()
+    invalidate(f"playlist:{id_playlist}")
 
+
+def anexar_musica(cur, id_playlist, id_musica):
+    """Insere a faixa no fim da playlist (usa a transação do cursor)."""
+    # trava a playlist: dois inserts concorrentes não pegam a mesma posição
+    cur.execute("SELECT id_playlist FROM playlists WHERE id_playlist=%s FOR UPDATE;", (id_playlist,))
     cur.execute(
         """
-        INSERT INTO musica_playlist (id_playlist, id_musica)
-        VALUES (%s, %s)
-    """,
-        (id_playlist, id_musica),
+        INSERT INTO musica_playlist (id_playlist, id_musica, posicao)
+        SELECT %s, %s, COALESCE(MAX(posicao), 0) + %s
+        FROM musica_playlist
+        WHERE id_playlist = %s;
+        """,
+        (id_playlist, id_musica, POSICAO_PASSO, id_playlist),
     )
 
-    conn.commit()
-    cur.close()
-    conn.close()
 
+def alterar_musicas_em_lote(id_playlist: int, add: list[int], remove: list[int]):
+    """
+    Adiciona e/ou remove várias músicas numa única transação (remoções
+    primeiro). Devolve o status por id ou None se a playlist não existir.
+    """
+    add = list(dict.fromkeys(add))
+    remove = list(dict.fromkeys(remove))
 
-def listar_musicas_da_playlist(id_playlist: int):
     if USE_MEMORY_DB:
-        return musicas_da_playlist(id_playlist)
+        # a trava dos escritores faz do par remover + adicionar uma operação só
+        with memory_db.lock:
+            if id_playlist not in memory_db.playlists:
+                return None
+            removed = mem_remove_lote(id_playlist, remove)
+            added = mem_add_lote(id_playlist, add)
+        invalidate(f"playlist:{id_playlist}")
+        return _resultado_lote(added, removed)
+
+    added, removed = {}, {}
+    with get_conn() as conn:
+        cur = conn.cursor()
+        try:
+            # trava a playlist para lotes concorrentes não se intercalarem
+            cur.execute("SELECT id_playlist FROM playlists WHERE id_playlist=%s FOR UPDATE;", (id_playlist,))
+            if not cur.fetchone():
+                return None
+
+            if remove:
+                cur.execute(
+                    """
+                    DELETE FROM musica_playlist
+                    WHERE id_playlist = %s AND id_musica = ANY(%s)
+                    RETURNING id_musica;
+                    """,
+                    (id_playlist, remove),
+                )
+                gone = {r["id_musica"] for r in cur.fetchall()}
+                removed = {mid: "removed" if mid in gone else "absent" for mid in remove}
+
+            if add:
+                # entram no fim, na ordem do lote
+                _inserir_lote(cur, id_playlist, add)
+                inserted = {r["id_musica"] for r in cur.fetchall()}
+                missing = set(add) - inserted
+                existing = set()
+                if missing:
+                    cur.execute("SELECT id_musica FROM musicas WHERE id_musica = ANY(%s);", (list(missing),))
+                    existing = {r["id_musica"] for r in cur.fetchall()}
+                added = {
+                    mid: "added" if mid in inserted else "exists" if mid in existing else "not_found"
+                    for mid in add
+                }
+
+            conn.commit()
+        finally:
+            cur.close()
+    invalidate(f"playlist:{id_playlist}")
+    return _resultado_lote(added, removed)
+
 
-    conn = get_conn()
-    cur = conn.cursor()
-    try:
+def _inserir_lote(cur, id_playlist, add):
+    if USE_SQLITE:
+        # json_each no lugar de unnest; o fim da playlist é lido antes porque
+        # o SQLite reavaliaria o MAX() a cada linha inserida
+        cur.execute(
+            "SELECT COALESCE(MAX(posicao), 0) AS fim FROM musica_playlist WHERE id_playlist = %s;",
+            (id_playlist,),
+        )
+        fim = cur.fetchone()["fim"]
         cur.execute(
             """
-            SELECT m.*
-            FROM musicas m
-            INNER JOIN musica_playlist mp
-              ON mp.id_musica = m.id_musica
-            WHERE mp.id_playlist = %s;
+            INSERT INTO musica_playlist (id_playlist, id_musica, posicao)
+            SELECT %s, m.id_musica, %s + (a.key + 1) * %s
+            FROM json_each(%s) AS a
+            JOIN musicas m ON m.id_musica = a.value
+            WHERE true
+            ON CONFLICT DO NOTHING
+            RETURNING id_musica;
             """,
-            (id_playlist,),
+            (id_playlist, fim, POSICAO_PASSO, add),
         )
-        rows = cur.fetchall()
-        return rows_to_dicts(rows)
-    finally:
-        cur.close()
-        conn.close()
+        return
+    cur.execute(
+        """
+        INSERT INTO musica_playlist (id_playlist, id_musica, posicao)
+        SELECT %s, m.id_musica,
+               (SELECT COALESCE(MAX(posicao), 0) FROM musica_playlist WHERE id_playlist = %s)
+               + a.ord * %s
+        FROM unnest(%s::bigint[]) WITH ORDINALITY AS a(id_musica, ord)
+        JOIN musicas m ON m.id_musica = a.id_musica
+        ON CONFLICT DO NOTHING
+        RETURNING id_musica;
+        """,
+        (id_playlist, id_playlist, POSICAO_PASSO, add),
+    )
+
+
+def _resultado_lote(added: dict, removed: dict):
+    return {
+        "add": [{"id_musica": mid, "status": st} for mid, st in added.items()],
+        "remove": [{"id_musica": mid, "status": st} for mid, st in removed.items()],
+    }
+
+
+def _chave_posicao(row):
+    return (row["posicao"], row["id_musica"])
+
+
+def listar_musicas_da_playlist(id_playlist: int, limit: int | None = None, cursor: str | None = None, campos=None):
+    """Faixas na ordem da playlist; o cursor é (posicao, id_musica)."""
+    limit = clamp_limit(limit)
+    after = decode_cursor(cursor, size=2)
+    if USE_MEMORY_DB:
+        faixas = faixas_da_playlist(id_playlist, after, limit + 1)
+        rows = [
+            {**m, "posicao": pos}
+            for (pos, _), m in zip(faixas, projetar([m for _, m in faixas], campos))
+        ]
+        return make_page(rows, limit, _chave_posicao)
+
+    pos, mid = after if after else (None, None)
+    with get_conn() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute(
+                f"""
+                SELECT {select_list(campos, "m")}, mp.posicao
+                FROM musica_playlist mp
+                INNER JOIN musicas m
+                  ON m.id_musica = mp.id_musica
+                WHERE mp.id_playlist = %s
+                  AND (%s::bigint IS NULL OR (mp.posicao, mp.id_musica) > (%s, %s))
+                ORDER BY mp.posicao, mp.id_musica
+                LIMIT %s;
+                """,
+                (id_playlist, pos, pos, mid, limit + 1),
+            )
+            rows = cur.fetchall()
+        finally:
+            cur.close()
+    return make_page(rows_to_dicts(rows), limit, _chave_posicao)
+
+
+def mover_musica(id_playlist: int, id_musica: int, antes_de: int | None = None, depois_de: int | None = None):
+    """
+    Move a faixa para antes de `antes_de` ou depois de `depois_de`. Atualiza
+    uma linha só (a posição vira o ponto médio entre as vizinhas); quando
+    não há espaço a playlist é renumerada antes. Devolve a nova posição ou
+    None se a faixa ou a referência não estão na playlist.
+    """
+    if USE_MEMORY_DB:
+        pos = mem_mover(id_playlist, id_musica, antes_de, depois_de)
+        if pos is not None:
+            invalidate(f"playlist:{id_playlist}")
+        return pos
+
+    ref = antes_de if antes_de is not None else depois_de
+    with get_conn() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute("SELECT id_playlist FROM playlists WHERE id_playlist=%s FOR UPDATE;", (id_playlist,))
+            if not cur.fetchone():
+                return None
+            cur.execute(
+                "SELECT id_musica, posicao FROM musica_playlist WHERE id_playlist=%s AND id_musica = ANY(%s);",
+                (id_playlist, [id_musica, ref]),
+            )
+            atuais = {r["id_musica"]: r["posicao"] for r in cur.fetchall()}
+            if id_musica not in atuais or ref not in atuais:
+                return None
+            if ref == id_musica:
+                return atuais[id_musica]
+
+            while True:
+                pos = _posicao_junto_de(cur, id_playlist, id_musica, ref, atuais[ref], antes=antes_de is not None)
+                if pos is not None:
+                    break
+                _rebalancear(cur, id_playlist)
+                cur.execute(
+                    "SELECT posicao FROM musica_playlist WHERE id_playlist=%s AND id_musica=%s;",
+                    (id_playlist, ref),
+                )
+                atuais[ref] = cur.fetchone()["posicao"]
+
+            cur.execute(
+                "UPDATE musica_playlist SET posicao=%s WHERE id_playlist=%s AND id_musica=%s;",
+                (pos, id_playlist, id_musica),
+            )
+            # insert/delete atualizam o resumo por trigger; a reordenação, aqui
+            cur.execute("UPDATE playlists SET atualizada_em=NOW() WHERE id_playlist=%s;", (id_playlist,))
+            conn.commit()
+        finally:
+            cur.close()
+    invalidate(f"playlist:{id_playlist}")
+    return pos
+
+
+def _posicao_junto_de(cur, id_playlist, id_musica, ref, ref_pos, antes: bool):
+    # vizinha da referência do lado pedido, ignorando a própria faixa movida
+    if antes:
+        sql = """
+            SELECT posicao FROM musica_playlist
+            WHERE id_playlist = %s AND id_musica <> %s AND (posicao, id_musica) < (%s, %s)
+            ORDER BY posicao DESC, id_musica DESC
+            LIMIT 1;
+        """
+    else:
+        sql = """
+            SELECT posicao FROM musica_playlist
+            WHERE id_playlist = %s AND id_musica <> %s AND (posicao, id_musica) > (%s, %s)
+            ORDER BY posicao, id_musica
+            LIMIT 1;
+        """
+    cur.execute(sql, (id_playlist, id_musica, ref_pos, ref))
+    row = cur.fetchone()
+    vizinha = row["posicao"] if row else None
+    return posicao_entre(vizinha, ref_pos) if antes else posicao_entre(ref_pos, vizinha)
+
+
+def _rebalancear(cur, id_playlist):
+    cur.execute(
+        """
+        UPDATE musica_playlist AS mp
+        SET posicao = r.n * %s
+        FROM (
+            SELECT id_musica, row_number() OVER (ORDER BY posicao, id_musica) AS n
+            FROM musica_playlist
+            WHERE id_playlist = %s
+        ) r
+        WHERE mp.id_playlist = %s AND mp.id_musica = r.id_musica;
+        """,
+        (POSICAO_PASSO, id_playlist, id_playlist),
+    )
+
+
+def listar_playlists_do_usuario(id_usuario: int, limit: int | None = None, cursor: str | None = None):
+    limit = clamp_limit(limit)
+    after = decode_cursor(cursor)
+    after = after[0] if after else None
+    if USE_MEMORY_DB:
+        rows = playlists_by_user(id_usuario, after, limit + 1)
+        return make_page(rows, limit, lambda r: (r["id_playlist"],))
+
+    with get_conn() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute(
+                """
+                SELECT * FROM playlists
+                WHERE id_dono = %s
+                  AND (%s::bigint IS NULL OR id_playlist > %s)
+                ORDER BY id_playlist
+                LIMIT %s;
+                """,
+                (id_usuario, after, after, limit + 1),
+            )
+            rows = cur.fetchall()
+        finally:
+            cur.close()
+    return make_page(rows_to_dicts(rows), limit, lambda r: (r["id_playlist"],))
+
+
+_ALBUNS_DAS_FAIXAS = """
+    SELECT m.id_album
+    FROM musica_playlist mp
+    JOIN musicas m ON m.id_musica = mp.id_musica
+    WHERE mp.id_playlist = p.id_playlist
+    ORDER BY mp.posicao, mp.id_musica
+    LIMIT %s
+"""
+_ALBUNS_PG = f"ARRAY({_ALBUNS_DAS_FAIXAS})"
+# SQLite não tem ARRAY(): a lista volta como texto JSON
+_ALBUNS_SQLITE = f"(SELECT json_group_array(id_album) FROM ({_ALBUNS_DAS_FAIXAS}))"
+
+
+def listar_resumo_playlists(id_usuario: int, limit: int | None = None, cursor: str | None = None):
+    """
+    Playlists do usuário com quantidade de faixas, duração total, última
+    alteração e alguns álbuns para a capa, numa consulta só. Contagem e
+    duração são colunas mantidas pelos triggers de `musica_playlist`; os
+    álbuns saem de uma varredura curta do índice por posição.
+    """
+    limit = clamp_limit(limit)
+    after = decode_cursor(cursor)
+    after = after[0] if after else None
+    if USE_MEMORY_DB:
+        rows = [
+            {**pl, "albuns": albuns_da_playlist(pl["id_playlist"], ALBUNS_AMOSTRA, ALBUNS_RESUMO)}
+            for pl in playlists_by_user(id_usuario, after, limit + 1)
+        ]
+        return make_page(rows, limit, lambda r: (r["id_playlist"],))
+
+    with get_conn() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute(
+                f"""
+                SELECT p.id_playlist, p.nome, p.id_dono,
+                       p.qtd_musicas, p.duracao_total_seg, p.atualizada_em,
+                       {_ALBUNS_SQLITE if USE_SQLITE else _ALBUNS_PG} AS albuns
+                FROM playlists p
+                WHERE p.id_dono = %s
+                  AND (%s::bigint IS NULL OR p.id_playlist > %s)
+                ORDER BY p.id_playlist
+                LIMIT %s;
+                """,
+                (ALBUNS_AMOSTRA, id_usuario, after, after, limit + 1),
+            )
+            rows = rows_to_dicts(cur.fetchall())
+        finally:
+            cur.close()
+    for row in rows:
+        albuns = row["albuns"]
+        if isinstance(albuns, str):
+            albuns = json.loads(albuns)
+        row["albuns"] = list(dict.fromkeys(albuns))[:ALBUNS_RESUMO]
+    return make_page(rows, limit, lambda r: (r["id_playlist"],))
 
 
 def atualizar_nome_playlist(id_playlist: int, nome: str):
     if USE_MEMORY_DB:
-        return mem_renomear(id_playlist, nome)
+        ok = mem_renomear(id_playlist, nome)
+        invalidate(f"playlist:{id_playlist}")
+        return ok
 
-    conn = get_conn()
-    cur = conn.cursor()
-    try:
-        cur.execute(
-            """
-            UPDATE playlists
-            SET nome=%s
-            WHERE id_playlist=%s
-            RETURNING id_playlist;
-            """,
-            (nome, id_playlist),
-        )
-        row = cur.fetchone()
-        conn.commit()
-        return bool(row)
-    finally:
-        cur.close()
-        conn.close()
+    with get_conn() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute(
+                """
+                UPDATE playlists
+                SET nome=%s, atualizada_em=NOW()
+                WHERE id_playlist=%s
+                RETURNING id_playlist;
+                """,
+                (nome, id_playlist),
+            )
+            row = cur.fetchone()
+            conn.commit()
+        finally:
+            cur.close()
+    invalidate(f"playlist:{id_playlist}")
+    return bool(row)
@@ -1,30 +1,53 @@
 # backend/crud/users.py
-from passlib.hash import argon2
-from database import get_conn, USE_MEMORY_DB, add_user
+from database import get_conn, USE_MEMORY_DB, add_user, memory_db, rows_to_dicts
+from hashing import hash_password
 
-def create_user(nome, email, senha):
+def create_user(nome, email, senha, hashed=None):
     """
     Usa Argon2 para hashear a senha (não há limite de 72 bytes como no bcrypt).
+    O hash roda no pool de `hashing`; com a fila cheia levanta `HashingBusy`.
+    Rotas async passam o `hashed` já calculado com `hash_password_async`.
     """
-    hashed = argon2.hash(senha)
+    if hashed is None:
+        hashed = hash_password(senha)
 
     if USE_MEMORY_DB:
         user = add_user(nome, email, hashed)
         return user["id_usuario"], user["nome"], user["email"]
 
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        INSERT INTO usuarios (nome, email, senha_hash)
-        VALUES (%s, %s, %s)
-        RETURNING id_usuario, nome, email;
-        """,
-        (nome, email, hashed),
-    )
-    user = cur.fetchone()
-    conn.commit()
-    cur.close()
-    conn.close()
+    with get_conn() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute(
+                """
+                INSERT INTO usuarios (nome, email, senha_hash)
+                VALUES (%s, %s, %s)
+                RETURNING id_usuario, nome, email;
+                """,
+                (nome, email, hashed),
+            )
+            user = cur.fetchone()
+            conn.commit()
+        finally:
+            cur.close()
     # Normaliza para o mesmo formato que a versão em memória:
-    return user["id_usuario"], user["nome"], user["email"]
\ No newline at end of file
+    return user["id_usuario"], user["nome"], user["email"]
+
+
+def usuarios_por_ids(ids):
+    """{id_usuario: {id_usuario, nome}} numa consulta só (sem e-mail nem hash)."""
+    ids = list(ids)
+    if not ids:
+        return {}
+    if USE_MEMORY_DB:
+        users = (memory_db.users.get(i) for i in ids)
+        return {u["id_usuario"]: {"id_usuario": u["id_usuario"], "nome": u["nome"]} for u in users if u is not None}
+
+    with get_conn() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute("SELECT id_usuario, nome FROM usuarios WHERE id_usuario = ANY(%s);", (ids,))
+            rows = rows_to_dicts(cur.fetchall())
+        finally:
+            cur.close()
+    return {r["id_usuario"]: r for r in rows}
@@ -1,6 +1,19 @@
+import heapq
+import itertools
 import os
+from bisect import bisect_left, bisect_right, insort
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from functools import wraps
 from passlib.hash import bcrypt
 from dotenv import load_dotenv
+from metrics import observe_query
+from slowlog import slow_log
+from search import TrigramIndex
+import sqlite_db
 
 try:
     import psycopg2
@@ -12,6 +25,10 @@ load_dotenv()
 
 # Default to real DB; set USE_MEMORY_DB=1 only for tests/dev fallback.
 USE_MEMORY_DB = os.getenv("USE_MEMORY_DB", "0") != "0"
+# Arquivo SQLite (modo WAL) no lugar do PostgreSQL: vários workers na mesma
+# máquina compartilham o catálogo. USE_MEMORY_DB tem precedência.
+SQLITE_PATH = os.getenv("SQLITE_PATH", "")
+USE_SQLITE = bool(SQLITE_PATH) and not USE_MEMORY_DB
 
 DB_NAME = os.getenv("DB_NAME", "streaming")
 DB_USER = os.getenv("DB_USER", "leo")
@@ -19,9 +36,41 @@ DB_PASSWORD = os.getenv("DB_PASSWORD", "senha_super_segura")
 DB_HOST = os.getenv("DB_HOST", "localhost")
 DB_PORT = os.getenv("DB_PORT", "5432")
 
+# Pool de conexões (só usado no modo PostgreSQL)
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))
+# Recicla a conexão depois de N empréstimos (0 = nunca)
+DB_POOL_MAX_USES = int(os.getenv("DB_POOL_MAX_USES", "1000"))
+# Faz "SELECT 1" ao emprestar conexões ociosas há mais de N segundos (0 = sempre, -1 = nunca)
+DB_POOL_HEALTHCHECK_IDLE = float(os.getenv("DB_POOL_HEALTHCHECK_IDLE", "30"))
+
+# Linhas buscadas por vez nas leituras em streaming (ver `stream_query`)
+DB_STREAM_BATCH = int(os.getenv("DB_STREAM_BATCH", "2000"))
+
+# Distância entre posições consecutivas numa playlist. Mover uma faixa usa o
+# ponto médio entre as vizinhas; só quando não sobra inteiro entre elas a
+# playlist é renumerada (posições voltam a ser múltiplos do passo).
+POSICAO_PASSO = 1024
+
 
 class MemoryDB:
+    """
+    Tabelas em memória compartilhadas pelas threads do servidor.
+
+    Concorrência: os helpers de mutação rodam um de cada vez sob `lock`
+    (alocação de id, tabela, índices e log ficam juntos). Leitores não
+    travam: linhas e listas de ordem das playlists nunca são alteradas no
+    lugar — o escritor monta a versão nova e a publica com uma atribuição
+    (atômica no CPython), então quem já pegou a antiga segue com um estado
+    inteiro. Leitores copiam com `tuple()` os conjuntos que vão percorrer.
+    """
+
     def __init__(self):
+        # log das mutações (ver `memory_store`); None = sem persistência
+        self.wal = None
+        # trava dos escritores (reentrante: delete_album -> delete_musica)
+        self.lock = threading.RLock()
         self.reset()
 
     def reset(self):
@@ -29,7 +78,21 @@ class MemoryDB:
         self.albums = {}
         self.musicas = {}
         self.playlists = {}
-        self.musica_playlist = set()
+        # Índices secundários (chave -> set de ids), mantidos pelos helpers
+        # de mutação para as leituras custarem O(resultado) e não O(tabela).
+        self.users_by_email = {}
+        self.musicas_by_genero = {}
+        self.musicas_by_usuario = {}
+        self.musicas_by_album = {}
+        self.albums_by_usuario = {}
+        self.playlists_by_dono = {}
+        # relação N:N musica_playlist indexada nas duas direções
+        self.playlist_musicas = {}  # id_playlist -> {id_musica: posicao}
+        self.musica_playlists = {}  # id_musica -> {id_playlist}
+        # ordem das faixas de cada playlist: lista ordenada de (posicao, id_musica)
+        self.playlist_ordem = {}
+        # busca por nome (trigramas, sem acento)
+        self.musicas_busca = TrigramIndex()
         self.user_seq = 1
         self.album_seq = 1
         self.music_seq = 1
@@ -39,10 +102,184 @@ class MemoryDB:
 memory_db = MemoryDB()
 
 
-def get_conn():
-    if USE_MEMORY_DB or psycopg2 is None:
-        return None
+# Connection pool ----------------------------------------------------------
+
+class PoolTimeout(Exception):
+    """Raised when no connection could be borrowed within the pool timeout."""
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of DB-API connections.
+
+    Connections are borrowed with `getconn()` and handed back with
+    `putconn()`; idle ones are reused LIFO so the warmest connection goes out
+    first. Borrowed connections that sat idle for too long are pinged first,
+    and every connection is recycled after `max_uses` borrows.
+    """
+
+    def __init__(self, connect, minconn=1, maxconn=10, timeout=5.0, max_uses=1000, healthcheck_idle=30.0):
+        if maxconn < 1 or minconn > maxconn:
+            raise ValueError("invalid pool size")
+        self._connect = connect
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.max_uses = max_uses
+        self.healthcheck_idle = healthcheck_idle
+        self._cond = threading.Condition()
+        self._idle = deque()  # (conn, devolvida_em)
+        self._uses = {}
+        self._total = 0
+        self._in_use = 0
+        self._waiting = 0
+        self._closed = False
+        self._stats = {
+            "acquired": 0,
+            "created": 0,
+            "recycled": 0,
+            "discarded": 0,
+            "timeouts": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+        }
+        for _ in range(minconn):
+            conn = self._new_conn()
+            with self._cond:
+                self._total += 1
+                self._idle.append((conn, time.monotonic()))
+
+    def _new_conn(self):
+        conn = self._connect()
+        with self._cond:
+            self._uses[id(conn)] = 0
+            self._stats["created"] += 1
+        return conn
+
+    def _close_conn(self, conn):
+        self._uses.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:  # noqa: BLE001 - conexão já pode estar quebrada
+            pass
+
+    def _is_healthy(self, conn, idle_since):
+        if getattr(conn, "closed", False):
+            return False
+        if self.healthcheck_idle < 0 or time.monotonic() - idle_since < self.healthcheck_idle:
+            return True
+        try:
+            cur = conn.cursor()
+            try:
+                cur.execute("SELECT 1")
+            finally:
+                cur.close()
+            conn.rollback()
+            return True
+        except Exception:  # noqa: BLE001
+            return False
 
+    def getconn(self):
+        start = time.monotonic()
+        deadline = start + self.timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolTimeout("connection pool is closed")
+                if self._idle:
+                    conn, idle_since = self._idle.pop()
+                    break
+                if self._total < self.maxconn:
+                    conn, idle_since = None, None
+                    self._total += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolTimeout(f"no connection available after {self.timeout:.1f}s")
+                self._waiting += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+            self._in_use += 1
+            waited = time.monotonic() - start
+            self._stats["acquired"] += 1
+            self._stats["wait_seconds_total"] += waited
+            self._stats["wait_seconds_max"] = max(self._stats["wait_seconds_max"], waited)
+
+        try:
+            if conn is not None and not self._is_healthy(conn, idle_since):
+                self._close_conn(conn)
+                with self._cond:
+                    self._stats["discarded"] += 1
+                conn = None
+            if conn is None:
+                conn = self._new_conn()
+        except Exception:
+            with self._cond:
+                self._total -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+        return conn
+
+    def putconn(self, conn, discard=False):
+        uses = self._uses.get(id(conn), 0) + 1
+        self._uses[id(conn)] = uses
+        recycle = self.max_uses > 0 and uses >= self.max_uses
+        if not discard and not getattr(conn, "closed", False):
+            try:
+                # descarta transação pendente/abortada antes de devolver
+                conn.rollback()
+            except Exception:  # noqa: BLE001
+                discard = True
+        else:
+            discard = True
+
+        with self._cond:
+            self._in_use -= 1
+            keep = not (discard or recycle or self._closed)
+            if keep:
+                self._idle.append((conn, time.monotonic()))
+            else:
+                self._total -= 1
+                self._stats["discarded" if discard else "recycled"] += 1
+            self._cond.notify()
+        if not keep:
+            self._close_conn(conn)
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            idle = [c for c, _ in self._idle]
+            self._idle.clear()
+            self._total -= len(idle)
+            self._cond.notify_all()
+        for conn in idle:
+            self._close_conn(conn)
+
+    def stats(self):
+        with self._cond:
+            data = dict(self._stats)
+            data.update(
+                size=self._total,
+                in_use=self._in_use,
+                idle=len(self._idle),
+                waiting=self._waiting,
+                min=self.minconn,
+                max=self.maxconn,
+            )
+        acquired = data["acquired"]
+        data["wait_seconds_avg"] = data["wait_seconds_total"] / acquired if acquired else 0.0
+        return data
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _connect():
     return psycopg2.connect(
         dbname=DB_NAME,
         user=DB_USER,
@@ -53,66 +290,408 @@ def get_conn():
     )
 
 
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    _connect,
+                    minconn=DB_POOL_MIN,
+                    maxconn=DB_POOL_MAX,
+                    timeout=DB_POOL_TIMEOUT,
+                    max_uses=DB_POOL_MAX_USES,
+                    healthcheck_idle=DB_POOL_HEALTHCHECK_IDLE,
+                )
+    return _pool
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+    if USE_SQLITE:
+        sqlite_db.close_all()
+
+
+def pool_stats():
+    if _pool is None:
+        return None
+    return _pool.stats()
+
+
+class TimedCursor:
+    """
+    Cursor proxy that reports execute/fetch timings and row counts to
+    `metrics.observe_query`, and statements over the slow-query threshold to
+    `slowlog.slow_log`; everything else is delegated unchanged.
+    """
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __enter__(self):
+        self._cursor.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._cursor.__exit__(*exc)
+
+    def _fetch(self, fn, *args):
+        t0 = time.perf_counter()
+        result = fn(*args)
+        rows = 0 if result is None else len(result) if isinstance(result, list) else 1
+        observe_query("fetch", time.perf_counter() - t0, rows)
+        return result
+
+    def execute(self, query, params=None):
+        t0 = time.perf_counter()
+        result = self._cursor.execute(query, params)
+        elapsed = time.perf_counter() - t0
+        observe_query("execute", elapsed)
+        if slow_log.is_slow(elapsed):
+            slow_log.record(self._cursor, query, params, elapsed)
+        return result
+
+    def executemany(self, query, params_seq):
+        t0 = time.perf_counter()
+        result = self._cursor.executemany(query, params_seq)
+        elapsed = time.perf_counter() - t0
+        observe_query("execute", elapsed)
+        if slow_log.is_slow(elapsed):
+            slow_log.record(self._cursor, query, None, elapsed)
+        return result
+
+    def fetchone(self):
+        return self._fetch(self._cursor.fetchone)
+
+    def fetchmany(self, size=None):
+        if size is None:
+            return self._fetch(self._cursor.fetchmany)
+        return self._fetch(self._cursor.fetchmany, size)
+
+    def fetchall(self):
+        return self._fetch(self._cursor.fetchall)
+
+    def __iter__(self):
+        while True:
+            row = self.fetchone()
+            if row is None:
+                return
+            yield row
+
+
+class TimedConnection:
+    """Connection proxy whose cursors are `TimedCursor`s."""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def cursor(self, *args, **kwargs):
+        return TimedCursor(self._conn.cursor(*args, **kwargs))
+
+
+@contextmanager
+def get_conn():
+    """
+    Empresta uma conexão do pool e a devolve ao sair do bloco `with`.
+    Qualquer transação não commitada é desfeita na devolução. Com
+    `SQLITE_PATH` entrega a conexão SQLite da thread (ver `sqlite_db`). No
+    modo memória (ou sem psycopg2) produz None. Os cursores da conexão
+    entregue são medidos (ver `TimedCursor`).
+    """
+    if USE_SQLITE:
+        conn = sqlite_db.connect(SQLITE_PATH)
+        try:
+            yield TimedConnection(conn)
+        finally:
+            conn.rollback()
+        return
+
+    if USE_MEMORY_DB or psycopg2 is None:
+        yield None
+        return
+
+    pool = get_pool()
+    conn = pool.getconn()
+    discard = False
+    try:
+        yield TimedConnection(conn)
+    except (psycopg2.InterfaceError, psycopg2.OperationalError):
+        discard = True
+        raise
+    finally:
+        pool.putconn(conn, discard=discard)
+
+
+_stream_ids = itertools.count(1)
+
+
+def stream_query(sql: str, params=None, batch_size: int = DB_STREAM_BATCH):
+    """
+    Executa `sql` num cursor nomeado (do lado do servidor: `DECLARE ...
+    CURSOR` no PostgreSQL) e produz as linhas em listas de até `batch_size`,
+    de modo que só um lote fica em memória. A conexão fica emprestada até o
+    gerador terminar ou ser fechado (no SQLite é uma conexão só do gerador,
+    fechada no fim). Não serve para o modo memória.
+    """
+    if USE_SQLITE:
+        # conexão própria, nunca a da thread: o gerador costuma terminar em
+        # outra thread do threadpool, e o rollback da devolução em `get_conn`
+        # desfaria a transação que estiver aberta na thread que o criou
+        cur = TimedCursor(sqlite_db.SQLiteServerCursor(SQLITE_PATH))
+        try:
+            yield from _ler_em_lotes(cur, sql, params, batch_size)
+        finally:
+            cur.close()
+        return
+
+    with get_conn() as conn:
+        cur = conn.cursor(name=f"stream_{next(_stream_ids)}")
+        try:
+            yield from _ler_em_lotes(cur, sql, params, batch_size)
+        finally:
+            cur.close()
+
+
+def _ler_em_lotes(cur, sql, params, batch_size):
+    cur.execute(sql, params)
+    while True:
+        rows = cur.fetchmany(batch_size)
+        if not rows:
+            return
+        yield rows
+
+
 def rows_to_dicts(rows):
     """
-    psycopg2 RealDictCursor already returns dict rows, but keep a helper to
-    normalize when needed.
+    psycopg2 RealDictCursor already returns dict rows (RealDictRow is a dict
+    subclass), so they are passed through as-is: fast_json encodes them
+    directly and copying every row here only cost time on large lists.
     """
     if rows is None:
         return []
-    return [dict(r) for r in rows]
+    return rows if isinstance(rows, list) else list(rows)
 
 
 # Memory helpers -----------------------------------------------------------
 
+# relógio da mutação em andamento nesta thread: fixado por `_persistido` para
+# o log guardar o mesmo instante que a operação usou (e a reaplicação repetir)
+_relogio = threading.local()
+# nome -> helper de mutação (sem o wrapper), para reaplicar o log
+_OPERACOES = {}
+
+
+def _persistido(fn):
+    """
+    Marca um helper de mutação: roda com `memory_db.lock` tomado e, com
+    `memory_db.wal` ligado, é registrado no log depois de aplicado (se mudou
+    algo: resultado diferente de False/None). Chamadas aninhadas
+    (delete_album -> delete_musica) entram só pela de fora.
+    """
+    _OPERACOES[fn.__name__] = fn
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        with memory_db.lock:
+            if getattr(_relogio, "t", None) is not None:
+                return fn(*args, **kwargs)
+            _relogio.t = datetime.now(timezone.utc)
+            try:
+                result = fn(*args, **kwargs)
+                wal = memory_db.wal
+                if wal is not None and result is not None and result is not False:
+                    wal.append(fn.__name__, args, kwargs, _relogio.t)
+            finally:
+                _relogio.t = None
+        return result
+
+    return wrapper
+
+
+def reaplicar(op: str, args, kwargs, t: datetime):
+    """Reaplica um registro do log com o relógio da operação original."""
+    with memory_db.lock:
+        _relogio.t = t
+        try:
+            return _OPERACOES[op](*args, **kwargs)
+        finally:
+            _relogio.t = None
+
+
+def restaurar_memoria(tabelas: dict, relacao, seqs: dict, busca=None):
+    """
+    Substitui o conteúdo da `MemoryDB` pelas tabelas de um snapshot
+    ({"users": {id: linha}, ...}), `relacao` = [(id_playlist, id_musica,
+    posicao)], e reconstrói os índices secundários. `busca` é o estado do
+    índice de trigramas (`TrigramIndex.export_state`); sem ele o índice é
+    refeito a partir dos nomes.
+    """
+    db = memory_db
+    db.reset()
+    db.users = tabelas["users"]
+    db.albums = tabelas["albums"]
+    db.musicas = tabelas["musicas"]
+    db.playlists = tabelas["playlists"]
+    for uid, user in db.users.items():
+        db.users_by_email.setdefault(user["email"], uid)
+    for aid, album in db.albums.items():
+        _index_add(db.albums_by_usuario, album["id_usuario"], aid)
+    for mid, musica in db.musicas.items():
+        _index_add(db.musicas_by_genero, musica["genero"], mid)
+        _index_add(db.musicas_by_usuario, musica["id_usuario"], mid)
+        _index_add(db.musicas_by_album, musica["id_album"], mid)
+        if busca is None:
+            db.musicas_busca.add(mid, musica["nome"])
+    if busca is not None:
+        db.musicas_busca.load_state(*busca)
+    for pid, playlist in db.playlists.items():
+        _index_add(db.playlists_by_dono, playlist["id_dono"], pid)
+    for pid, mid, pos in relacao:
+        db.playlist_musicas.setdefault(pid, {})[mid] = pos
+        db.playlist_ordem.setdefault(pid, []).append((pos, mid))
+        _index_add(db.musica_playlists, mid, pid)
+    for ordem in db.playlist_ordem.values():
+        ordem.sort()
+    db.user_seq = seqs["user_seq"]
+    db.album_seq = seqs["album_seq"]
+    db.music_seq = seqs["music_seq"]
+    db.playlist_seq = seqs["playlist_seq"]
+
+
+def _novo_id(seq: str) -> int:
+    """Próximo valor do contador `seq` (chamado com `memory_db.lock` tomado)."""
+    valor = getattr(memory_db, seq)
+    setattr(memory_db, seq, valor + 1)
+    return valor
+
+
+def _index_add(index: dict, key, id_):
+    bucket = index.get(key)
+    if bucket is None:
+        index[key] = {id_}
+    else:
+        bucket.add(id_)
+
+
+def _index_discard(index: dict, key, id_):
+    bucket = index.get(key)
+    if bucket is not None:
+        bucket.discard(id_)
+        if not bucket:
+            del index[key]
+
+
+def _rows(table: dict, ids, after=None, limit=None):
+    """
+    Linhas de `table` para `ids` em ordem de id (= ordem de criação).
+    `after`/`limit` fazem a paginação por keyset sem ordenar o conjunto todo.
+    """
+    ids = tuple(ids)  # o conjunto pode mudar nas mãos de um escritor
+    if after is not None:
+        ids = (i for i in ids if i > after)
+    chosen = sorted(ids) if limit is None else heapq.nsmallest(limit, ids)
+    rows = (table.get(i) for i in chosen)
+    return [row for row in rows if row is not None]
+
+
+@_persistido
 def add_user(nome: str, email: str, senha_hash: str):
-    uid = memory_db.user_seq
-    memory_db.user_seq += 1
+    uid = _novo_id("user_seq")
     memory_db.users[uid] = {
         "id_usuario": uid,
         "nome": nome,
         "email": email,
         "senha_hash": senha_hash,
     }
+    memory_db.users_by_email.setdefault(email, uid)
     return memory_db.users[uid]
 
 
+@_persistido
+def update_user_hash(uid: int, senha_hash: str):
+    user = memory_db.users.get(uid)
+    if not user:
+        return False
+    memory_db.users[uid] = {**user, "senha_hash": senha_hash}
+    return True
+
+
 def find_user_by_email(email: str):
-    return next((u for u in memory_db.users.values() if u["email"] == email), None)
+    uid = memory_db.users_by_email.get(email)
+    return memory_db.users.get(uid) if uid is not None else None
 
 
+@_persistido
 def create_album(titulo: str, ano: int, id_usuario: int):
-    aid = memory_db.album_seq
-    memory_db.album_seq += 1
+    aid = _novo_id("album_seq")
     memory_db.albums[aid] = {
         "id_album": aid,
         "titulo": titulo,
         "ano": ano,
         "id_usuario": id_usuario,
     }
+    _index_add(memory_db.albums_by_usuario, id_usuario, aid)
     return memory_db.albums[aid]
 
+@_persistido
 def renomear_album(aid: int, titulo: str):
-    if aid not in memory_db.albums:
+    album = memory_db.albums.get(aid)
+    if album is None:
         return False
-    memory_db.albums[aid]["titulo"] = titulo
+    memory_db.albums[aid] = {**album, "titulo": titulo}
     return True
 
 
+def _agora():
+    t = getattr(_relogio, "t", None)
+    return t if t is not None else datetime.now(timezone.utc)
+
+
+def _duracao(mid: int):
+    musica = memory_db.musicas.get(mid)
+    return (musica.get("duracao_seg") or 0) if musica else 0
+
+
+def _tocar_playlist(pid: int, qtd: int = 0, duracao: int = 0):
+    pl = memory_db.playlists.get(pid)
+    if pl is not None:
+        memory_db.playlists[pid] = {
+            **pl,
+            "qtd_musicas": pl["qtd_musicas"] + qtd,
+            "duracao_total_seg": pl["duracao_total_seg"] + duracao,
+            "atualizada_em": _agora(),
+        }
+
+
+@_persistido
 def create_playlist(nome: str, id_dono: int):
-    pid = memory_db.playlist_seq
-    memory_db.playlist_seq += 1
+    pid = _novo_id("playlist_seq")
     memory_db.playlists[pid] = {
         "id_playlist": pid,
         "nome": nome,
         "id_dono": id_dono,
+        # agregados mantidos por _link/_unlink (no Postgres, por triggers)
+        "qtd_musicas": 0,
+        "duracao_total_seg": 0,
+        "atualizada_em": _agora(),
     }
+    _index_add(memory_db.playlists_by_dono, id_dono, pid)
     return memory_db.playlists[pid]
 
 
+@_persistido
 def add_musica(nome: str, genero: str, duracao_seg: int, id_album: int, id_usuario: int):
-    mid = memory_db.music_seq
-    memory_db.music_seq += 1
+    mid = _novo_id("music_seq")
     memory_db.musicas[mid] = {
         "id_musica": mid,
         "nome": nome,
@@ -121,96 +700,360 @@ def add_musica(nome: str, genero: str, duracao_seg: int, id_album: int, id_usuar
         "id_album": id_album,
         "id_usuario": id_usuario,
     }
+    _index_add(memory_db.musicas_by_genero, genero, mid)
+    _index_add(memory_db.musicas_by_usuario, id_usuario, mid)
+    _index_add(memory_db.musicas_by_album, id_album, mid)
+    memory_db.musicas_busca.add(mid, nome)
     return memory_db.musicas[mid]
 
 
+def _reindex(musica: dict, nome: str, genero: str):
+    mid = musica["id_musica"]
+    if genero != musica["genero"]:
+        _index_discard(memory_db.musicas_by_genero, musica["genero"], mid)
+        _index_add(memory_db.musicas_by_genero, genero, mid)
+    if nome != musica["nome"]:
+        memory_db.musicas_busca.add(mid, nome)
+
+
+@_persistido
 def update_musica(mid: int, nome: str, genero: str, duracao_seg: int):
     musica = memory_db.musicas.get(mid)
     if not musica:
         return False
-    musica.update({"nome": nome, "genero": genero, "duracao_seg": duracao_seg})
+    _reindex(musica, nome, genero)
+    delta = (duracao_seg or 0) - (musica["duracao_seg"] or 0)
+    if delta:
+        for pid in memory_db.musica_playlists.get(mid, ()):
+            _tocar_playlist(pid, duracao=delta)
+    memory_db.musicas[mid] = {**musica, "nome": nome, "genero": genero, "duracao_seg": duracao_seg}
     return True
 
+@_persistido
 def update_musica_metadata(mid: int, nome: str, genero: str):
     musica = memory_db.musicas.get(mid)
     if not musica:
         return False
-    musica.update({"nome": nome, "genero": genero})
+    _reindex(musica, nome, genero)
+    memory_db.musicas[mid] = {**musica, "nome": nome, "genero": genero}
     return True
 
+@_persistido
 def delete_album(aid: int):
     if aid not in memory_db.albums:
         return False
     # remove musicas ligadas ao álbum
-    ids_musicas = [mid for mid, m in memory_db.musicas.items() if m["id_album"] == aid]
-    for mid in ids_musicas:
+    for mid in list(memory_db.musicas_by_album.get(aid, ())):
         delete_musica(mid)
-    del memory_db.albums[aid]
+    album = memory_db.albums.pop(aid)
+    _index_discard(memory_db.albums_by_usuario, album["id_usuario"], aid)
     return True
 
 
+@_persistido
 def delete_musica(mid: int):
     if mid not in memory_db.musicas:
         return False
-    del memory_db.musicas[mid]
-    memory_db.musica_playlist = {(pid, mid_) for pid, mid_ in memory_db.musica_playlist if mid_ != mid}
+    # desvincula antes de remover: os agregados das playlists usam a duração
+    for pid in list(memory_db.musica_playlists.get(mid, ())):
+        _unlink(pid, mid)
+    musica = memory_db.musicas.pop(mid)
+    _index_discard(memory_db.musicas_by_genero, musica["genero"], mid)
+    _index_discard(memory_db.musicas_by_usuario, musica["id_usuario"], mid)
+    _index_discard(memory_db.musicas_by_album, musica["id_album"], mid)
+    memory_db.musicas_busca.remove(mid)
     return True
 
 def get_user_by_id(uid: int):
     return memory_db.users.get(uid)
 
 
+def posicao_entre(antes, depois):
+    """
+    Posição inteira estritamente entre `antes` e `depois` (None = ponta da
+    lista), ou None se as duas já são vizinhas e é preciso renumerar.
+    """
+    if antes is None and depois is None:
+        return POSICAO_PASSO
+    if antes is None:
+        return depois - POSICAO_PASSO
+    if depois is None:
+        return antes + POSICAO_PASSO
+    if depois - antes < 2:
+        return None
+    return (antes + depois) // 2
+
+
+def _link(pid: int, *mids):
+    """
+    Põe as faixas no fim da playlist. A lista de ordem é copiada e publicada
+    de uma vez: leitores percorrendo a antiga não veem a troca.
+    """
+    ordem = list(memory_db.playlist_ordem.get(pid, ()))
+    posicoes = memory_db.playlist_musicas.setdefault(pid, {})
+    duracao = 0
+    for mid in mids:
+        pos = ordem[-1][0] + POSICAO_PASSO if ordem else POSICAO_PASSO
+        ordem.append((pos, mid))
+        posicoes[mid] = pos
+        _index_add(memory_db.musica_playlists, mid, pid)
+        duracao += _duracao(mid)
+    memory_db.playlist_ordem[pid] = ordem
+    _tocar_playlist(pid, len(mids), duracao)
+
+
+def _unlink(pid: int, *mids):
+    posicoes = memory_db.playlist_musicas[pid]
+    fora = {mid: posicoes.pop(mid) for mid in mids}
+    if posicoes:
+        if len(fora) == 1:
+            ordem = list(memory_db.playlist_ordem[pid])
+            ((mid, pos),) = fora.items()
+            del ordem[bisect_left(ordem, (pos, mid))]
+        else:
+            ordem = [item for item in memory_db.playlist_ordem[pid] if item[1] not in fora]
+        memory_db.playlist_ordem[pid] = ordem
+    else:
+        del memory_db.playlist_ordem[pid]
+        del memory_db.playlist_musicas[pid]
+    duracao = 0
+    for mid in fora:
+        _index_discard(memory_db.musica_playlists, mid, pid)
+        duracao += _duracao(mid)
+    _tocar_playlist(pid, -len(fora), -duracao)
+
+
+def _linked(pid: int, mid: int):
+    return mid in memory_db.playlist_musicas.get(pid, ())
+
+
+def _rebalancear(pid: int):
+    posicoes = memory_db.playlist_musicas[pid]
+    ordem = []
+    for i, (_, mid) in enumerate(memory_db.playlist_ordem[pid]):
+        pos = (i + 1) * POSICAO_PASSO
+        ordem.append((pos, mid))
+        posicoes[mid] = pos
+    memory_db.playlist_ordem[pid] = ordem
+
+
+@_persistido
+def mover_musica_playlist(pid: int, mid: int, antes_de=None, depois_de=None):
+    """
+    Move `mid` para logo antes de `antes_de` (ou logo depois de `depois_de`).
+    Só a posição da faixa movida muda, salvo quando a playlist precisa ser
+    renumerada. Devolve a nova posição, ou None se alguma faixa não está na
+    playlist.
+    """
+    ref = antes_de if antes_de is not None else depois_de
+    posicoes = memory_db.playlist_musicas.get(pid, {})
+    if mid not in posicoes or ref not in posicoes:
+        return None
+    if ref == mid:
+        return posicoes[mid]
+
+    while True:
+        # cópia sem a faixa movida; a lista publicada só muda no fim
+        ordem = list(memory_db.playlist_ordem[pid])
+        del ordem[bisect_left(ordem, (posicoes[mid], mid))]
+        i = bisect_left(ordem, (posicoes[ref], ref))
+        if antes_de is not None:
+            antes = ordem[i - 1][0] if i > 0 else None
+            pos = posicao_entre(antes, ordem[i][0])
+        else:
+            depois = ordem[i + 1][0] if i + 1 < len(ordem) else None
+            pos = posicao_entre(ordem[i][0], depois)
+        if pos is not None:
+            break
+        _rebalancear(pid)
+    posicoes[mid] = pos
+    insort(ordem, (pos, mid))
+    memory_db.playlist_ordem[pid] = ordem
+    _tocar_playlist(pid)
+    return pos
+
+
+@_persistido
 def add_musica_playlist(pid: int, mid: int):
     # Auto-create playlist if it doesn't exist to keep tests simple.
     if pid not in memory_db.playlists:
         create_playlist(f"Playlist {pid}", id_dono=1)
-    memory_db.musica_playlist.add((pid, mid))
+    if not _linked(pid, mid):
+        _link(pid, mid)
     return True
 
 
+@_persistido
 def remove_musica_playlist(pid: int, mid: int):
-    if (pid, mid) in memory_db.musica_playlist:
-        memory_db.musica_playlist.remove((pid, mid))
+    if _linked(pid, mid):
+        _unlink(pid, mid)
         return True
     return False
 
 
-def listar_musicas():
-    return list(memory_db.musicas.values())
+@_persistido
+def add_musicas_playlist(pid: int, mids):
+    """Versão em lote: devolve {id_musica: "added" | "exists" | "not_found"}."""
+    result = {}
+    novas = {}
+    for mid in mids:
+        if mid not in memory_db.musicas:
+            result[mid] = "not_found"
+        elif _linked(pid, mid) or mid in novas:
+            result[mid] = "exists"
+        else:
+            novas[mid] = None
+            result[mid] = "added"
+    if novas:
+        _link(pid, *novas)
+    return result
 
 
-def listar_por_genero(genero: str):
-    return [m for m in memory_db.musicas.values() if m["genero"] == genero]
+@_persistido
+def remove_musicas_playlist(pid: int, mids):
+    """Versão em lote: devolve {id_musica: "removed" | "absent"}."""
+    result = {}
+    fora = {}
+    for mid in mids:
+        if _linked(pid, mid) and mid not in fora:
+            fora[mid] = None
+            result[mid] = "removed"
+        else:
+            result[mid] = "absent"
+    if fora:
+        _unlink(pid, *fora)
+    return result
 
 
-def listar_por_artista(id_usuario: int):
-    return [m for m in memory_db.musicas.values() if m["id_usuario"] == id_usuario]
+def em_lotes(table: dict, ids, batch_size: int = DB_STREAM_BATCH):
+    """
+    Linhas de `table` para `ids`, em ordem de id, em listas de até
+    `batch_size`: a contraparte em memória de `stream_query`.
+    """
+    ids = sorted(tuple(ids))
+    for i in range(0, len(ids), batch_size):
+        rows = (table.get(j) for j in ids[i:i + batch_size])
+        rows = [row for row in rows if row is not None]
+        if rows:
+            yield rows
 
 
-def playlists_by_user(uid: int):
-    return [p for p in memory_db.playlists.values() if p["id_dono"] == uid]
+def listar_musicas(after=None, limit=None):
+    if limit is None:
+        return _rows(memory_db.musicas, memory_db.musicas.keys(), after)
+    # ids são sequenciais: anda a partir do cursor em vez de varrer a tabela
+    rows = []
+    mid = (after or 0) + 1
+    while len(rows) < limit and mid < memory_db.music_seq:
+        musica = memory_db.musicas.get(mid)
+        if musica is not None:
+            rows.append(musica)
+        mid += 1
+    return rows
 
 
-def musicas_por_album(aid: int):
-    return [m for m in memory_db.musicas.values() if m["id_album"] == aid]
+def buscar_musicas(nome: str, after=None, limit=None):
+    """
+    Músicas cujo nome casa com `nome`, da mais para a menos relevante, como
+    pares (chave de ordenação, linha). `after` é a chave do último item já visto.
+    """
+    hits = memory_db.musicas_busca.search(nome)
+    if after is not None:
+        hits = [h for h in hits if h.key > tuple(after)]
+    rows = []
+    for h in hits:
+        musica = memory_db.musicas.get(h.id)  # None: apagada durante a busca
+        if musica is not None:
+            rows.append((h.key, musica))
+            if len(rows) == limit:
+                break
+    return rows
 
 
-def musicas_da_playlist(pid: int):
-    mids = [mid for (p, mid) in memory_db.musica_playlist if p == pid]
-    return [memory_db.musicas[mid] for mid in mids if mid in memory_db.musicas]
+def listar_por_genero(genero: str, after=None, limit=None):
+    return _rows(memory_db.musicas, memory_db.musicas_by_genero.get(genero, ()), after, limit)
 
 
+def listar_por_artista(id_usuario: int, after=None, limit=None):
+    return _rows(memory_db.musicas, memory_db.musicas_by_usuario.get(id_usuario, ()), after, limit)
+
+
+def playlists_by_user(uid: int, after=None, limit=None):
+    return _rows(memory_db.playlists, memory_db.playlists_by_dono.get(uid, ()), after, limit)
+
+
+def musicas_por_album(aid: int, after=None, limit=None):
+    return _rows(memory_db.musicas, memory_db.musicas_by_album.get(aid, ()), after, limit)
+
+
+def listar_albuns(id_usuario=None, ano_min=None, ano_max=None, prefixo=None, after=None, limit=None):
+    """Álbuns filtrados por dono, faixa de ano e prefixo do título (sem caixa), por id."""
+    ids = memory_db.albums_by_usuario.get(id_usuario, ()) if id_usuario is not None else memory_db.albums.keys()
+    albums = memory_db.albums
+    prefixo = prefixo.lower() if prefixo else None
+
+    def ok(aid):
+        album = albums.get(aid)
+        if album is None:
+            return False
+        ano = album["ano"]
+        return (
+            (ano_min is None or (ano is not None and ano >= ano_min))
+            and (ano_max is None or (ano is not None and ano <= ano_max))
+            and (prefixo is None or album["titulo"].lower().startswith(prefixo))
+        )
+
+    return _rows(albums, [aid for aid in tuple(ids) if ok(aid)], after, limit)
+
+
+def faixas_da_playlist(pid: int, after=None, limit=None):
+    """
+    Pares (posicao, musica) na ordem da playlist; `after` é o par
+    (posicao, id_musica) do cursor. Lê uma única versão da lista de ordem,
+    então posição e faixa sempre batem mesmo com escritores em paralelo.
+    """
+    ordem = memory_db.playlist_ordem.get(pid, ())
+    start = bisect_right(ordem, tuple(after)) if after is not None else 0
+    stop = len(ordem) if limit is None else start + limit
+    musicas = memory_db.musicas
+    faixas = ((pos, musicas.get(mid)) for pos, mid in ordem[start:stop])
+    return [(pos, musica) for pos, musica in faixas if musica is not None]
+
+
+def musicas_da_playlist(pid: int, after=None, limit=None):
+    """Faixas na ordem da playlist; `after` é o par (posicao, id_musica) do cursor."""
+    return [musica for _, musica in faixas_da_playlist(pid, after, limit)]
+
+
+def albuns_da_playlist(pid: int, amostra: int, maximo: int):
+    """Álbuns distintos das primeiras `amostra` faixas, na ordem da playlist."""
+    albuns = []
+    for _, mid in memory_db.playlist_ordem.get(pid, ())[:amostra]:
+        musica = memory_db.musicas.get(mid)
+        aid = musica["id_album"] if musica is not None else None
+        if aid is not None and aid not in albuns:
+            albuns.append(aid)
+            if len(albuns) == maximo:
+                break
+    return albuns
+
+
+@_persistido
 def renomear_playlist(pid: int, nome: str):
     pl = memory_db.playlists.get(pid)
     if not pl:
         return False
-    pl["nome"] = nome
+    memory_db.playlists[pid] = {**pl, "nome": nome, "atualizada_em": _agora()}
     return True
 
+@_persistido
 def deletar_playlist(pid: int):
-    if pid not in memory_db.playlists:
+    pl = memory_db.playlists.pop(pid, None)
+    if pl is None:
         return False
     # remove relações musica_playlist
-    memory_db.musica_playlist = {(p, mid) for (p, mid) in memory_db.musica_playlist if p != pid}
-    del memory_db.playlists[pid]
+    memory_db.playlist_ordem.pop(pid, None)
+    for mid in memory_db.playlist_musicas.pop(pid, ()):
+        _index_discard(memory_db.musica_playlists, mid, pid)
+    _index_discard(memory_db.playlists_by_dono, pl["id_dono"], pid)
     return True
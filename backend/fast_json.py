@@ -0,0 +1,165 @@
+"""
+Serialização JSON rápida para as respostas da API.
+
+Sem `response_model`, o FastAPI passa todo retorno por `jsonable_encoder`
+(que percorre e copia cada valor) e depois pelo `json` da stdlib. Nas
+listagens grandes isso custa mais CPU que a própria consulta. Aqui o
+retorno vai direto para o `orjson` (quando instalado), que entende dicts,
+listas, datas e subclasses de dict como `RealDictRow` sem cópias; tipos
+que ele não conhece caem no `jsonable_encoder` só para aquele valor.
+
+`FastJSONRoute` aplica isso às rotas sem `response_model` sem mudar os
+handlers: chamados diretamente (nos testes) eles continuam devolvendo
+listas e dicts.
+
+`streaming_response` serializa resultados grandes aos poucos (array JSON
+ou NDJSON), lote a lote, a partir de um iterador como `database.stream_query`.
+"""
+import functools
+import inspect
+import itertools
+import json
+import os
+
+from fastapi import Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.routing import APIRoute
+from fastapi.datastructures import DefaultPlaceholder
+
+try:
+    import orjson
+except ImportError:  # noqa: W0705 - sem orjson usa a stdlib, ainda sem o jsonable_encoder
+    orjson = None
+
+FAST_JSON = os.getenv("FAST_JSON", "1") != "0"
+
+NDJSON = "application/x-ndjson"
+FORMATOS_STREAM = {"json": "application/json", "ndjson": NDJSON}
+
+
+def _default(obj):
+    # só para tipos que o orjson/json não serializam sozinhos (Decimal, pydantic, ...)
+    return jsonable_encoder(obj)
+
+
+def dumps(content) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def stream_json(batches, formato: str = "json"):
+    """
+    Gera os bytes de lotes de linhas: um array JSON (`json`) ou um objeto por
+    linha (`ndjson`). Cada lote vira um pedaço da resposta; nada além do lote
+    atual e do seu JSON fica em memória.
+    """
+    if formato == "ndjson":
+        for rows in batches:
+            if rows:
+                yield b"".join([dumps(row) + b"\n" for row in rows])
+        return
+    yield b"["
+    separador = b""
+    for rows in batches:
+        if rows:
+            # o lote vira um array só e perde os colchetes: uma chamada ao encoder por lote
+            yield separador + dumps(rows if isinstance(rows, list) else list(rows))[1:-1]
+            separador = b","
+    yield b"]"
+
+
+def streaming_response(batches, formato: str = "json", headers=None) -> StreamingResponse:
+    """
+    `StreamingResponse` com `stream_json`. O primeiro lote é lido já aqui:
+    erro na consulta ainda vira uma resposta de erro normal, não um corpo
+    cortado depois do status 200.
+    """
+    batches = iter(batches)
+    primeiro = next(batches, None)
+    if primeiro is not None:
+        batches = itertools.chain([primeiro], batches)
+    return StreamingResponse(stream_json(batches, formato), media_type=FORMATOS_STREAM[formato], headers=headers)
+
+
+class FastJSONResponse(JSONResponse):
+    """`JSONResponse` que codifica com `dumps` (orjson) em vez do `json` da stdlib."""
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def _find_response_param(sig: inspect.Signature):
+    for param in sig.parameters.values():
+        if param.annotation is Response:
+            return param.name
+    return None
+
+
+def fast_json_endpoint(endpoint, status_code=None):
+    """
+    Embrulha um handler para que listas/dicts retornados virem
+    `FastJSONResponse` antes de chegar no `jsonable_encoder` do FastAPI.
+    Headers e status definidos no `Response` injetado são preservados.
+    """
+    sig = inspect.signature(endpoint)
+    response_param = _find_response_param(sig)
+    injected = response_param is None
+    if injected:
+        response_param = "_fast_json_response"
+        params = list(sig.parameters.values())
+        extra = inspect.Parameter(response_param, inspect.Parameter.KEYWORD_ONLY, annotation=Response)
+        # parâmetros **kwargs precisam ficar por último
+        pos = next((i for i, p in enumerate(params) if p.kind is inspect.Parameter.VAR_KEYWORD), len(params))
+        params.insert(pos, extra)
+        sig = sig.replace(parameters=params)
+
+    def wrap(result, sub):
+        if isinstance(result, Response) or not isinstance(result, (list, dict)):
+            return result
+        code = (sub.status_code if sub is not None else None) or status_code or 200
+        response = FastJSONResponse(result, status_code=code)
+        if sub is not None:
+            response.headers.raw.extend(sub.headers.raw)
+        return response
+
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            sub = kwargs.pop(response_param) if injected else kwargs.get(response_param)
+            return wrap(await endpoint(*args, **kwargs), sub)
+    else:
+        @functools.wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            sub = kwargs.pop(response_param) if injected else kwargs.get(response_param)
+            return wrap(endpoint(*args, **kwargs), sub)
+
+    wrapper.__signature__ = sig
+    return wrapper
+
+
+def _uses_default_serialization(endpoint, kwargs) -> bool:
+    if inspect.signature(endpoint).return_annotation is not inspect.Signature.empty:
+        return False  # o FastAPI usaria a anotação de retorno como response_model
+    response_model = kwargs.get("response_model")
+    if isinstance(response_model, DefaultPlaceholder):
+        response_model = response_model.value
+    response_class = kwargs.get("response_class")
+    return response_model is None and (response_class is None or isinstance(response_class, DefaultPlaceholder))
+
+
+class FastJSONRoute(APIRoute):
+    """
+    Rota que serializa com `FastJSONResponse`. Rotas com `response_model`
+    ou `response_class` explícitos seguem o caminho normal do FastAPI, que
+    precisa do encoder para filtrar os campos.
+    """
+
+    def __init__(self, path, endpoint, **kwargs):
+        if FAST_JSON and _uses_default_serialization(endpoint, kwargs):
+            status_code = kwargs.get("status_code")
+            if isinstance(status_code, DefaultPlaceholder):
+                status_code = status_code.value
+            endpoint = fast_json_endpoint(endpoint, status_code)
+        super().__init__(path, endpoint, **kwargs)
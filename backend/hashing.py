@@ -0,0 +1,225 @@
+"""
+Hash de senhas (Argon2) fora do event loop e do threadpool das rotas.
+
+Argon2 é caro de propósito (CPU + memória): um pico de logins chamando
+`argon2.hash/verify` direto nas rotas ocupa o threadpool inteiro e trava
+streaming e catálogo. Aqui o trabalho vai para um pool de processos do
+tamanho do número de núcleos, com uma fila limitada na frente: quando ela
+enche, `HashingBusy` é levantada na hora (a API responde 503 +
+Retry-After) em vez de empilhar requisições.
+
+As rotas usam `hash_password_async`/`verify_password_async`: a espera pelo
+pool é um `await` no event loop, sem prender uma thread do threadpool do
+Starlette por hash em andamento. As versões síncronas ficam para scripts.
+
+Os parâmetros do Argon2 vêm de variáveis de ambiente; hashes gravados com
+parâmetros antigos são refeitos de forma transparente no próximo login.
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from passlib.hash import argon2
+
+# 0 = roda no próprio thread da requisição (útil em testes/dev)
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(os.cpu_count() or 1)))
+# quantos pedidos podem esperar além dos que já estão sendo processados
+HASH_QUEUE_MAX = int(os.getenv("HASH_QUEUE_MAX", "32"))
+HASH_RETRY_AFTER = int(os.getenv("HASH_RETRY_AFTER", "1"))
+
+
+def argon2_params():
+    """Parâmetros do Argon2 definidos no ambiente (os ausentes usam o padrão do passlib)."""
+    params = {}
+    for env, name in (
+        ("ARGON2_TIME_COST", "time_cost"),
+        ("ARGON2_MEMORY_COST", "memory_cost"),  # KiB
+        ("ARGON2_PARALLELISM", "parallelism"),
+    ):
+        value = os.getenv(env)
+        if value:
+            params[name] = int(value)
+    return params
+
+
+class HashingBusy(Exception):
+    """Fila de hashing cheia: o cliente deve tentar de novo mais tarde."""
+
+
+# Executadas nos processos do pool: precisam ser funções de módulo (picklable).
+
+def _hash(senha, params):
+    started = time.time()
+    hashed = argon2.using(**params).hash(senha)
+    return hashed, started, time.time() - started
+
+
+def _verify(senha, senha_hash, params):
+    started = time.time()
+    hasher = argon2.using(**params)
+    ok = hasher.verify(senha, senha_hash)
+    novo = hasher.hash(senha) if ok and hasher.needs_update(senha_hash) else None
+    return (ok, novo), started, time.time() - started
+
+
+class HashPool:
+    """Pool de processos para Argon2 com controle de admissão e métricas."""
+
+    def __init__(self, workers=HASH_WORKERS, queue_max=HASH_QUEUE_MAX, params=None):
+        self.workers = workers
+        self.queue_max = queue_max
+        self.params = argon2_params() if params is None else params
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._recent = deque()  # instantes das últimas conclusões (vazão)
+        self._stats = {
+            "submitted": 0,
+            "completed": 0,
+            "rejected": 0,
+            "failed": 0,
+            "rehashed": 0,
+            "hash_seconds_total": 0.0,
+            "queue_wait_seconds_total": 0.0,
+            "queue_wait_seconds_max": 0.0,
+        }
+
+    @property
+    def capacity(self):
+        return max(self.workers, 1) + self.queue_max
+
+    def _get_executor(self):
+        if self._executor is None:
+            # spawn: o processo da API tem threads, fork não é seguro aqui
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=get_context("spawn"))
+        return self._executor
+
+    def _admitir(self):
+        """Reserva uma vaga na fila ou levanta `HashingBusy`; devolve o executor (ou None)."""
+        with self._lock:
+            if self._pending >= self.capacity:
+                self._stats["rejected"] += 1
+                raise HashingBusy()
+            self._pending += 1
+            self._stats["submitted"] += 1
+            return self._get_executor() if self.workers > 0 else None
+
+    def _liberar(self, falhou):
+        with self._lock:
+            self._pending -= 1
+            if falhou:
+                self._stats["failed"] += 1
+
+    def _concluir(self, submitted, started, elapsed):
+        wait = max(0.0, started - submitted)
+        now = time.monotonic()
+        with self._lock:
+            self._stats["completed"] += 1
+            self._stats["hash_seconds_total"] += elapsed
+            self._stats["queue_wait_seconds_total"] += wait
+            self._stats["queue_wait_seconds_max"] = max(self._stats["queue_wait_seconds_max"], wait)
+            self._recent.append(now)
+            while self._recent and self._recent[0] < now - 60:
+                self._recent.popleft()
+
+    def _run(self, fn, *args):
+        executor = self._admitir()
+        submitted = time.time()
+        falhou = True
+        try:
+            if executor is not None:
+                result, started, elapsed = executor.submit(fn, *args, self.params).result()
+            else:
+                result, started, elapsed = fn(*args, self.params)
+            falhou = False
+        finally:
+            self._liberar(falhou)
+        self._concluir(submitted, started, elapsed)
+        return result
+
+    async def _run_async(self, fn, *args):
+        """Como `_run`, mas a espera é um `await`: não ocupa thread nenhuma enquanto o hash roda."""
+        executor = self._admitir()
+        submitted = time.time()
+        falhou = True
+        try:
+            if executor is not None:
+                result, started, elapsed = await asyncio.wrap_future(executor.submit(fn, *args, self.params))
+            else:
+                # sem pool (testes/dev): uma thread avulsa, para não travar o event loop
+                result, started, elapsed = await asyncio.to_thread(fn, *args, self.params)
+            falhou = False
+        finally:
+            self._liberar(falhou)
+        self._concluir(submitted, started, elapsed)
+        return result
+
+    def hash(self, senha: str) -> str:
+        return self._run(_hash, senha)
+
+    def verify(self, senha: str, senha_hash: str):
+        """
+        Devolve `(ok, novo_hash)`: `novo_hash` só vem preenchido quando a senha
+        confere mas o hash foi gerado com parâmetros diferentes dos atuais.
+        """
+        return self._rehashed(self._run(_verify, senha, senha_hash))
+
+    async def hash_async(self, senha: str) -> str:
+        return await self._run_async(_hash, senha)
+
+    async def verify_async(self, senha: str, senha_hash: str):
+        return self._rehashed(await self._run_async(_verify, senha, senha_hash))
+
+    def _rehashed(self, resultado):
+        if resultado[1] is not None:
+            with self._lock:
+                self._stats["rehashed"] += 1
+        return resultado
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            pending = self._pending
+            now = time.monotonic()
+            recent = sum(1 for t in self._recent if t >= now - 60)
+        done = stats["completed"]
+        stats.update(
+            workers=self.workers,
+            queue_max=self.queue_max,
+            in_flight=min(pending, max(self.workers, 1)),
+            queued=max(0, pending - max(self.workers, 1)),
+            hashes_per_second=recent / 60,
+            hash_seconds_avg=stats["hash_seconds_total"] / done if done else 0.0,
+            queue_wait_seconds_avg=stats["queue_wait_seconds_total"] / done if done else 0.0,
+            params=dict(self.params),
+        )
+        return stats
+
+
+hash_pool = HashPool()
+
+
+def hash_password(senha: str) -> str:
+    return hash_pool.hash(senha)
+
+
+def verify_password(senha: str, senha_hash: str):
+    return hash_pool.verify(senha, senha_hash)
+
+
+async def hash_password_async(senha: str) -> str:
+    return await hash_pool.hash_async(senha)
+
+
+async def verify_password_async(senha: str, senha_hash: str):
+    return await hash_pool.verify_async(senha, senha_hash)
@@ -0,0 +1,109 @@
+"""
+Documentos compostos (`include=`) e campos esparsos (`fields=`) nas leituras.
+
+`fields=id_musica,nome` limita as colunas: a lista validada vai até o SQL
+(`SELECT id_musica, nome ...`) em vez de cortar o `SELECT *` depois. As
+colunas que a própria API precisa (a chave do cursor e as chaves estrangeiras
+dos includes pedidos) entram sempre.
+
+`include=album,autor` embute as entidades relacionadas em cada linha. Elas
+são carregadas por página com uma consulta `= ANY(%s)` por tipo (ou uma
+passada nos dicts em memória), nunca uma por linha.
+"""
+from fastapi import HTTPException
+
+from crud.albuns import albuns_por_ids
+from crud.users import usuarios_por_ids
+
+MUSICA_CAMPOS = ("id_musica", "nome", "genero", "duracao_seg", "id_album", "id_usuario", "created_at")
+
+# include -> (chave estrangeira na linha, carregador em lote, tag de cache)
+MUSICA_INCLUDES = {
+    "album": ("id_album", albuns_por_ids, "album"),
+    "autor": ("id_usuario", usuarios_por_ids, "usuario"),
+}
+ALBUM_INCLUDES = {
+    "autor": ("id_usuario", usuarios_por_ids, "usuario"),
+}
+
+
+def _lista(valor: str | None):
+    return [v.strip() for v in (valor or "").split(",") if v.strip()]
+
+
+def parse_include(include: str | None, permitidos=MUSICA_INCLUDES) -> tuple:
+    nomes = _lista(include)
+    invalidos = [n for n in nomes if n not in permitidos]
+    if invalidos:
+        raise HTTPException(
+            status_code=400,
+            detail=f"include inválido: {', '.join(invalidos)} (use {', '.join(permitidos)}).",
+        )
+    return tuple(dict.fromkeys(nomes))
+
+
+def parse_fields(fields: str | None, include=(), permitidos=MUSICA_CAMPOS, chave=("id_musica",),
+                 relacoes=MUSICA_INCLUDES):
+    """
+    Colunas pedidas em `fields`, na ordem da tabela, mais as obrigatórias;
+    None quando `fields` não veio (= todas as colunas).
+    """
+    nomes = _lista(fields)
+    if not nomes:
+        return None
+    invalidos = [n for n in nomes if n not in permitidos]
+    if invalidos:
+        raise HTTPException(
+            status_code=400,
+            detail=f"fields inválido: {', '.join(invalidos)} (use {', '.join(permitidos)}).",
+        )
+    pedidos = set(nomes) | set(chave) | {relacoes[i][0] for i in include if i in relacoes}
+    return tuple(c for c in permitidos if c in pedidos)
+
+
+def select_list(campos, alias: str = "") -> str:
+    """Lista de colunas para o SELECT (`*` sem `fields`). Só aceita nomes já validados."""
+    prefixo = f"{alias}." if alias else ""
+    if not campos:
+        return f"{prefixo}*"
+    return ", ".join(f"{prefixo}{c}" for c in campos)
+
+
+def projetar(rows, campos, extras=()):
+    """Projeção das linhas em memória (as do Postgres já vêm projetadas)."""
+    if not campos:
+        return rows
+    keep = (*campos, *extras)
+    return [{k: row[k] for k in keep if k in row} for row in rows]
+
+
+def incluir(page, include, capa_url=None, relacoes=MUSICA_INCLUDES):
+    """
+    Embute os relacionados pedidos em cada linha de `page` (no lugar, para
+    preservar o cursor da `Page`). Linhas novas: as da `MemoryDB` não mudam.
+    `capa_url(id_album)` acrescenta a URL versionada da capa ao álbum.
+    """
+    if not include or not page:
+        return page
+    embutidos = {}
+    for nome in include:
+        fk, carregar, _ = relacoes[nome]
+        ids = {row[fk] for row in page if row.get(fk) is not None}
+        por_id = carregar(ids)
+        if nome == "album" and capa_url is not None:
+            por_id = {aid: {**album, "capa": capa_url(aid)} for aid, album in por_id.items()}
+        embutidos[nome] = (fk, por_id)
+    page[:] = [
+        {**row, **{nome: por_id.get(row.get(fk)) for nome, (fk, por_id) in embutidos.items()}}
+        for row in page
+    ]
+    return page
+
+
+def include_tags(page, include, relacoes=MUSICA_INCLUDES):
+    """Tags de cache das entidades embutidas (renomear o álbum invalida a página)."""
+    tags = []
+    for nome in include:
+        fk, _, tag = relacoes[nome]
+        tags.extend(f"{tag}:{i}" for i in {row.get(fk) for row in page} if i is not None)
+    return tags
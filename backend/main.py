@@ -1,21 +1,58 @@
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException
-from fastapi.responses import FileResponse
+from contextlib import asynccontextmanager
+import anyio
+from fastapi import Depends, FastAPI, File, UploadFile, Form, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
 from typing import Optional
-from schemas import UserCreate, UserOut, Login
-from auth import login_user
+from schemas import UserCreate, UserOut, Login, PlaylistBulk, PlaylistMover
+from auth import login_user_async, require_admin
 from crud.users import create_user
-from crud.musicas import listar_musicas, listar_por_genero, listar_por_artista
+from crud.musicas import (
+    buscar_musicas_por_ids,
+    exportar_musicas,
+    listar_musicas,
+    listar_por_genero,
+    listar_por_artista,
+    listar_musicas_do_album,
+)
 from crud.playlists import (
     criar_playlist,
     adicionar_musica,
+    alterar_musicas_em_lote,
+    anexar_musica,
     listar_musicas_da_playlist,
+    listar_playlists_do_usuario,
+    listar_resumo_playlists,
     atualizar_nome_playlist,
+    mover_musica,
+)
+from crud.albuns import criar_album, atualizar_titulo_album, buscar_albuns, listar_albuns
+from hashing import HashingBusy, HASH_RETRY_AFTER, hash_password_async, hash_pool
+from covers import CoverVariants, SIZES, IMMUTABLE, negotiate_format, source_version
+from static_assets import StaticAssets
+from fast_json import FORMATOS_STREAM, NDJSON, FastJSONRoute, streaming_response
+import metrics
+import memory_store
+from metrics import MetricsMiddleware
+from slowlog import slow_log
+from cache import cached_response, invalidate, musica_tags, playlist_tags, catalog_cache
+from includes import ALBUM_INCLUDES, include_tags, incluir, parse_fields, parse_include
+from pagination import parse_ids
+from media import (
+    conditional_file_response,
+    MediaIndex,
+    MaxBodySizeMiddleware,
+    receive_upload,
+    commit_upload,
+    discard_upload,
 )
-from crud.albuns import criar_album, atualizar_titulo_album
 import os
 from pathlib import Path
 from database import (
     get_conn,
+    close_pool,
+    pool_stats,
+    PoolTimeout,
     USE_MEMORY_DB,
     add_musica,
     update_musica,
@@ -23,9 +60,7 @@ from database import (
     delete_musica,
     get_user_by_id,
     delete_album,
-    add_musica_playlist,
     remove_musica_playlist,
-    playlists_by_user,
     musicas_por_album,
     deletar_playlist,
 )
@@ -34,7 +69,57 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.responses import RedirectResponse, FileResponse
 
 
-app = FastAPI(title="Streaming Musical - Backend")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # modo memória com MEMORY_DB_DIR: snapshot + log antes de atender
+    app.state.memory_store = memory_store.abrir_do_ambiente()
+    # avisa ao `media.py reconcile --relocate` que há servidor usando os diretórios
+    song_index.marcar_em_uso()
+    cover_index.marcar_em_uso()
+    yield
+    song_index.liberar_uso()
+    cover_index.liberar_uso()
+    hash_pool.shutdown()
+    close_pool()
+    if app.state.memory_store is not None:
+        app.state.memory_store.fechar()
+
+
+app = FastAPI(title="Streaming Musical - Backend", lifespan=lifespan)
+# rotas sem response_model serializam com orjson, sem passar pelo jsonable_encoder
+app.router.route_class = FastJSONRoute
+
+
+@app.exception_handler(PoolTimeout)
+async def pool_timeout_handler(request: Request, exc: PoolTimeout):
+    # pool esgotado: melhor recusar rápido do que empilhar requisições
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Banco de dados ocupado, tente novamente."},
+        headers={"Retry-After": "1"},
+    )
+
+
+@app.exception_handler(HashingBusy)
+async def hashing_busy_handler(request: Request, exc: HashingBusy):
+    # fila do Argon2 cheia: recusa já em vez de enfileirar mais requisições
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Servidor ocupado, tente novamente."},
+        headers={"Retry-After": str(HASH_RETRY_AFTER)},
+    )
+
+# Limites de upload (bytes); aplicados durante o recebimento, não depois
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(200 * 1024 * 1024)))
+MAX_COVER_BYTES = int(os.getenv("MAX_COVER_BYTES", str(10 * 1024 * 1024)))
+# folga para os outros campos e boundaries do multipart; a capa tem limite
+# próprio já no recebimento, senão valeria o das músicas até o fim do upload
+MULTIPART_FOLGA = 64 * 1024
+app.add_middleware(
+    MaxBodySizeMiddleware,
+    max_bytes=MAX_UPLOAD_BYTES + MULTIPART_FOLGA,
+    por_rota=[(r"/albuns/\d+/upload_capa", MAX_COVER_BYTES + MULTIPART_FOLGA)],
+)
 
 # ====================== CORS ======================
 app.add_middleware(
@@ -43,10 +128,24 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # o frontend segue o cursor das listagens paginadas
+    expose_headers=["X-Next-Cursor", "Link"],
 )
 
+# Métricas (mais externo: mede também CORS e limite de corpo)
+app.add_middleware(MetricsMiddleware)
+metrics.stream_routes.update({
+    "/musicas/{id_musica}/stream": "song",
+    "/albuns/{id_album}/capa": "cover",
+})
+
 FRONTEND_DIR = Path(__file__).resolve().parent.parent / "frontend"
-app.mount("/static", StaticFiles(directory=str(FRONTEND_DIR)), name="static")
+# STATIC_CACHE=0 volta para o StaticFiles simples (útil editando o front-end)
+if os.getenv("STATIC_CACHE", "1") != "0":
+    static_assets = StaticAssets(FRONTEND_DIR)
+    app.mount("/static", static_assets, name="static")
+else:
+    app.mount("/static", StaticFiles(directory=str(FRONTEND_DIR)), name="static")
 
 # Pastas de arquivos: tenta usar APP_MEDIA_DIR (env) ou backend/media; se não conseguir, cai para /tmp
 def _ensure_dir(path: Path):
@@ -76,13 +175,26 @@ COVERS_DIR = (MEDIA_ROOT / "covers")
 SONGS_DIR.mkdir(parents=True, exist_ok=True)
 COVERS_DIR.mkdir(parents=True, exist_ok=True)
 
+# Índices id -> arquivo (evitam glob no diretório a cada requisição).
+# MEDIA_SHARDED=1 grava em subpastas (songs/23/01/12301.mp3).
+MEDIA_SHARDED = os.getenv("MEDIA_SHARDED", "0") != "0"
+song_index = MediaIndex(SONGS_DIR, sharded=MEDIA_SHARDED, default_mime="audio/mpeg")
+cover_index = MediaIndex(COVERS_DIR, sharded=MEDIA_SHARDED, default_mime="image/jpeg")
+cover_variants = CoverVariants(cover_index)
+song_index.build()
+cover_index.build()
+
 # ============================================================
 # 🔵 RF01 — Autenticação (Cadastro e Login)
 # ============================================================
 
+# async: a espera pelo Argon2 é um await no pool de processos, sem prender
+# uma thread do threadpool (que as rotas síncronas usam) por hash em andamento
+
 @app.post("/register", response_model=UserOut)
-def register(user: UserCreate):
-    novo = create_user(user.nome, user.email, user.senha)
+async def register(user: UserCreate):
+    hashed = await hash_password_async(user.senha)
+    novo = await run_in_threadpool(create_user, user.nome, user.email, user.senha, hashed)
     return {
         "id_usuario": novo[0],
         "nome": novo[1],
@@ -90,31 +202,39 @@ def register(user: UserCreate):
     }
 
 @app.post("/login")
-def login(login: Login):
-    user = login_user(login.email, login.senha)
+async def login(login: Login):
+    user = await login_user_async(login.email, login.senha)
     if not user:
         raise HTTPException(status_code=401, detail="Credenciais inválidas")
     return user
 
 @app.get("/usuarios/{id_usuario}")
-def usuario_por_id(id_usuario: int):
+def usuario_por_id(id_usuario: int, request: Request = None, response: Response = None):
+    return cached_response(
+        request, response,
+        key=("usuario", id_usuario),
+        loader=lambda: _buscar_usuario(id_usuario),
+        tags=lambda _: [f"usuario:{id_usuario}"],
+    )
+
+
+def _buscar_usuario(id_usuario: int):
     if USE_MEMORY_DB:
         user = get_user_by_id(id_usuario)
         if not user:
             raise HTTPException(status_code=404, detail="Usuário não encontrado.")
         return {"id_usuario": user["id_usuario"], "nome": user["nome"], "email": user["email"]}
 
-    conn = get_conn()
-    cur = conn.cursor()
-    try:
-        cur.execute(
-            "SELECT id_usuario, nome, email FROM usuarios WHERE id_usuario=%s",
-            (id_usuario,),
-        )
-        row = cur.fetchone()
-    finally:
-        cur.close()
-        conn.close()
+    with get_conn() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute(
+                "SELECT id_usuario, nome, email FROM usuarios WHERE id_usuario=%s",
+                (id_usuario,),
+            )
+            row = cur.fetchone()
+        finally:
+            cur.close()
 
     if not row:
         raise HTTPException(status_code=404, detail="Usuário não encontrado.")
@@ -131,17 +251,122 @@ def usuario_por_id(id_usuario: int):
 # 🟢 RF02 — Catálogo (Listagem e Filtros)
 # ============================================================
 
+# Listagens paginadas por cursor: `limit` + `cursor`; o link da próxima
+# página vem nos headers `Link: <...>; rel="next"` e `X-Next-Cursor`.
+
+# `fields=` limita as colunas (até o SQL) e `include=album,autor` embute os
+# relacionados, carregados em lote por página.
+
+def _listagem_musicas(request, response, key, listar, tags, fields, include):
+    incl = parse_include(include)
+    campos = parse_fields(fields, incl)
+    return cached_response(
+        request, response,
+        key=(*key, campos, incl),
+        loader=lambda: incluir(listar(campos), incl, capa_url=_capa_url),
+        tags=lambda page: [*tags, *musica_tags(page), *include_tags(page, incl)],
+    )
+
+
+def _capa_url(id_album: int):
+    entry = cover_index.get(id_album)
+    if entry is None:
+        return None
+    return f"/albuns/{id_album}/capa?tamanho=card&v={source_version(entry)}"
+
+
 @app.get("/musicas")
-def todas_musicas(nome: Optional[str] = None, id_album: Optional[int] = None):
-    return listar_musicas(nome=nome, id_album=id_album)
+def todas_musicas(
+    nome: Optional[str] = None,
+    id_album: Optional[int] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    include: Optional[str] = None,
+    ids: Optional[str] = None,
+    request: Request = None,
+    response: Response = None,
+):
+    lote = parse_ids(ids)
+    if lote is not None:
+        # busca em lote (`ids=1,2,3`): uma consulta, na ordem pedida, sem paginação
+        return _listagem_musicas(
+            request, response,
+            key=("musicas_ids", tuple(lote)),
+            listar=lambda campos: buscar_musicas_por_ids(lote, campos),
+            tags=["musicas"],
+            fields=fields, include=include,
+        )
+    return _listagem_musicas(
+        request, response,
+        key=("musicas", nome, id_album, limit, cursor),
+        listar=lambda campos: listar_musicas(nome=nome, id_album=id_album, limit=limit, cursor=cursor, campos=campos),
+        tags=["musicas", id_album is not None and f"album:{id_album}"],
+        fields=fields, include=include,
+    )
+
+def _formato_stream(formato: Optional[str], request: Request) -> str:
+    """`formato=json|ndjson`; sem ele, NDJSON se o `Accept` pedir."""
+    if formato is None:
+        accept = request.headers.get("accept", "") if request is not None else ""
+        return "ndjson" if NDJSON in accept else "json"
+    if formato not in FORMATOS_STREAM:
+        raise HTTPException(status_code=400, detail=f"formato inválido: {formato} (use json ou ndjson).")
+    return formato
+
+
+@app.get("/musicas/export")
+def exportar_musicas_route(
+    genero: Optional[str] = None,
+    id_album: Optional[int] = None,
+    fields: Optional[str] = None,
+    formato: Optional[str] = None,
+    request: Request = None,
+):
+    """
+    Catálogo inteiro (ou de um gênero/álbum) sem paginação, em streaming:
+    array JSON ou NDJSON produzido lote a lote, sem passar pelo cache.
+    """
+    formato = _formato_stream(formato, request)
+    campos = parse_fields(fields)
+    return streaming_response(exportar_musicas(genero=genero, id_album=id_album, campos=campos), formato)
+
 
 @app.get("/musicas/genero/{genero}")
-def por_genero(genero: str):
-    return listar_por_genero(genero)
+def por_genero(
+    genero: str,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    include: Optional[str] = None,
+    request: Request = None,
+    response: Response = None,
+):
+    return _listagem_musicas(
+        request, response,
+        key=("genero", genero, limit, cursor),
+        listar=lambda campos: listar_por_genero(genero, limit=limit, cursor=cursor, campos=campos),
+        tags=[f"genero:{genero}"],
+        fields=fields, include=include,
+    )
 
 @app.get("/musicas/autor/{id_usuario}")
-def por_artista(id_usuario: int):
-    return listar_por_artista(id_usuario)
+def por_artista(
+    id_usuario: int,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    include: Optional[str] = None,
+    request: Request = None,
+    response: Response = None,
+):
+    return _listagem_musicas(
+        request, response,
+        key=("autor", id_usuario, limit, cursor),
+        listar=lambda campos: listar_por_artista(id_usuario, limit=limit, cursor=cursor, campos=campos),
+        tags=[f"autor:{id_usuario}"],
+        fields=fields, include=include,
+    )
 
 
 # ============================================================
@@ -162,61 +387,89 @@ async def criar_musica(
     if not arquivo.content_type.startswith("audio/"):
         raise HTTPException(status_code=400, detail="Arquivo enviado não é áudio válido.")
 
-    if USE_MEMORY_DB:
-        musica = add_musica(nome, genero, int(duracao_seg), int(id_album), int(id_usuario))
-        id_musica = musica["id_musica"]
-        if id_playlist is not None:
-            add_musica_playlist(int(id_playlist), id_musica)
-    else:
-        conn = get_conn()
-        cur = conn.cursor()
+    # 1 — Receber o arquivo em blocos (temporário + SHA-256, limite aplicado no stream)
+    staged = await receive_upload(arquivo, SONGS_DIR, MAX_UPLOAD_BYTES)
+    id_musica = None
+    try:
+        # 2 — Inserir música (+ playlist) fora do event loop
+        id_musica = await run_in_threadpool(
+            _inserir_musica, nome, genero, int(duracao_seg), int(id_album), int(id_usuario), id_playlist
+        )
 
-        # 1 — Inserir música
-        cur.execute("""
-            INSERT INTO musicas (nome, genero, duracao_seg, id_album, id_usuario)
-            VALUES (%s, %s, %s, %s, %s)
-            RETURNING id_musica;
-        """, (nome, genero, duracao_seg, id_album, id_usuario))
+        # 3 — Mover o arquivo para o lugar definitivo (rename atômico)
+        ext = Path(arquivo.filename).suffix.lower() or ".mp3"
+        destino = song_index.path_for(id_musica, ext)
+        await run_in_threadpool(commit_upload, staged, destino)
+    except BaseException:
+        discard_upload(staged)
+        if id_musica is not None:
+            # sem o arquivo a linha ficaria órfã (stream 404): desfaz o insert,
+            # mesmo se a requisição foi cancelada
+            with anyio.CancelScope(shield=True):
+                await run_in_threadpool(_apagar_musica, id_musica)
+        raise
+    await run_in_threadpool(song_index.add, id_musica, destino)
+    metrics.upload_bytes.inc("song", amount=staged.size)
 
-        row = cur.fetchone()
-        if not row:
-            cur.close()
-            conn.close()
-            raise HTTPException(status_code=500, detail="Falha ao criar música.")
-        # RealDictCursor retorna dict; tuple fallback se usar cursor default
-        id_musica = row["id_musica"] if isinstance(row, dict) else row[0]
+    return {
+        "message": "Música criada com sucesso!",
+        "id_musica": id_musica,
+        "playlist_vinculada": id_playlist,
+        "sha256": staged.sha256,
+    }
 
-        # 2 — Vincular playlist (opcional)
-        if id_playlist is not None:
-            cur.execute("""
-                INSERT INTO musica_playlist (id_playlist, id_musica)
-                VALUES (%s, %s)
-            """, (id_playlist, id_musica))
 
-        conn.commit()
-        cur.close()
-        conn.close()
+def _inserir_musica(nome, genero, duracao_seg, id_album, id_usuario, id_playlist):
+    id_musica = _gravar_musica(nome, genero, duracao_seg, id_album, id_usuario, id_playlist)
+    invalidate(
+        "musicas",
+        f"genero:{genero}",
+        f"album:{id_album}",
+        f"autor:{id_usuario}",
+        id_playlist is not None and f"playlist:{id_playlist}",
+    )
+    return id_musica
 
-    # 3 — Salvar arquivo (leitura síncrona para evitar uso de threadpool em ambientes restritos)
-    ext = Path(arquivo.filename).suffix.lower() or ".mp3"
-    destino = SONGS_DIR / f"{id_musica}{ext}"
 
-    with destino.open("wb") as f:
-        data = arquivo.file.read()
-        f.write(data)
+def _gravar_musica(nome, genero, duracao_seg, id_album, id_usuario, id_playlist):
+    if USE_MEMORY_DB:
+        musica = add_musica(nome, genero, duracao_seg, id_album, id_usuario)
+        id_musica = musica["id_musica"]
+        if id_playlist is not None:
+            adicionar_musica(int(id_playlist), id_musica)
+        return id_musica
 
-    return {
-        "message": "Música criada com sucesso!",
-        "id_musica": id_musica,
-        "playlist_vinculada": id_playlist
-    }
+    with get_conn() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute("""
+                INSERT INTO musicas (nome, genero, duracao_seg, id_album, id_usuario)
+                VALUES (%s, %s, %s, %s, %s)
+                RETURNING id_musica;
+            """, (nome, genero, duracao_seg, id_album, id_usuario))
+
+            row = cur.fetchone()
+            if not row:
+                raise HTTPException(status_code=500, detail="Falha ao criar música.")
+            # RealDictCursor retorna dict; tuple fallback se usar cursor default
+            id_musica = row["id_musica"] if isinstance(row, dict) else row[0]
+
+            # Vincular playlist (opcional)
+            if id_playlist is not None:
+                anexar_musica(cur, id_playlist, id_musica)
+
+            conn.commit()
+        finally:
+            cur.close()
+    return id_musica
 
 
-# Stream de áudio
+# Stream de áudio (Range/206, ETag e 304 para seek e replay sem re-download)
 @app.get("/musicas/{id_musica}/stream")
-def stream_musica(id_musica: int):
-    for file in SONGS_DIR.glob(f"{id_musica}.*"):
-        return FileResponse(file, media_type="audio/mpeg")
+def stream_musica(id_musica: int, request: Request = None):
+    entry = song_index.get(id_musica)
+    if entry is not None:
+        return conditional_file_response(request, entry.path, entry.mime, stat_result=entry.stat)
     raise HTTPException(status_code=404, detail="Arquivo de música não encontrado.")
 
 
@@ -227,25 +480,27 @@ def editar_musica(id_musica: int, nome: str = Form(...), genero: str = Form(...)
         ok = update_musica(id_musica, nome, genero, int(duracao_seg))
         if not ok:
             raise HTTPException(status_code=404, detail="Música não encontrada.")
+        _invalidar_musica_editada(id_musica, genero)
         return {"message": "Música atualizada."}
 
-    conn = get_conn()
-    cur = conn.cursor()
-
-    cur.execute("""
-        UPDATE musicas
-        SET nome=%s, genero=%s, duracao_seg=%s
-        WHERE id_musica=%s
-        RETURNING id_musica;
-    """, (nome, genero, duracao_seg, id_musica))
-
-    updated = cur.fetchone()
-    conn.commit()
-    cur.close()
-    conn.close()
+    with get_conn() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute("""
+                UPDATE musicas
+                SET nome=%s, genero=%s, duracao_seg=%s
+                WHERE id_musica=%s
+                RETURNING id_musica;
+            """, (nome, genero, duracao_seg, id_musica))
+
+            updated = cur.fetchone()
+            conn.commit()
+        finally:
+            cur.close()
 
     if not updated:
         raise HTTPException(status_code=404, detail="Música não encontrada.")
+    _invalidar_musica_editada(id_musica, genero)
 
     return {"message": "Música atualizada."}
 
@@ -256,57 +511,68 @@ def editar_musica_metadata(id_musica: int, nome: str = Form(...), genero: str =
         ok = update_musica_metadata(id_musica, nome, genero)
         if not ok:
             raise HTTPException(status_code=404, detail="Música não encontrada.")
+        _invalidar_musica_editada(id_musica, genero)
         return {"message": "Música atualizada."}
 
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        UPDATE musicas
-        SET nome=%s, genero=%s
-        WHERE id_musica=%s
-        RETURNING id_musica;
-        """,
-        (nome, genero, id_musica),
-    )
-    updated = cur.fetchone()
-    conn.commit()
-    cur.close()
-    conn.close()
+    with get_conn() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute(
+                """
+                UPDATE musicas
+                SET nome=%s, genero=%s
+                WHERE id_musica=%s
+                RETURNING id_musica;
+                """,
+                (nome, genero, id_musica),
+            )
+            updated = cur.fetchone()
+            conn.commit()
+        finally:
+            cur.close()
     if not updated:
         raise HTTPException(status_code=404, detail="Música não encontrada.")
+    _invalidar_musica_editada(id_musica, genero)
     return {"message": "Música atualizada."}
 
 
+def _invalidar_musica_editada(id_musica: int, genero: str):
+    # listas que já contêm a música + busca por nome + lista do gênero novo
+    invalidate(f"musica:{id_musica}", "musicas", f"genero:{genero}", "playlists:resumo")
+
+
 # Remover música
 @app.delete("/musicas/{id_musica}")
 def deletar_musica(id_musica: int):
-    if USE_MEMORY_DB:
-        ok = delete_musica(id_musica)
-        if not ok:
-            raise HTTPException(status_code=404, detail="Música não encontrada.")
-    else:
-        conn = get_conn()
-        cur = conn.cursor()
-
-        cur.execute("DELETE FROM musica_playlist WHERE id_musica=%s;", (id_musica,))
-        cur.execute("DELETE FROM musicas WHERE id_musica=%s RETURNING id_musica;", (id_musica,))
-        deleted = cur.fetchone()
-
-        conn.commit()
-        cur.close()
-        conn.close()
-
-        if not deleted:
-            raise HTTPException(status_code=404, detail="Música não encontrada.")
+    if not _apagar_musica(id_musica):
+        raise HTTPException(status_code=404, detail="Música não encontrada.")
 
     # Remover arquivo físico
-    for f in SONGS_DIR.glob(f"{id_musica}.*"):
-        f.unlink(missing_ok=True)
+    song_index.remove(id_musica)
 
     return {"message": "Música deletada."}
 
 
+def _apagar_musica(id_musica: int) -> bool:
+    """Apaga a linha (e as relações com playlists) e invalida o cache; False se não existia."""
+    if USE_MEMORY_DB:
+        deleted = delete_musica(id_musica)
+    else:
+        with get_conn() as conn:
+            cur = conn.cursor()
+            try:
+                cur.execute("DELETE FROM musica_playlist WHERE id_musica=%s;", (id_musica,))
+                cur.execute("DELETE FROM musicas WHERE id_musica=%s RETURNING id_musica;", (id_musica,))
+                deleted = cur.fetchone()
+                conn.commit()
+            finally:
+                cur.close()
+    if not deleted:
+        return False
+    invalidate(f"musica:{id_musica}", "playlists:resumo", "albuns")
+    return True
+
+
 # ============================================================
 # 🟡 RF04 / RF05 — Playlists
 # ============================================================
@@ -317,12 +583,28 @@ def criar_playlist_route(id_dono: int, nome: str):
 
 @app.post("/playlists/{id_playlist}/add/{id_musica}")
 def add_music(id_playlist: int, id_musica: int):
-    if USE_MEMORY_DB:
-        add_musica_playlist(id_playlist, id_musica)
-    else:
-        adicionar_musica(id_playlist, id_musica)
+    # invalida o cache (inclusive a lista do dono, se a playlist foi criada na hora)
+    adicionar_musica(id_playlist, id_musica)
     return {"message": "Música adicionada à playlist."}
 
+# Adicionar/remover várias músicas de uma vez (uma transação só)
+@app.post("/playlists/{id_playlist}/musicas/bulk")
+def alterar_musicas_playlist(id_playlist: int, lote: PlaylistBulk):
+    resultado = alterar_musicas_em_lote(id_playlist, lote.add, lote.remove)
+    if resultado is None:
+        raise HTTPException(status_code=404, detail="Playlist não encontrada.")
+    return {"id_playlist": id_playlist, **resultado}
+
+# Reordenar: a faixa vai para antes de `antes_de` ou depois de `depois_de`
+@app.post("/playlists/{id_playlist}/musicas/{id_musica}/mover")
+def mover_musica_playlist_route(id_playlist: int, id_musica: int, destino: PlaylistMover):
+    if (destino.antes_de is None) == (destino.depois_de is None):
+        raise HTTPException(status_code=400, detail="Informe antes_de ou depois_de (só um).")
+    posicao = mover_musica(id_playlist, id_musica, destino.antes_de, destino.depois_de)
+    if posicao is None:
+        raise HTTPException(status_code=404, detail="Música não encontrada na playlist.")
+    return {"id_playlist": id_playlist, "id_musica": id_musica, "posicao": posicao}
+
 @app.delete("/playlists/{id_playlist}/musicas/{id_musica}")
 def remover_musica_playlist(id_playlist: int, id_musica: int):
     if USE_MEMORY_DB:
@@ -330,23 +612,23 @@ def remover_musica_playlist(id_playlist: int, id_musica: int):
         if not ok:
             raise HTTPException(status_code=404, detail="Relação não encontrada.")
     else:
-        conn = get_conn()
-        cur = conn.cursor()
-
-        cur.execute("""
-            DELETE FROM musica_playlist
-            WHERE id_playlist=%s AND id_musica=%s
-            RETURNING id_playlist;
-        """, (id_playlist, id_musica))
-
-        row = cur.fetchone()
-        conn.commit()
-        cur.close()
-        conn.close()
+        with get_conn() as conn:
+            cur = conn.cursor()
+            try:
+                cur.execute("""
+                    DELETE FROM musica_playlist
+                    WHERE id_playlist=%s AND id_musica=%s
+                    RETURNING id_playlist;
+                """, (id_playlist, id_musica))
+                row = cur.fetchone()
+                conn.commit()
+            finally:
+                cur.close()
 
         if not row:
             raise HTTPException(status_code=404, detail="Relação não encontrada.")
 
+    invalidate(f"playlist:{id_playlist}")
     return {"message": "Música removida da playlist."}
 
 @app.delete("/playlists/{id_playlist}")
@@ -356,39 +638,73 @@ def excluir_playlist(id_playlist: int):
         if not ok:
             raise HTTPException(status_code=404, detail="Playlist não encontrada.")
     else:
-        conn = get_conn()
-        cur = conn.cursor()
-        # apaga relações e a playlist
-        cur.execute("DELETE FROM musica_playlist WHERE id_playlist=%s;", (id_playlist,))
-        cur.execute("DELETE FROM playlists WHERE id_playlist=%s RETURNING id_playlist;", (id_playlist,))
-        row = cur.fetchone()
-        conn.commit()
-        cur.close()
-        conn.close()
+        with get_conn() as conn:
+            cur = conn.cursor()
+            try:
+                # apaga relações e a playlist
+                cur.execute("DELETE FROM musica_playlist WHERE id_playlist=%s;", (id_playlist,))
+                cur.execute("DELETE FROM playlists WHERE id_playlist=%s RETURNING id_playlist;", (id_playlist,))
+                row = cur.fetchone()
+                conn.commit()
+            finally:
+                cur.close()
         if not row:
             raise HTTPException(status_code=404, detail="Playlist não encontrada.")
+    # as listas de playlists do dono também levam a tag playlist:<id>
+    invalidate(f"playlist:{id_playlist}")
     return {"message": "Playlist deletada."}
 
 
 @app.get("/usuarios/{id_usuario}/playlists")
-def playlists_usuario(id_usuario: int):
-    if USE_MEMORY_DB:
-        return playlists_by_user(id_usuario)
-
-    conn = get_conn()
-    cur = conn.cursor()
+def playlists_usuario(
+    id_usuario: int,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    request: Request = None,
+    response: Response = None,
+):
+    return cached_response(
+        request, response,
+        key=("playlists_usuario", id_usuario, limit, cursor),
+        loader=lambda: listar_playlists_do_usuario(id_usuario, limit=limit, cursor=cursor),
+        tags=lambda page: [f"usuario:{id_usuario}:playlists", *playlist_tags(page)],
+    )
 
-    cur.execute("SELECT * FROM playlists WHERE id_dono=%s;", (id_usuario,))
-    rows = cur.fetchall()
 
-    cur.close()
-    conn.close()
-    return [dict(r) for r in rows]
+# Cards da tela de playlists: contagem, duração e capas sem N+1
+@app.get("/usuarios/{id_usuario}/playlists/resumo")
+def resumo_playlists_usuario(
+    id_usuario: int,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    request: Request = None,
+    response: Response = None,
+):
+    return cached_response(
+        request, response,
+        key=("resumo_playlists", id_usuario, limit, cursor),
+        loader=lambda: listar_resumo_playlists(id_usuario, limit=limit, cursor=cursor),
+        tags=lambda page: [f"usuario:{id_usuario}:playlists", "playlists:resumo", *playlist_tags(page)],
+    )
 
 
 @app.get("/playlists/{id_playlist}/musicas")
-def musicas_da_playlist_route(id_playlist: int):
-    return listar_musicas_da_playlist(id_playlist)
+def musicas_da_playlist_route(
+    id_playlist: int,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    include: Optional[str] = None,
+    request: Request = None,
+    response: Response = None,
+):
+    return _listagem_musicas(
+        request, response,
+        key=("playlist", id_playlist, limit, cursor),
+        listar=lambda campos: listar_musicas_da_playlist(id_playlist, limit=limit, cursor=cursor, campos=campos),
+        tags=[f"playlist:{id_playlist}"],
+        fields=fields, include=include,
+    )
 
 
 @app.put("/playlists/{id_playlist}")
@@ -407,49 +723,103 @@ def renomear_playlist_route(id_playlist: int, nome: str = Form(...)):
 def criar_album_route(titulo: str, ano: int, id_usuario: int):
     return criar_album(titulo, ano, id_usuario)
 
-@app.get("/albuns/{id_album}/musicas")
-def musicas_do_album(id_album: int):
-    if USE_MEMORY_DB:
-        return musicas_por_album(id_album)
-
-    conn = get_conn()
-    cur = conn.cursor()
-
-    cur.execute("SELECT * FROM musicas WHERE id_album=%s", (id_album,))
-    rows = cur.fetchall()
-
-    cur.close()
-    conn.close()
+# Listagem paginada com filtros, ou busca em lote com `ids=1,2,3`
+# (os demais filtros são ignorados). Cada álbum vem com `qtd_musicas`.
+@app.get("/albuns")
+def listar_albuns_route(
+    id_usuario: Optional[int] = None,
+    ano_min: Optional[int] = None,
+    ano_max: Optional[int] = None,
+    titulo: Optional[str] = None,
+    ids: Optional[str] = None,
+    include: Optional[str] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    request: Request = None,
+    response: Response = None,
+):
+    incl = parse_include(include, ALBUM_INCLUDES)
+    lote = parse_ids(ids)
+    if lote is not None:
+        key = ("albuns_ids", tuple(lote), incl)
+    else:
+        key = ("albuns", id_usuario, ano_min, ano_max, titulo, limit, cursor, incl)
+
+    def loader():
+        if lote is not None:
+            page = buscar_albuns(lote)
+        else:
+            page = listar_albuns(id_usuario, ano_min, ano_max, titulo, limit=limit, cursor=cursor)
+        for album in page:
+            album["capa"] = _capa_url(album["id_album"])
+        return incluir(page, incl, relacoes=ALBUM_INCLUDES)
+
+    return cached_response(
+        request, response,
+        key=key,
+        loader=loader,
+        tags=lambda page: [
+            "albuns",
+            *(f"album:{a['id_album']}" for a in page),
+            *include_tags(page, incl, ALBUM_INCLUDES),
+        ],
+    )
 
-    return [dict(r) for r in rows]
+@app.get("/albuns/{id_album}/musicas")
+def musicas_do_album(
+    id_album: int,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    include: Optional[str] = None,
+    request: Request = None,
+    response: Response = None,
+):
+    return _listagem_musicas(
+        request, response,
+        key=("album", id_album, limit, cursor),
+        listar=lambda campos: listar_musicas_do_album(id_album, limit=limit, cursor=cursor, campos=campos),
+        tags=[f"album:{id_album}"],
+        fields=fields, include=include,
+    )
 
 
 @app.delete("/albuns/{id_album}")
 def excluir_album(id_album: int):
     removed_files = []
     if USE_MEMORY_DB:
+        ids = [m["id_musica"] for m in musicas_por_album(id_album)]
         ok = delete_album(id_album)
         if not ok:
             raise HTTPException(status_code=404, detail="Álbum não encontrado.")
+        removed_files = ids
     else:
-        conn = get_conn()
-        cur = conn.cursor()
-        # pega ids das músicas para remover arquivos depois
-        cur.execute("SELECT id_musica FROM musicas WHERE id_album=%s;", (id_album,))
-        ids = [r[0] if not isinstance(r, dict) else r["id_musica"] for r in cur.fetchall()]
-        cur.execute("DELETE FROM albuns WHERE id_album=%s RETURNING id_album;", (id_album,))
-        row = cur.fetchone()
-        conn.commit()
-        cur.close()
-        conn.close()
+        with get_conn() as conn:
+            cur = conn.cursor()
+            try:
+                # pega ids das músicas para remover arquivos depois
+                cur.execute("SELECT id_musica FROM musicas WHERE id_album=%s;", (id_album,))
+                ids = [r[0] if not isinstance(r, dict) else r["id_musica"] for r in cur.fetchall()]
+                cur.execute("DELETE FROM albuns WHERE id_album=%s RETURNING id_album;", (id_album,))
+                row = cur.fetchone()
+                conn.commit()
+            finally:
+                cur.close()
         if not row:
             raise HTTPException(status_code=404, detail="Álbum não encontrado.")
         removed_files = ids
 
-    # remove arquivos físicos das músicas do álbum (se existirem)
+    invalidate(
+        f"album:{id_album}",
+        "playlists:resumo",
+        *musica_tags({"id_musica": mid} for mid in removed_files),
+    )
+
+    # remove arquivos físicos das músicas do álbum (se existirem) e a capa
     for mid in removed_files:
-        for f in SONGS_DIR.glob(f"{mid}.*"):
-            f.unlink(missing_ok=True)
+        song_index.remove(mid)
+    cover_index.remove(id_album)
+    cover_variants.purge(id_album)
 
     return {"message": "Álbum deletado."}
 
@@ -468,27 +838,128 @@ async def upload_capa(id_album: int, arquivo: UploadFile = File(...)):
     if not arquivo.content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="Arquivo enviado não é imagem.")
 
+    staged = await receive_upload(arquivo, COVERS_DIR, MAX_COVER_BYTES)
     ext = Path(arquivo.filename).suffix.lower() or ".jpg"
-    destino = COVERS_DIR / f"{id_album}{ext}"
-
-    with destino.open("wb") as f:
-        data = arquivo.file.read()
-        f.write(data)
-
-    return {"message": "Capa enviada."}
+    destino = cover_index.path_for(id_album, ext)
+    try:
+        await run_in_threadpool(commit_upload, staged, destino)
+    except BaseException:
+        discard_upload(staged)
+        raise
+    entry = await run_in_threadpool(cover_index.add, id_album, destino)
+    await run_in_threadpool(cover_variants.purge, id_album)
+    metrics.upload_bytes.inc("cover", amount=staged.size)
+    invalidate(f"album:{id_album}")  # URLs versionadas embutidas via include=album
+
+    versao = source_version(entry)
+    return {
+        "message": "Capa enviada.",
+        "sha256": staged.sha256,
+        "variantes": {t: f"/albuns/{id_album}/capa?tamanho={t}&v={versao}" for t in SIZES},
+    }
 
 
 @app.get("/albuns/{id_album}/capa")
-def get_capa(id_album: int):
-    for f in COVERS_DIR.glob(f"{id_album}.*"):
-        return FileResponse(f, media_type="image/jpeg")
-
-    raise HTTPException(status_code=404, detail="Capa não encontrada.")
+def get_capa(id_album: int, tamanho: Optional[str] = None, v: Optional[str] = None, request: Request = None):
+    """
+    Sem `tamanho` devolve o original; com `tamanho` (thumb, card, full) uma
+    variante redimensionada no melhor formato aceito pelo cliente. URLs com a
+    versão atual em `v` (as devolvidas pelo upload) são cacheadas como imutáveis.
+    """
+    if tamanho is not None and tamanho not in SIZES:
+        raise HTTPException(status_code=400, detail=f"tamanho deve ser um de: {', '.join(SIZES)}.")
+
+    if tamanho is None:
+        entry = cover_index.get(id_album)
+        found = entry and (entry.path, entry.mime, source_version(entry))
+    else:
+        accept = request.headers.get("accept") if request is not None else None
+        found = cover_variants.get(id_album, tamanho, negotiate_format(accept))
+    if not found:
+        raise HTTPException(status_code=404, detail="Capa não encontrada.")
+
+    path, mime, versao = found
+    resp = conditional_file_response(
+        request, path,
+        media_type=mime,
+        cache_control=IMMUTABLE if v == versao else "public, no-cache",
+    )
+    if tamanho is not None:
+        resp.headers["Vary"] = "Accept"
+    return resp
 
 @app.get("/ping")
 def ping():
     return {"status": "ok"}
 
+@app.get("/admin/pool")
+def pool_metrics():
+    return {"pool": pool_stats()}
+
+@app.get("/metrics", include_in_schema=False)
+def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@metrics.registry.add_collector
+def _metricas_de_estado():
+    """Gauges lidos na hora do scrape: pool do banco, fila do Argon2, cache."""
+    found = []
+    pool = pool_stats()
+    if pool is not None:
+        found.append(("db_pool_connections", "gauge", "Conexões do pool por estado.",
+                      [({"state": k}, pool[k]) for k in ("in_use", "idle", "waiting")]))
+        found.append(("db_pool_timeouts_total", "counter", "Esperas por conexão que estouraram o timeout.",
+                      [({}, pool["timeouts"])]))
+    h = hash_pool.stats()
+    found.append(("password_hash_queue", "gauge", "Pedidos de hash em execução e na fila.",
+                  [({"state": "in_flight"}, h["in_flight"]), ({"state": "queued"}, h["queued"])]))
+    found.append(("password_hash_total", "counter", "Hashes/verificações Argon2 por resultado.",
+                  [({"result": k}, h[k]) for k in ("completed", "rejected", "failed", "rehashed")]))
+    found.append(("password_hash_queue_wait_seconds_total", "counter", "Tempo total de espera na fila do Argon2.",
+                  [({}, h["queue_wait_seconds_total"])]))
+    c = catalog_cache.stats()
+    found.append(("catalog_cache_requests_total", "counter", "Leituras do cache do catálogo.",
+                  [({"result": "hit"}, c["hits"]), ({"result": "miss"}, c["misses"])]))
+    return found
+
+
+@app.get("/admin/slow-queries")
+def consultas_lentas():
+    return slow_log.snapshot()
+
+@app.delete("/admin/slow-queries", dependencies=[Depends(require_admin)])
+def limpar_consultas_lentas():
+    slow_log.clear()
+    return {"message": "Registro de consultas lentas limpo."}
+
+@app.get("/admin/memory-store")
+def memory_store_stats():
+    store = getattr(app.state, "memory_store", None)
+    return {"memory_store": store.stats() if store is not None else None}
+
+@app.post("/admin/memory-store/snapshot", dependencies=[Depends(require_admin)])
+def memory_store_snapshot():
+    store = getattr(app.state, "memory_store", None)
+    if store is None:
+        raise HTTPException(status_code=409, detail="Persistência da MemoryDB desligada (MEMORY_DB_DIR).")
+    return {"snapshot": store.snapshot(), **store.stats()}
+
+@app.get("/admin/hashing")
+def hashing_metrics():
+    return {"hashing": hash_pool.stats()}
+
+@app.post("/admin/media/reconcile", dependencies=[Depends(require_admin)])
+def reconciliar_midia(relocate: bool = False):
+    try:
+        return {
+            "songs": song_index.reconcile(relocate=relocate),
+            "covers": cover_index.reconcile(relocate=relocate),
+        }
+    except RuntimeError as exc:
+        # realocar só com o servidor parado: `python media.py reconcile --relocate`
+        raise HTTPException(status_code=409, detail=str(exc))
+
 @app.get("/")
 def root():
     return RedirectResponse(url="/static/index.html")
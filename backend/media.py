@@ -0,0 +1,480 @@
+"""
+Helpers para armazenar e servir arquivos de mídia (músicas e capas).
+
+O `FileResponse` do Starlette já trata `Range`/`If-Range` (inclusive
+multi-range com `multipart/byteranges`); aqui completamos com ETag forte,
+`Last-Modified` e respostas 304 para `If-None-Match`/`If-Modified-Since`.
+"""
+import hashlib
+import mimetypes
+import os
+import re
+import tempfile
+import threading
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import NamedTuple
+
+from fastapi import HTTPException, Request, Response, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, JSONResponse
+
+try:
+    import fcntl
+except ImportError:  # noqa: W0705 - sem flock (Windows) não dá para detectar o servidor
+    fcntl = None
+
+# mimetypes não conhece alguns formatos de áudio comuns em todas as plataformas
+for _ext, _type in (
+    (".mp3", "audio/mpeg"),
+    (".flac", "audio/flac"),
+    (".ogg", "audio/ogg"),
+    (".oga", "audio/ogg"),
+    (".opus", "audio/opus"),
+    (".m4a", "audio/mp4"),
+    (".aac", "audio/aac"),
+    (".wav", "audio/wav"),
+    (".weba", "audio/webm"),
+    (".webp", "image/webp"),
+    (".avif", "image/avif"),
+):
+    mimetypes.add_type(_type, _ext)
+
+
+def guess_media_type(path, default="application/octet-stream"):
+    return mimetypes.guess_type(str(path))[0] or default
+
+
+def strong_etag(stat_result):
+    """ETag forte derivada de inode, tamanho e mtime (ns) do arquivo."""
+    return f'"{stat_result.st_ino:x}-{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"'
+
+
+def etag_matches(header_value, etag):
+    # If-None-Match usa comparação fraca: ignora o prefixo W/
+    if header_value.strip() == "*":
+        return True
+    for tag in header_value.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+
+def is_not_modified(request_headers, etag, mtime):
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-None-Match tem precedência sobre If-Modified-Since (RFC 9110)
+        return etag_matches(if_none_match, etag)
+
+    if_modified_since = request_headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        return int(mtime) <= since.timestamp()
+    return False
+
+
+def conditional_file_response(
+    request: Request | None,
+    path,
+    media_type=None,
+    cache_control="public, no-cache",
+    stat_result=None,
+):
+    """
+    Responde com 304 quando o cliente já tem a versão atual do arquivo; caso
+    contrário devolve um `FileResponse` (200 ou 206 com Range).
+    """
+    st = stat_result or os.stat(path)
+    etag = strong_etag(st)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(st.st_mtime, usegmt=True),
+        "Cache-Control": cache_control,
+        "Accept-Ranges": "bytes",
+    }
+
+    if request is not None and request.method in ("GET", "HEAD"):
+        if is_not_modified(request.headers, etag, st.st_mtime):
+            return Response(status_code=304, headers=headers)
+
+    return FileResponse(
+        path,
+        media_type=media_type or guess_media_type(path),
+        headers=headers,
+        stat_result=st,
+    )
+
+
+# Índice de arquivos de mídia ------------------------------------------------
+
+class MediaEntry(NamedTuple):
+    path: Path
+    stat: os.stat_result
+    mime: str
+
+    @property
+    def size(self):
+        return self.stat.st_size
+
+    @property
+    def mtime(self):
+        return self.stat.st_mtime
+
+
+class MediaIndex:
+    """
+    Mapa id -> arquivo em memória para um diretório de mídia.
+
+    Evita um `glob` (varredura do diretório) a cada requisição: o índice é
+    montado uma vez com `os.scandir` e mantido pelos caminhos de upload e
+    remoção. Com `sharded=True` os arquivos ficam em subpastas derivadas do id
+    (`songs/23/01/12301.mp3`) para nenhum diretório crescer sem limite.
+
+    Com vários workers cada processo tem o seu índice, e uploads/remoções
+    feitos por outro worker só aparecem no disco. Por isso `get` confere a
+    entrada com um `stat` e, quando não acha o id, procura o arquivo no lugar
+    canônico (a pasta do shard, ou as extensões conhecidas no modo plano)
+    antes de desistir.
+    """
+
+    LOCK_NAME = ".servidor.lock"
+
+    def __init__(self, root: Path, sharded: bool = False, default_mime="application/octet-stream"):
+        self.root = Path(root)
+        self.sharded = sharded
+        self.default_mime = default_mime
+        self._entries = {}
+        # extensões tentadas no modo plano quando o id não está no índice
+        familia = default_mime.partition("/")[0] + "/"
+        self._exts = {ext for ext, mime in mimetypes.types_map.items() if mime.startswith(familia)}
+        self._lock = threading.Lock()
+        self._em_uso = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, media_id):
+        return media_id in self._entries
+
+    def path_for(self, media_id: int, ext: str) -> Path:
+        nome = f"{media_id}{ext}"
+        if not self.sharded:
+            return self.root / nome
+        digits = f"{media_id:04d}"
+        return self.root / digits[-2:] / digits[-4:-2] / nome
+
+    def _entry(self, path: Path, st=None):
+        st = st or os.stat(path)
+        return MediaEntry(Path(path), st, guess_media_type(path, self.default_mime))
+
+    def _scan(self):
+        found = {}
+        pending = [self.root]
+        while pending:
+            try:
+                it = os.scandir(pending.pop())
+            except FileNotFoundError:
+                continue
+            with it:
+                for de in it:
+                    if de.name.startswith("."):
+                        continue  # temporários de upload
+                    if de.is_dir(follow_symlinks=False):
+                        pending.append(de.path)
+                        continue
+                    stem, _, _ = de.name.partition(".")
+                    if not stem.isdigit():
+                        continue
+                    entry = self._entry(Path(de.path), de.stat())
+                    media_id = int(stem)
+                    atual = found.get(media_id)
+                    # ids duplicados (extensões diferentes): fica o mais novo
+                    if atual is None or entry.mtime > atual.mtime:
+                        found[media_id] = entry
+        return found
+
+    def build(self):
+        found = self._scan()
+        with self._lock:
+            self._entries = found
+            self._exts.update(e.path.suffix for e in found.values())
+        return len(found)
+
+    def get(self, media_id: int):
+        entry = atual = self._entries.get(media_id)
+        if entry is not None:
+            try:
+                st = os.stat(entry.path)
+            except FileNotFoundError:
+                entry = None  # removido ou trocado de extensão por outro worker
+            else:
+                if (st.st_ino, st.st_size, st.st_mtime_ns) == (
+                    entry.stat.st_ino, entry.stat.st_size, entry.stat.st_mtime_ns
+                ):
+                    return entry
+                entry = self._entry(entry.path, st)  # regravado por outro worker
+        if entry is None:
+            entry = self._procurar(media_id)
+        with self._lock:
+            # um `add` concorrente deste processo ganha do que veio do disco
+            if self._entries.get(media_id) is atual:
+                if entry is None:
+                    self._entries.pop(media_id, None)
+                else:
+                    self._entries[media_id] = entry
+        return entry
+
+    def _procurar(self, media_id: int):
+        """Arquivo de um id fora do índice, olhando só onde ele pode estar."""
+        if not self.sharded:
+            candidatos = []
+            for ext in tuple(self._exts):
+                try:
+                    candidatos.append(self._entry(self.path_for(media_id, ext)))
+                except FileNotFoundError:
+                    continue
+            return max(candidatos, key=lambda e: e.mtime, default=None)
+
+        prefixo = f"{media_id}."
+        melhor = None
+        try:
+            it = os.scandir(self.path_for(media_id, "").parent)
+        except FileNotFoundError:
+            return None
+        with it:
+            for de in it:
+                if de.name.startswith(prefixo) and de.is_file():
+                    entry = self._entry(Path(de.path), de.stat())
+                    if melhor is None or entry.mtime > melhor.mtime:
+                        melhor = entry
+        return melhor
+
+    def add(self, media_id: int, path: Path):
+        """Registra (ou substitui) o arquivo de um id; apaga o antigo se o caminho mudou."""
+        entry = self._entry(path)
+        with self._lock:
+            self._exts.add(entry.path.suffix)
+            antigo = self._entries.get(media_id)
+            self._entries[media_id] = entry
+        if antigo is not None and antigo.path != entry.path:
+            antigo.path.unlink(missing_ok=True)
+        return entry
+
+    def remove(self, media_id: int):
+        with self._lock:
+            entry = self._entries.pop(media_id, None)
+        if entry is None:
+            return False
+        entry.path.unlink(missing_ok=True)
+        return True
+
+    def marcar_em_uso(self):
+        """
+        Chamado pelo servidor ao subir: segura um lock compartilhado no
+        diretório enquanto atende, para `reconcile(relocate=True)` saber que
+        não pode mover arquivos (cada worker segura o seu).
+        """
+        if fcntl is None or self._em_uso is not None:
+            return
+        self.root.mkdir(parents=True, exist_ok=True)
+        f = open(self.root / self.LOCK_NAME, "a")
+        fcntl.flock(f, fcntl.LOCK_SH)
+        self._em_uso = f
+
+    def liberar_uso(self):
+        f, self._em_uso = self._em_uso, None
+        if f is not None:
+            f.close()  # fechar solta o flock
+
+    def servidor_ativo(self) -> bool:
+        """True se algum processo (inclusive este) está servindo este diretório."""
+        if fcntl is None:
+            return False
+        try:
+            f = open(self.root / self.LOCK_NAME, "r")
+        except FileNotFoundError:
+            return False
+        with f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return True
+            fcntl.flock(f, fcntl.LOCK_UN)
+        return False
+
+    def reconcile(self, relocate: bool = False):
+        """
+        Reconstroi o índice a partir do disco e informa as divergências.
+        Com `relocate=True` move arquivos que não estão no caminho canônico
+        (ex.: ao ativar o sharding num diretório plano). Mover só é seguro
+        com o servidor parado: os índices dos workers e as URLs em uso
+        apontam para os caminhos antigos. Por isso levanta `RuntimeError`
+        se algum servidor estiver usando o diretório (veja `marcar_em_uso`).
+        """
+        if relocate and self.servidor_ativo():
+            raise RuntimeError(
+                f"{self.root}: servidor em execução; pare-o antes de realocar os arquivos."
+            )
+        found = self._scan()
+        moved = []
+        if relocate:
+            for media_id, entry in list(found.items()):
+                destino = self.path_for(media_id, entry.path.suffix.lower())
+                if entry.path != destino:
+                    destino.parent.mkdir(parents=True, exist_ok=True)
+                    os.replace(entry.path, destino)
+                    found[media_id] = self._entry(destino)
+                    moved.append(media_id)
+
+        with self._lock:
+            antes = self._entries
+            self._entries = found
+        return {
+            "added": sorted(found.keys() - antes.keys()),
+            "removed": sorted(antes.keys() - found.keys()),
+            "changed": sorted(
+                mid for mid in found.keys() & antes.keys()
+                if found[mid].path != antes[mid].path
+                or found[mid].stat.st_mtime_ns != antes[mid].stat.st_mtime_ns
+                or found[mid].size != antes[mid].size
+            ),
+            "moved": sorted(moved),
+            "total": len(found),
+        }
+
+
+# Upload em streaming --------------------------------------------------------
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+class StagedUpload(NamedTuple):
+    tmp_path: Path
+    size: int
+    sha256: str
+
+
+def _write_chunk(f, digest, chunk):
+    # hashlib libera o GIL em blocos grandes, então hash + escrita vão juntos pro thread
+    digest.update(chunk)
+    f.write(chunk)
+
+
+async def receive_upload(upload: UploadFile, directory: Path, max_bytes: int, chunk_size: int = UPLOAD_CHUNK_SIZE):
+    """
+    Copia o upload em blocos para um temporário oculto em `directory`
+    (mesmo filesystem do destino final, para o rename ser atômico),
+    calculando o SHA-256 e abortando com 413 assim que passar de `max_bytes`.
+    A escrita em disco roda no threadpool, fora do event loop.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".upload-")
+    tmp_path = Path(tmp)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as f:
+            while True:
+                chunk = await upload.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if max_bytes and size > max_bytes:
+                    raise HTTPException(status_code=413, detail="Arquivo excede o tamanho máximo permitido.")
+                await run_in_threadpool(_write_chunk, f, digest, chunk)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    return StagedUpload(tmp_path, size, digest.hexdigest())
+
+
+def commit_upload(staged: StagedUpload, destino: Path):
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    os.replace(staged.tmp_path, destino)
+
+
+def discard_upload(staged: StagedUpload):
+    staged.tmp_path.unlink(missing_ok=True)
+
+
+class MaxBodySizeMiddleware:
+    """
+    Recusa com 413 corpos maiores que `max_bytes` enquanto eles ainda estão
+    chegando (pelo Content-Length ou contando os bytes recebidos), antes que
+    o parser de multipart termine de gravar o upload inteiro.
+
+    `por_rota` é uma lista de `(regex do path, limite)`: a primeira que casa
+    com o path inteiro troca o limite daquela rota (ex.: capas bem menores
+    que músicas).
+    """
+
+    def __init__(self, app, max_bytes: int, por_rota=()):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.por_rota = [(re.compile(padrao), limite) for padrao, limite in por_rota]
+
+    def limite(self, path: str) -> int:
+        for padrao, limite in self.por_rota:
+            if padrao.fullmatch(path):
+                return limite
+        return self.max_bytes
+
+    async def __call__(self, scope, receive, send):
+        max_bytes = self.limite(scope.get("path", "")) if scope["type"] == "http" else 0
+        if not max_bytes:
+            await self.app(scope, receive, send)
+            return
+
+        for name, value in scope.get("headers", ()):
+            if name == b"content-length":
+                if value.isdigit() and int(value) > max_bytes:
+                    response = JSONResponse(
+                        status_code=413,
+                        content={"detail": "Arquivo excede o tamanho máximo permitido."},
+                    )
+                    await response(scope, receive, send)
+                    return
+                break
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_bytes:
+                    raise HTTPException(status_code=413, detail="Arquivo excede o tamanho máximo permitido.")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Ferramentas do diretório de mídia")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    rec = sub.add_parser("reconcile", help="reconstroi os índices de músicas e capas a partir do disco")
+    rec.add_argument(
+        "--relocate", action="store_true",
+        help="move arquivos para o caminho canônico (sharding); só com o servidor parado",
+    )
+    args = parser.parse_args()
+
+    from main import song_index, cover_index
+
+    try:
+        print(json.dumps({
+            "songs": song_index.reconcile(relocate=args.relocate),
+            "covers": cover_index.reconcile(relocate=args.relocate),
+        }, indent=2))
+    except RuntimeError as exc:
+        parser.exit(1, f"{exc}\n")
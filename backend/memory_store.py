@@ -0,0 +1,305 @@
+"""
+Persistência opcional da `MemoryDB`, ligada por `MEMORY_DB_DIR`.
+
+- Log: os helpers de mutação de `database` (marcados com `@_persistido`)
+  gravam, depois de aplicados, um registro (operação, argumentos, relógio)
+  no segmento atual `wal-NNNNNN.log`. Cada registro leva tamanho e CRC32; um
+  registro cortado no fim (queda no meio da escrita) é descartado na leitura.
+- Snapshot: a thread compactadora (ou `snapshot()`) abre um segmento novo N
+  e grava `snapshot-NNNNNN.bin` com as tabelas em colunas, em seções que o
+  carregamento lê direto de um mmap. O snapshot N contém tudo dos segmentos
+  anteriores a N, que então são apagados.
+- Restauração (`abrir`): carrega o snapshot mais novo, reconstrói os índices
+  secundários e reaplica em ordem os segmentos a partir de N.
+"""
+import logging
+import mmap
+import os
+import pickle
+import re
+import struct
+import threading
+import time
+import zlib
+from array import array
+from datetime import datetime, timezone
+from pathlib import Path
+
+import database
+from database import memory_db
+
+logger = logging.getLogger("memory_store")
+
+MEMORY_DB_DIR = os.getenv("MEMORY_DB_DIR", "")
+# snapshot a cada N segundos (se houve mutação) ou quando o log passa de N bytes
+MEMORY_DB_SNAPSHOT_SECONDS = float(os.getenv("MEMORY_DB_SNAPSHOT_SECONDS", "300"))
+MEMORY_DB_SNAPSHOT_BYTES = int(os.getenv("MEMORY_DB_SNAPSHOT_BYTES", str(64 * 1024 * 1024)))
+# "1" = fsync a cada registro; senão o log vai para o SO a cada registro
+# (sobrevive à queda do processo) e ao disco nos snapshots
+MEMORY_DB_FSYNC = os.getenv("MEMORY_DB_FSYNC", "0") != "0"
+
+MAGIC = b"MDBSNAP\x01"
+_SECAO = struct.Struct("<4sQ")
+_REGISTRO = struct.Struct("<II")  # tamanho, crc32
+_SEGMENTO = re.compile(r"^wal-(\d+)\.log$")
+_SNAPSHOT = re.compile(r"^snapshot-(\d+)\.bin$")
+
+# colunas gravadas por tabela (a primeira é a chave)
+TABELAS = {
+    "users": ("id_usuario", "nome", "email", "senha_hash"),
+    "albums": ("id_album", "titulo", "ano", "id_usuario"),
+    "musicas": ("id_musica", "nome", "genero", "duracao_seg", "id_album", "id_usuario"),
+    "playlists": ("id_playlist", "nome", "id_dono", "qtd_musicas", "duracao_total_seg", "atualizada_em"),
+}
+_TAGS = {"users": b"USRS", "albums": b"ALBS", "musicas": b"MUSC", "playlists": b"PLST"}
+SEQS = ("user_seq", "album_seq", "music_seq", "playlist_seq")
+
+
+def _numerados(diretorio: Path, padrao):
+    found = []
+    for path in diretorio.iterdir():
+        m = padrao.match(path.name)
+        if m:
+            found.append((int(m.group(1)), path))
+    return sorted(found)
+
+
+def _capturar(db):
+    """Cópia colunar das tabelas (chamada com `memory_db.lock`: estado consistente)."""
+    tabelas = {}
+    for nome, cols in TABELAS.items():
+        rows = list(getattr(db, nome).values())
+        tabelas[nome] = [[row.get(c) for row in rows] for c in cols]
+    pids, mids, posicoes = array("q"), array("q"), array("q")
+    for pid, por_musica in db.playlist_musicas.items():
+        for mid, pos in por_musica.items():
+            pids.append(pid)
+            mids.append(mid)
+            posicoes.append(pos)
+    seqs = {k: getattr(db, k) for k in SEQS}
+    return tabelas, (pids, mids, posicoes), seqs, db.musicas_busca.export_state()
+
+
+def gravar_snapshot(path: Path, tabelas, relacao, seqs, busca):
+    """Grava em `path.tmp`, faz fsync e renomeia: o snapshot aparece inteiro ou não aparece."""
+    tmp = path.with_suffix(".tmp")
+    pids, mids, posicoes = relacao
+    meta = {"seqs": seqs, "relacao": len(pids), "criado_em": time.time()}
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+
+        def secao(tag, payload):
+            f.write(_SECAO.pack(tag, len(payload)))
+            f.write(payload)
+
+        secao(b"META", pickle.dumps(meta, protocol=pickle.HIGHEST_PROTOCOL))
+        for nome, colunas in tabelas.items():
+            secao(_TAGS[nome], pickle.dumps(colunas, protocol=pickle.HIGHEST_PROTOCOL))
+        # relação em três arrays int64 contíguos: lidos do mmap sem pickle
+        secao(b"MSPL", pids.tobytes() + mids.tobytes() + posicoes.tobytes())
+        # índice de trigramas pronto: refazê-lo é o passo mais caro da restauração
+        secao(b"BUSC", pickle.dumps(busca, protocol=pickle.HIGHEST_PROTOCOL))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def ler_snapshot(path: Path):
+    """Devolve (tabelas {nome: {id: linha}}, [(pid, mid, pos)], seqs, estado da busca)."""
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        if mm[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path.name}: não é um snapshot da MemoryDB")
+        secoes, off = {}, len(MAGIC)
+        while off < len(mm):
+            tag, n = _SECAO.unpack_from(mm, off)
+            off += _SECAO.size
+            secoes[tag] = (off, n)
+            off += n
+
+        def carregar(tag):
+            inicio, n = secoes[tag]
+            return pickle.loads(mm[inicio:inicio + n])
+
+        meta = carregar(b"META")
+        tabelas = {}
+        for nome, cols in TABELAS.items():
+            chave = cols[0]
+            linhas = (dict(zip(cols, valores)) for valores in zip(*carregar(_TAGS[nome])))
+            tabelas[nome] = {row[chave]: row for row in linhas}
+        inicio, _ = secoes[b"MSPL"]
+        total = meta["relacao"]
+        arrays = []
+        for i in range(3):
+            a = array("q")
+            a.frombytes(mm[inicio + i * total * 8:inicio + (i + 1) * total * 8])
+            arrays.append(a)
+        busca = carregar(b"BUSC")
+    return tabelas, zip(*arrays), meta["seqs"], busca
+
+
+def ler_registros(path: Path):
+    """
+    Registros íntegros do segmento, em ordem, e o offset onde a parte válida
+    termina (menor que o arquivo quando o último registro foi cortado).
+    """
+    data = path.read_bytes()
+    registros, off = [], 0
+    while off + _REGISTRO.size <= len(data):
+        n, crc = _REGISTRO.unpack_from(data, off)
+        payload = data[off + _REGISTRO.size:off + _REGISTRO.size + n]
+        if len(payload) < n or zlib.crc32(payload) != crc:
+            break
+        registros.append(pickle.loads(payload))
+        off += _REGISTRO.size + n
+    return registros, off
+
+
+class MemoryStore:
+    """Log + snapshots de uma `MemoryDB` num diretório (um processo por diretório)."""
+
+    def __init__(self, diretorio, snapshot_seconds=MEMORY_DB_SNAPSHOT_SECONDS,
+                 snapshot_bytes=MEMORY_DB_SNAPSHOT_BYTES, fsync=MEMORY_DB_FSYNC):
+        self.dir = Path(diretorio)
+        self.snapshot_seconds = snapshot_seconds
+        self.snapshot_bytes = snapshot_bytes
+        self.fsync = fsync
+        # a trava dos escritores da MemoryDB: `database._persistido` a segura
+        # em volta de aplicar + registrar, e o snapshot a usa para capturar
+        self.lock = memory_db.lock
+        self._snapshot_lock = threading.Lock()
+        self._parar = threading.Event()
+        self._thread = None
+        self._f = None
+        self.segmento = 0
+        self.registros_no_log = 0
+        self.bytes_no_log = 0
+        self.ultimo_snapshot = None
+        self.restaurado_em_seg = None
+
+    # ciclo de vida ----------------------------------------------------------
+
+    def abrir(self):
+        """Restaura a `MemoryDB` do diretório e passa a registrar as mutações."""
+        t0 = time.perf_counter()
+        self.dir.mkdir(parents=True, exist_ok=True)
+        base = 0
+        snapshots = _numerados(self.dir, _SNAPSHOT)
+        if snapshots:
+            base, path = snapshots[-1]
+            database.restaurar_memoria(*ler_snapshot(path))
+            self.ultimo_snapshot = base
+        else:
+            memory_db.reset()
+
+        segmentos = [(n, p) for n, p in _numerados(self.dir, _SEGMENTO) if n >= base]
+        reaplicados = 0
+        for n, path in segmentos:
+            registros, valido = ler_registros(path)
+            for op, args, kwargs, ts in registros:
+                database.reaplicar(op, args, kwargs, datetime.fromtimestamp(ts, timezone.utc))
+            reaplicados += len(registros)
+            if valido < path.stat().st_size:
+                logger.warning("%s: registro incompleto no fim descartado", path.name)
+                os.truncate(path, valido)
+        self.registros_no_log = reaplicados
+        self.bytes_no_log = sum(p.stat().st_size for _, p in segmentos)
+
+        self._abrir_segmento(max([base, *(n for n, _ in segmentos)]) + 1)
+        memory_db.wal = self
+        self.restaurado_em_seg = time.perf_counter() - t0
+        logger.info(
+            "MemoryDB restaurada de %s em %.2fs (snapshot %s, %d registros do log)",
+            self.dir, self.restaurado_em_seg, self.ultimo_snapshot, reaplicados,
+        )
+        if self.snapshot_seconds > 0:
+            self._thread = threading.Thread(target=self._compactar, name="memory-store", daemon=True)
+            self._thread.start()
+        return self
+
+    def fechar(self, snapshot=True):
+        """Para a compactação, grava um snapshot final (restart sem replay) e solta o log."""
+        self._parar.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if snapshot:
+            self.snapshot()
+        with self.lock:
+            if memory_db.wal is self:
+                memory_db.wal = None
+            if self._f is not None:
+                self._f.close()
+                self._f = None
+
+    # log ------------------------------------------------------------------
+
+    def _abrir_segmento(self, numero: int):
+        if self._f is not None:
+            self._f.flush()
+            os.fsync(self._f.fileno())
+            self._f.close()
+        self.segmento = numero
+        self._f = open(self.dir / f"wal-{numero:06d}.log", "ab")
+
+    def append(self, op: str, args, kwargs, t: datetime):
+        """Chamado por `database._persistido` com `self.lock` tomado."""
+        payload = pickle.dumps((op, args, kwargs, t.timestamp()), protocol=pickle.HIGHEST_PROTOCOL)
+        self._f.write(_REGISTRO.pack(len(payload), zlib.crc32(payload)) + payload)
+        self._f.flush()
+        if self.fsync:
+            os.fsync(self._f.fileno())
+        self.registros_no_log += 1
+        self.bytes_no_log += _REGISTRO.size + len(payload)
+
+    # snapshots ------------------------------------------------------------
+
+    def snapshot(self, force: bool = False):
+        """
+        Grava um snapshot se houve mutação desde o último; devolve o número dele
+        ou None. `force` grava mesmo sem nada no log (cargas em lote, como
+        `catalogo.carregar`, trocam a MemoryDB sem passar pelo log).
+        """
+        with self._snapshot_lock:
+            with self.lock:
+                if self._f is None or (not force and self.registros_no_log == 0 and self.ultimo_snapshot is not None):
+                    return None
+                numero = self.segmento + 1
+                self._abrir_segmento(numero)
+                dados = _capturar(memory_db)
+                self.registros_no_log = self.bytes_no_log = 0
+            # serialização e escrita fora do lock: as mutações seguem no segmento novo
+            gravar_snapshot(self.dir / f"snapshot-{numero:06d}.bin", *dados)
+            self.ultimo_snapshot = numero
+            for n, path in _numerados(self.dir, _SNAPSHOT) + _numerados(self.dir, _SEGMENTO):
+                if n < numero:
+                    path.unlink(missing_ok=True)
+            return numero
+
+    def _compactar(self):
+        ultimo = time.monotonic()
+        intervalo = min(self.snapshot_seconds, 1.0)
+        while not self._parar.wait(intervalo):
+            vencido = time.monotonic() - ultimo >= self.snapshot_seconds
+            if self.bytes_no_log >= self.snapshot_bytes or (vencido and self.registros_no_log):
+                try:
+                    self.snapshot()
+                except Exception:  # noqa: BLE001 - o log continua valendo; tenta de novo depois
+                    logger.exception("falha ao gravar snapshot da MemoryDB")
+                ultimo = time.monotonic()
+
+    def stats(self):
+        return {
+            "dir": str(self.dir),
+            "segmento": self.segmento,
+            "registros_no_log": self.registros_no_log,
+            "bytes_no_log": self.bytes_no_log,
+            "ultimo_snapshot": self.ultimo_snapshot,
+            "restaurado_em_seg": self.restaurado_em_seg,
+        }
+
+
+def abrir_do_ambiente():
+    """`MemoryStore` aberto em `MEMORY_DB_DIR` no modo memória; None se desligado."""
+    if not (database.USE_MEMORY_DB and MEMORY_DB_DIR):
+        return None
+    return MemoryStore(MEMORY_DB_DIR).abrir()
@@ -0,0 +1,279 @@
+"""
+Métricas no formato texto do Prometheus, sem dependências externas.
+
+`MetricsMiddleware` mede cada requisição (contagem, latência, em andamento,
+bytes) rotulando pela rota *template* (`/musicas/{id_musica}/stream`), nunca
+pelo caminho cru, para a cardinalidade ficar limitada ao número de rotas.
+As consultas ao banco são medidas pelos cursores de `database.get_conn`
+(ver `observe_query`) e agregadas na requisição em andamento.
+
+`render()` gera o texto servido em `GET /metrics`.
+"""
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+
+from starlette.routing import Match
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+UNMATCHED = "<unmatched>"
+NO_ROUTE = "<none>"  # consultas fora de requisição (startup, scripts)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _num(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name}: esperava labels {self.labelnames}")
+        return tuple(str(v) for v in labels)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(self._key(labels), 0)
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_labels(self.labelnames, key)} {_num(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            i = bisect_left(self.buckets, value)
+            if i < len(self.buckets):
+                state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    def count(self, *labels):
+        state = self._values.get(self._key(labels))
+        return state[2] if state else 0
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            items = sorted((k, (list(v[0]), v[1], v[2])) for k, v in self._values.items())
+        for key, (counts, total, n) in items:
+            acc = 0
+            for bound, c in zip(self.buckets, counts):
+                acc += c
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, [('le', _num(float(bound)))])} {acc}")
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, [('le', '+Inf')])} {n}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_num(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {n}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []  # funções que devolvem [(nome, tipo, help, [(labels, valor)])]
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, fn):
+        self.collectors.append(fn)
+        return fn
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for fn in self.collectors:
+            for name, kind, help_text, samples in fn():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_labels(labels.keys(), labels.values())} {_num(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_requests = registry.register(Counter(
+    "http_requests_total", "Requisições HTTP atendidas.", ("method", "route", "status")))
+http_latency = registry.register(Histogram(
+    "http_request_duration_seconds", "Latência das requisições HTTP (até o fim do corpo).", ("method", "route")))
+http_in_flight = registry.register(Gauge(
+    "http_requests_in_flight", "Requisições HTTP em andamento.", ("method", "route")))
+http_request_bytes = registry.register(Counter(
+    "http_request_bytes_total", "Bytes recebidos no corpo das requisições.", ("route",)))
+http_response_bytes = registry.register(Counter(
+    "http_response_bytes_total", "Bytes enviados no corpo das respostas.", ("route",)))
+upload_bytes = registry.register(Counter(
+    "media_upload_bytes_total", "Bytes de mídia gravados por upload.", ("kind",)))
+stream_bytes = registry.register(Counter(
+    "media_stream_bytes_total", "Bytes de mídia enviados aos clientes.", ("kind",)))
+db_queries = registry.register(Counter(
+    "db_queries_total", "Consultas executadas no banco.", ("route",)))
+db_seconds = registry.register(Histogram(
+    "db_query_duration_seconds", "Tempo por chamada de cursor, por fase.", ("route", "phase"), DB_BUCKETS))
+db_rows = registry.register(Counter(
+    "db_rows_total", "Linhas devolvidas pelos fetch*.", ("route",)))
+db_queries_per_request = registry.register(Histogram(
+    "db_queries_per_request", "Consultas por requisição.", ("route",), COUNT_BUCKETS))
+
+# rota template -> tipo de mídia, para `media_stream_bytes_total`
+stream_routes = {}
+
+
+class RequestStats:
+    __slots__ = ("route", "queries")
+
+    def __init__(self, route):
+        self.route = route
+        self.queries = 0
+
+
+_current = contextvars.ContextVar("metrics_request", default=None)
+
+
+def current_route() -> str:
+    stats = _current.get()
+    return stats.route if stats is not None else NO_ROUTE
+
+
+def observe_query(phase: str, seconds: float, rows: int = 0):
+    """Chamado pelos cursores instrumentados a cada execute/fetch."""
+    stats = _current.get()
+    route = stats.route if stats is not None else NO_ROUTE
+    if phase == "execute":
+        db_queries.inc(route)
+        if stats is not None:
+            stats.queries += 1
+    db_seconds.observe(seconds, route, phase)
+    if rows:
+        db_rows.inc(route, amount=rows)
+
+
+def route_template(router, scope) -> str:
+    partial = None
+    for route in router.routes:
+        match, _ = route.matches(scope)
+        if match is Match.FULL:
+            return getattr(route, "path", UNMATCHED)
+        if match is Match.PARTIAL and partial is None:
+            partial = getattr(route, "path", UNMATCHED)  # método errado (405)
+    return partial or UNMATCHED
+
+
+class MetricsMiddleware:
+    """Middleware ASGI que alimenta as métricas HTTP e o contexto das de banco."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        router = getattr(scope.get("app"), "router", None)
+        route = route_template(router, scope) if router is not None else UNMATCHED
+        method = scope["method"]
+        stats = RequestStats(route)
+        token = _current.set(stats)
+        status = "500"
+        sent = received = 0
+
+        async def counting_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+            return message
+
+        async def counting_send(message):
+            nonlocal status, sent
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            elif message["type"] == "http.response.body":
+                sent += len(message.get("body", b""))
+            await send(message)
+
+        http_in_flight.inc(method, route)
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        finally:
+            http_in_flight.dec(method, route)
+            http_latency.observe(time.perf_counter() - t0, method, route)
+            http_requests.inc(method, route, status)
+            if received:
+                http_request_bytes.inc(route, amount=received)
+            if sent:
+                http_response_bytes.inc(route, amount=sent)
+                kind = stream_routes.get(route)
+                if kind is not None:
+                    stream_bytes.inc(kind, amount=sent)
+            db_queries_per_request.observe(stats.queries, route)
+            _current.reset(token)
+
+
+def render() -> str:
+    return registry.render()
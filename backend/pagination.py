@@ -0,0 +1,92 @@
+"""
+Paginação por cursor (keyset) para os endpoints de listagem.
+
+O cursor é opaco para o cliente: é a chave de ordenação do último item da
+página, em JSON + base64url. A próxima página começa logo depois dessa
+chave (`WHERE (chave) > (cursor)`), então não há OFFSET e a ordem é estável
+mesmo com inserções/remoções entre as requisições.
+"""
+import base64
+import binascii
+import json
+import os
+
+from fastapi import HTTPException, Request, Response
+
+DEFAULT_PAGE_SIZE = int(os.getenv("PAGE_SIZE_DEFAULT", "100"))
+MAX_PAGE_SIZE = int(os.getenv("PAGE_SIZE_MAX", "1000"))
+
+
+class Page(list):
+    """Lista de itens de uma página + cursor da próxima (None na última)."""
+
+    def __init__(self, items=(), next_cursor=None):
+        super().__init__(items)
+        self.next_cursor = next_cursor
+
+
+def clamp_limit(limit):
+    if limit is None:
+        return DEFAULT_PAGE_SIZE
+    if limit < 1:
+        raise HTTPException(status_code=400, detail="limit deve ser maior que zero.")
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def parse_ids(ids: str | None):
+    """`ids=1,2,3` dos endpoints de busca em lote: ints distintos, na ordem pedida."""
+    if not ids:
+        return None
+    try:
+        parsed = list(dict.fromkeys(int(i) for i in ids.split(",") if i.strip()))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids deve ser uma lista de inteiros separados por vírgula.")
+    if len(parsed) > MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"no máximo {MAX_PAGE_SIZE} ids por requisição.")
+    return parsed
+
+
+def encode_cursor(key) -> str:
+    raw = json.dumps(list(key), separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor, size: int = 1):
+    """Devolve a chave do cursor como tupla de `size` valores (ou None)."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        key = json.loads(raw)
+    except (binascii.Error, ValueError):
+        raise HTTPException(status_code=400, detail="cursor inválido.")
+    if (
+        not isinstance(key, list)
+        or len(key) != size
+        or not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in key)
+    ):
+        raise HTTPException(status_code=400, detail="cursor inválido.")
+    return tuple(key)
+
+
+def make_page(rows, limit: int, key) -> Page:
+    """
+    `rows` deve vir com até `limit + 1` itens: o excedente só indica que há
+    próxima página e não é devolvido.
+    """
+    rows = list(rows)
+    if len(rows) <= limit:
+        return Page(rows)
+    rows = rows[:limit]
+    return Page(rows, encode_cursor(key(rows[-1])))
+
+
+def set_next_link(request: Request | None, response: Response | None, page):
+    """Publica o cursor da próxima página nos headers `Link` e `X-Next-Cursor`."""
+    cursor = getattr(page, "next_cursor", None)
+    if response is None or cursor is None:
+        return
+    response.headers["X-Next-Cursor"] = cursor
+    if request is not None:
+        url = request.url.include_query_params(cursor=cursor)
+        response.headers["Link"] = f'<{url}>; rel="next"'
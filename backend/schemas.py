@@ -1,3 +1,5 @@
+from typing import Optional
+
 from pydantic import BaseModel
 
 class UserCreate(BaseModel):
@@ -19,3 +21,11 @@ class Musica(BaseModel):
     genero: str
     duracao_seg: int
     id_album: int
+
+class PlaylistBulk(BaseModel):
+    add: list[int] = []
+    remove: list[int] = []
+
+class PlaylistMover(BaseModel):
+    antes_de: Optional[int] = None
+    depois_de: Optional[int] = None
@@ -0,0 +1,165 @@
+"""
+Busca de músicas por nome, sem acento e tolerante a erros de digitação.
+
+Espelha o que o PostgreSQL faz com `unaccent` + `pg_trgm` (ver
+db/setup.sql): os nomes são normalizados (sem acentos, minúsculos) e
+quebrados em trigramas, e um índice invertido trigrama -> ids permite achar
+candidatos sem varrer o catálogo inteiro.
+"""
+import unicodedata
+from array import array
+from collections import Counter
+from typing import NamedTuple
+
+# mesmo valor padrão de pg_trgm.word_similarity_threshold
+WORD_SIMILARITY_THRESHOLD = 0.6
+
+
+def fold(text: str) -> str:
+    """Remove acentos e põe em minúsculas ("Canção" -> "cancao")."""
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+def like_escape(text: str) -> str:
+    """Escapa `%`, `_` e `\\` para usar `text` como literal num LIKE."""
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def normalize(text: str) -> str:
+    """`fold` + pontuação vira espaço, espaços repetidos colapsados."""
+    folded = fold(text)
+    return " ".join("".join(c if c.isalnum() else " " for c in folded).split())
+
+
+def trigrams(normalized: str) -> set:
+    # como no pg_trgm: cada palavra recebe dois espaços antes e um depois
+    grams = set()
+    for word in normalized.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def word_similarity(query: str, text: str) -> float:
+    """
+    Fração dos trigramas da busca presentes em `text`: a mesma nota que o
+    `TrigramIndex` dá aos parecidos (aproxima o `word_similarity` do pg_trgm).
+    """
+    q_grams = trigrams(normalize(query or ""))
+    if not q_grams:
+        return 0.0
+    return len(q_grams & trigrams(normalize(text or ""))) / len(q_grams)
+
+
+def _inner_trigrams(normalized: str) -> set:
+    # trigramas sem padding: todos aparecem em qualquer texto que contenha a busca
+    grams = set()
+    for word in normalized.split():
+        grams.update(word[i:i + 3] for i in range(len(word) - 2))
+    return grams
+
+
+class SearchHit(NamedTuple):
+    id: int
+    tier: int  # 0 nome igual, 1 prefixo, 2 substring, 3 parecido
+    score: float
+
+    @property
+    def key(self):
+        """Chave de ordenação (crescente) usada também como cursor de página."""
+        return (self.tier, -self.score, self.id)
+
+
+class TrigramIndex:
+    """Índice invertido trigrama -> ids, com ranking por relevância."""
+
+    def __init__(self):
+        self._postings = {}
+        self._docs = {}  # id -> texto normalizado (os trigramas são recalculados no remove)
+
+    def __len__(self):
+        return len(self._docs)
+
+    def add(self, doc_id: int, text: str):
+        if doc_id in self._docs:
+            self.remove(doc_id)
+        norm = normalize(text)
+        self._docs[doc_id] = norm
+        for g in trigrams(norm):
+            bucket = self._postings.get(g)
+            if bucket is None:
+                self._postings[g] = {doc_id}
+            else:
+                bucket.add(doc_id)
+
+    def remove(self, doc_id: int):
+        norm = self._docs.pop(doc_id, None)
+        if norm is None:
+            return
+        for g in trigrams(norm):
+            bucket = self._postings.get(g)
+            if bucket is not None:
+                bucket.discard(doc_id)
+                if not bucket:
+                    del self._postings[g]
+
+    def export_state(self):
+        """(ids, textos normalizados, {trigrama: ids}) para gravar num snapshot."""
+        return (
+            array("q", self._docs.keys()),
+            list(self._docs.values()),
+            {g: array("q", ids) for g, ids in self._postings.items()},
+        )
+
+    def load_state(self, ids, normalized, postings):
+        """Restaura o que `export_state` gravou, sem renormalizar os textos."""
+        self._docs = dict(zip(ids, normalized))
+        self._postings = {g: set(bucket) for g, bucket in postings.items()}
+
+    def _substring_candidates(self, query: str):
+        inner = _inner_trigrams(query)
+        if not inner:
+            # busca curta demais para trigramas: varre (como o pg faria)
+            return tuple(self._docs)
+        buckets = sorted((self._postings.get(g, set()) for g in inner), key=len)
+        result = set(buckets[0])
+        for b in buckets[1:]:
+            result &= b
+            if not result:
+                break
+        return result
+
+    def search(self, query: str, threshold: float = WORD_SIMILARITY_THRESHOLD):
+        """
+        Devolve [SearchHit] do mais para o menos relevante: nome igual,
+        depois prefixo, depois substring, depois parecidos (erros de digitação)
+        com similaridade >= `threshold`.
+        """
+        q = normalize(query)
+        if not q:
+            return []
+
+        # sem trava: ids removidos por um escritor no meio do caminho são pulados
+        ranked = {}
+        for doc_id in self._substring_candidates(q):
+            norm = self._docs.get(doc_id)
+            if norm is not None and q in norm:
+                tier = 0 if norm == q else 1 if norm.startswith(q) else 2
+                ranked[doc_id] = (tier, 1.0)
+
+        q_grams = trigrams(q)
+        if q_grams:
+            shared = Counter()
+            for g in q_grams:
+                shared.update(self._postings.get(g, ()))
+            for doc_id, n in shared.items():
+                if doc_id in ranked:
+                    continue
+                score = n / len(q_grams)
+                if score >= threshold:
+                    ranked[doc_id] = (3, score)
+
+        hits = [SearchHit(doc_id, tier, score) for doc_id, (tier, score) in ranked.items()]
+        hits.sort(key=lambda h: h.key)
+        return hits
@@ -0,0 +1,179 @@
+"""
+Registro de consultas lentas (opcional, ligado por `SLOW_QUERY_MS`).
+
+Os cursores de `database.get_conn` avisam `record()` quando um `execute`
+passa do limite. A consulta é registrada com o SQL normalizado (literais
+viram `?`), os parâmetros (mascarados por padrão), a duração e a rota que
+a originou; vai para o logger `slowlog` e para dois buffers em memória: as
+N piores e as N mais recentes, vistos em `GET /admin/slow-queries`.
+
+Com `SLOW_QUERY_EXPLAIN` > 0, essa fração das consultas lentas que são
+só leitura (`SELECT`/`WITH ... SELECT`) ganha um `EXPLAIN (ANALYZE,
+BUFFERS)` executado na mesma conexão, dentro de um savepoint (no SQLite,
+`EXPLAIN QUERY PLAN`).
+"""
+import heapq
+import itertools
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+
+from metrics import current_route
+
+logger = logging.getLogger("slowlog")
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "0"))  # 0 = desligado
+SLOW_QUERY_TOP = int(os.getenv("SLOW_QUERY_TOP", "50"))
+# fração (0..1) das consultas lentas que recebem EXPLAIN ANALYZE
+SLOW_QUERY_EXPLAIN = float(os.getenv("SLOW_QUERY_EXPLAIN", "0"))
+# "redact" guarda só o tipo/tamanho dos parâmetros; "full" guarda os valores
+SLOW_QUERY_PARAMS = os.getenv("SLOW_QUERY_PARAMS", "redact")
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w$%])-?\d+(?:\.\d+)?\b")
+_SPACES = re.compile(r"\s+")
+_READ_ONLY = re.compile(r"^\s*(?:select|with)\b", re.IGNORECASE)
+_WRITES = re.compile(r"\b(?:insert|update|delete|merge)\b", re.IGNORECASE)
+
+
+def normalize_sql(sql) -> str:
+    """SQL numa linha, com literais trocados por `?` (placeholders `%s` ficam)."""
+    if isinstance(sql, bytes):
+        sql = sql.decode("utf-8", "replace")
+    sql = _STRING.sub("?", str(sql))
+    sql = _NUMBER.sub("?", sql)
+    return _SPACES.sub(" ", sql).strip().rstrip(";")
+
+
+def redact(params):
+    def one(value):
+        if value is None or isinstance(value, bool):
+            return value
+        if isinstance(value, (str, bytes)):
+            return f"<{type(value).__name__} len={len(value)}>"
+        if isinstance(value, (list, tuple)):
+            return f"<{type(value).__name__} len={len(value)}>"
+        return f"<{type(value).__name__}>"
+
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {k: one(v) for k, v in params.items()}
+    return [one(v) for v in params]
+
+
+def _plain(params):
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {k: v if isinstance(v, (int, float, str, bool, type(None))) else repr(v) for k, v in params.items()}
+    return [v if isinstance(v, (int, float, str, bool, type(None))) else repr(v) for v in params]
+
+
+class SlowQueryLog:
+    def __init__(self, threshold_ms=SLOW_QUERY_MS, top_n=SLOW_QUERY_TOP,
+                 explain_rate=SLOW_QUERY_EXPLAIN, params_mode=SLOW_QUERY_PARAMS):
+        self.threshold_ms = threshold_ms
+        self.top_n = top_n
+        self.explain_rate = explain_rate
+        self.params_mode = params_mode
+        self._lock = threading.Lock()
+        self._top = []  # heap mínimo de (duração, seq, registro)
+        self._recent = deque(maxlen=top_n)
+        self._seq = itertools.count()
+        self.total = 0
+
+    @property
+    def enabled(self):
+        return self.threshold_ms > 0
+
+    def is_slow(self, seconds: float) -> bool:
+        return self.enabled and seconds * 1000 >= self.threshold_ms
+
+    def _explain(self, cursor, sql, params):
+        explain_plan = getattr(cursor, "explain_plan", None)
+        if explain_plan is not None:
+            # SQLite: EXPLAIN QUERY PLAN, que não executa a consulta
+            try:
+                return explain_plan(sql, params)
+            except Exception as exc:  # EXPLAIN é diagnóstico, nunca derruba a requisição
+                return f"EXPLAIN falhou: {exc}"
+        conn = getattr(cursor, "connection", None)
+        if conn is None:
+            return None
+        cur = conn.cursor()
+        try:
+            cur.execute("SAVEPOINT slowlog_explain")
+            try:
+                cur.execute("EXPLAIN (ANALYZE, BUFFERS) " + sql, params)
+                rows = cur.fetchall()
+            finally:
+                # EXPLAIN ANALYZE executa a consulta: nada dele pode ficar na transação
+                cur.execute("ROLLBACK TO SAVEPOINT slowlog_explain")
+                cur.execute("RELEASE SAVEPOINT slowlog_explain")
+        except Exception as exc:  # EXPLAIN é diagnóstico, nunca derruba a requisição
+            return f"EXPLAIN falhou: {exc}"
+        finally:
+            cur.close()
+        lines = []
+        for row in rows:
+            lines.append(row["QUERY PLAN"] if isinstance(row, dict) else row[0])
+        return "\n".join(lines)
+
+    def record(self, cursor, sql, params, seconds: float, route=None):
+        sql_text = sql.decode("utf-8", "replace") if isinstance(sql, bytes) else str(sql)
+        entry = {
+            "sql": normalize_sql(sql_text),
+            "params": _plain(params) if self.params_mode == "full" else redact(params),
+            "duration_ms": round(seconds * 1000, 3),
+            "route": route or current_route(),
+            "at": time.time(),
+            "explain": None,
+        }
+        if (
+            self.explain_rate > 0
+            and _READ_ONLY.match(sql_text)
+            and not _WRITES.search(sql_text)
+            and random.random() < self.explain_rate
+        ):
+            entry["explain"] = self._explain(cursor, sql_text, params)
+
+        with self._lock:
+            self.total += 1
+            self._recent.append(entry)
+            item = (seconds, next(self._seq), entry)
+            if len(self._top) < self.top_n:
+                heapq.heappush(self._top, item)
+            elif seconds > self._top[0][0]:
+                heapq.heapreplace(self._top, item)
+        logger.warning("slow query %s", json.dumps(entry, ensure_ascii=False, default=str))
+        return entry
+
+    def snapshot(self):
+        with self._lock:
+            top = [e for _, _, e in sorted(self._top, key=lambda t: (-t[0], t[1]))]
+            recent = list(reversed(self._recent))
+            total = self.total
+        return {
+            "enabled": self.enabled,
+            "threshold_ms": self.threshold_ms,
+            "explain_rate": self.explain_rate,
+            "params": self.params_mode,
+            "total": total,
+            "top": top,
+            "recent": recent,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._top.clear()
+            self._recent.clear()
+            self.total = 0
+
+
+slow_log = SlowQueryLog()
@@ -0,0 +1,270 @@
+"""
+Backend SQLite embutido, ligado por `SQLITE_PATH` (ver `database.get_conn`).
+
+Um arquivo só em modo WAL: leitores não bloqueiam o escritor, então vários
+workers (`uvicorn --workers N`) na mesma máquina compartilham o catálogo sem
+um servidor PostgreSQL. Cada thread tem a sua conexão (`connect()`), com o
+cache de statements preparados do `sqlite3` ligado.
+
+Os módulos `crud/*` continuam escrevendo o SQL do PostgreSQL; `traduzir()`
+converte o dialeto (placeholders `%s`/`%(nome)s`, `= ANY(%s)`, casts `::`,
+`FOR UPDATE`, `NOW()`, o escape do LIKE) uma vez por texto de consulta. Os
+poucos trechos sem tradução mecânica (LATERAL, `unnest`, `ARRAY()`) têm
+versão própria nos `crud/*`, escolhida por `database.USE_SQLITE`.
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+from functools import lru_cache
+from pathlib import Path
+
+from search import fold, word_similarity
+
+SCHEMA_PATH = Path(__file__).resolve().parents[1] / "db" / "setup_sqlite.sql"
+
+# espera por um lock de escrita de outro processo antes de dar "database is locked"
+SQLITE_BUSY_TIMEOUT = float(os.getenv("SQLITE_BUSY_TIMEOUT", "5"))
+# statements preparados mantidos por conexão
+SQLITE_CACHED_STATEMENTS = int(os.getenv("SQLITE_CACHED_STATEMENTS", "256"))
+
+NOW_SQL = "strftime('%Y-%m-%dT%H:%M:%fZ', 'now')"
+
+_PLACEHOLDER = re.compile(r"%\((\w+)\)s|%s|%%")
+_ANY = re.compile(r"=\s*ANY\s*\(\s*(%s|%\(\w+\)s)\s*\)", re.IGNORECASE)
+_LIKE = re.compile(r"(\bLIKE\s+(?:%s|%\(\w+\)s))", re.IGNORECASE)
+_CAST = re.compile(r"::\w+(?:\[\])?")
+_FOR_UPDATE = re.compile(r"\s+FOR\s+UPDATE\b", re.IGNORECASE)
+_NOW = re.compile(r"\bNOW\(\)", re.IGNORECASE)
+_WRITE = re.compile(r"^\s*(?:INSERT|UPDATE|DELETE|REPLACE)\b", re.IGNORECASE)
+
+
+@lru_cache(maxsize=512)
+def traduzir(sql: str):
+    """
+    SQL do PostgreSQL -> SQLite. Devolve (sql, trava): `trava` indica que a
+    consulta pedia `FOR UPDATE`, ou seja, deve abrir a transação de escrita.
+    """
+    trava = bool(_FOR_UPDATE.search(sql))
+    sql = _FOR_UPDATE.sub("", sql)
+    # listas viram JSON (ver `_params`) e são expandidas por json_each
+    sql = _ANY.sub(r"IN (SELECT value FROM json_each(\1))", sql)
+    # no PostgreSQL a barra invertida já é o escape padrão do LIKE
+    sql = _LIKE.sub(r"\1 ESCAPE '\\'", sql)
+    sql = _CAST.sub("", sql)
+
+    def placeholder(m):
+        if m.group(1):
+            return f":{m.group(1)}"
+        return "?" if m.group(0) == "%s" else "%"
+
+    sql = _PLACEHOLDER.sub(placeholder, sql)
+    sql = _NOW.sub(NOW_SQL, sql)
+    return sql, trava
+
+
+def _valor(value):
+    return json.dumps(list(value)) if isinstance(value, (list, tuple, set)) else value
+
+
+def _params(params):
+    if params is None:
+        return ()
+    if isinstance(params, dict):
+        return {k: _valor(v) for k, v in params.items()}
+    return tuple(_valor(v) for v in params)
+
+
+def _dict_row(cursor, row):
+    return dict(zip([c[0] for c in cursor.description], row))
+
+
+class SQLiteCursor:
+    """
+    Cursor com a interface que os `crud/*` usam do psycopg2: SQL no dialeto
+    do PostgreSQL, linhas dict e resultado lido inteiro no `execute` (como o
+    cursor do lado do cliente do psycopg2; `RETURNING` termina na hora).
+    """
+
+    def __init__(self, conn):
+        self.connection = conn
+        self.description = None
+        self.rowcount = -1
+        self._rows = []
+        self._pos = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def _preparar(self, query):
+        sql, trava = traduzir(query)
+        raw = self.connection.raw
+        if not raw.in_transaction and (trava or _WRITE.match(sql)):
+            # lock de escrita já no início: sem upgrade de leitura para escrita
+            # (que falharia com SQLITE_BUSY) nem duas transações no mesmo MAX()
+            raw.execute("BEGIN IMMEDIATE")
+        return sql
+
+    def execute(self, query, params=None):
+        cur = self.connection.raw.execute(self._preparar(query), _params(params))
+        self.description = cur.description
+        self._rows = cur.fetchall() if cur.description else []
+        self._pos = 0
+        self.rowcount = len(self._rows) if cur.description else cur.rowcount
+        cur.close()
+
+    def executemany(self, query, params_seq):
+        cur = self.connection.raw.executemany(self._preparar(query), [_params(p) for p in params_seq])
+        self.description = None
+        self._rows, self._pos = [], 0
+        self.rowcount = cur.rowcount
+        cur.close()
+
+    def fetchone(self):
+        if self._pos >= len(self._rows):
+            return None
+        self._pos += 1
+        return self._rows[self._pos - 1]
+
+    def fetchmany(self, size=1):
+        rows = self._rows[self._pos:self._pos + size]
+        self._pos += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._rows[self._pos:]
+        self._pos = len(self._rows)
+        return rows
+
+    def explain_plan(self, sql, params):
+        """Plano para o `slowlog` (`EXPLAIN QUERY PLAN`; o SQLite não tem ANALYZE por consulta)."""
+        cur = self.connection.raw.execute("EXPLAIN QUERY PLAN " + traduzir(sql)[0], _params(params))
+        try:
+            return "\n".join(row["detail"] for row in cur.fetchall())
+        finally:
+            cur.close()
+
+    def close(self):
+        self._rows = []
+
+
+class SQLiteServerCursor(SQLiteCursor):
+    """
+    Equivalente ao cursor nomeado (do lado do servidor) do psycopg2, para
+    `database.stream_query`: conexão própria numa transação de leitura (um
+    snapshot do WAL que escritores não bloqueiam nem alteram) e linhas lidas
+    sob demanda no `fetchmany`. Só leitura; a conexão fecha no `close`.
+    """
+
+    def __init__(self, path: str):
+        super().__init__(SQLiteConnection(_open(path), path))
+        self._cur = None
+
+    def execute(self, query, params=None):
+        raw = self.connection.raw
+        if not raw.in_transaction:
+            raw.execute("BEGIN")
+        self._cur = raw.execute(traduzir(query)[0], _params(params))
+        self.description = self._cur.description
+
+    def executemany(self, query, params_seq):
+        raise NotImplementedError("cursor de streaming é só leitura")
+
+    def fetchone(self):
+        return self._cur.fetchone()
+
+    def fetchmany(self, size=1):
+        return self._cur.fetchmany(size)
+
+    def fetchall(self):
+        return self._cur.fetchall()
+
+    def close(self):
+        if not self.connection.closed:
+            self.connection.rollback()
+            self.connection.close()
+
+
+class SQLiteConnection:
+    """Conexão da thread; `commit`/`rollback` como no psycopg2."""
+
+    def __init__(self, raw, path: str):
+        self.raw = raw
+        self.path = path
+        self.closed = False
+
+    def cursor(self, name=None, **kwargs):
+        # cursor nomeado = streaming, como no psycopg2 (ver SQLiteServerCursor)
+        if name is not None:
+            return SQLiteServerCursor(self.path)
+        return SQLiteCursor(self)
+
+    def commit(self):
+        if self.raw.in_transaction:
+            self.raw.execute("COMMIT")
+
+    def rollback(self):
+        if self.raw.in_transaction:
+            self.raw.execute("ROLLBACK")
+
+    def close(self):
+        self.closed = True
+        self.raw.close()
+
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready = set()
+_conns_lock = threading.Lock()
+_conns = []
+
+
+def _open(path: str):
+    raw = sqlite3.connect(
+        path,
+        timeout=SQLITE_BUSY_TIMEOUT,
+        isolation_level=None,  # transações explícitas (ver SQLiteCursor._preparar)
+        check_same_thread=False,
+        cached_statements=SQLITE_CACHED_STATEMENTS,
+    )
+    raw.row_factory = _dict_row
+    raw.execute("PRAGMA journal_mode=WAL")
+    # com WAL, NORMAL só perde o último commit numa queda de energia (nunca corrompe)
+    raw.execute("PRAGMA synchronous=NORMAL")
+    raw.execute("PRAGMA foreign_keys=ON")
+    raw.create_function("f_unaccent", 1, fold, deterministic=True)
+    raw.create_function("word_similarity", 2, word_similarity, deterministic=True)
+    with _schema_lock:
+        if path not in _schema_ready:
+            # idempotente; outro processo pode estar aplicando ao mesmo tempo
+            raw.executescript(f"BEGIN IMMEDIATE;\n{SCHEMA_PATH.read_text(encoding='utf-8')}\nCOMMIT;")
+            _schema_ready.add(path)
+    return raw
+
+
+def connect(path: str) -> SQLiteConnection:
+    """Conexão desta thread com `path` (aberta na primeira chamada; refeita após fork)."""
+    conn = getattr(_local, "conn", None)
+    if conn is None or conn.closed or _local.pid != os.getpid() or _local.path != path:
+        conn = SQLiteConnection(_open(path), path)
+        _local.conn, _local.pid, _local.path = conn, os.getpid(), path
+        with _conns_lock:
+            _conns.append(conn)
+    return conn
+
+
+def close_all():
+    """Fecha as conexões abertas por este processo (desligamento da app)."""
+    with _conns_lock:
+        conns = list(_conns)
+        _conns.clear()
+    for conn in conns:
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
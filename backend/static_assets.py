@@ -0,0 +1,217 @@
+"""
+Camada de arquivos estáticos do front-end (montada em `/static`).
+
+Na subida os arquivos de `frontend/` são lidos uma vez e ficam em memória
+(os pequenos), já comprimidos em gzip (e brotli, se o pacote estiver
+instalado); cada requisição escolhe a variante pelo `Accept-Encoding` sem
+`stat`/`open`. Cada arquivo também ganha uma URL com o hash do conteúdo
+(`login.3f9a1c2b7d.css`), servida com `Cache-Control: immutable`, e o HTML
+é reescrito para apontar para essas URLs: o navegador só revalida a página,
+não cada CSS a cada navegação.
+"""
+import gzip
+import hashlib
+import os
+import re
+from pathlib import Path
+from typing import NamedTuple
+
+from fastapi import Request
+from fastapi.responses import PlainTextResponse, Response
+
+from media import conditional_file_response, etag_matches, guess_media_type
+
+try:
+    import brotli
+except ImportError:  # noqa: W0705 - brotli é opcional, gzip sempre existe
+    brotli = None
+
+# arquivos até esse tamanho ficam em memória; os maiores vão do disco
+STATIC_MEMORY_MAX = int(os.getenv("STATIC_MEMORY_MAX", str(512 * 1024)))
+# abaixo disso comprimir não compensa o header extra
+STATIC_COMPRESS_MIN = 256
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "public, no-cache"
+
+COMPRESSIBLE = ("text/", "application/javascript", "application/json", "image/svg+xml")
+
+# href="x.css" / src="y.js" relativos (sem esquema e sem "/" inicial)
+_REF = re.compile(r'''(?P<attr>\b(?:href|src)\s*=\s*)(?P<q>["'])(?P<ref>[^"':/?#][^"':?#]*)(?P=q)''')
+
+
+class Asset(NamedTuple):
+    name: str
+    hashed_name: str
+    mime: str
+    etag: str
+    path: Path
+    size: int
+    bodies: dict  # codificação ("identity", "gzip", "br") -> bytes; vazio se ficou no disco
+
+
+def _fingerprint(name: str, digest: str) -> str:
+    stem, dot, ext = name.rpartition(".")
+    if not dot or "/" in ext:
+        return f"{name}.{digest}"
+    return f"{stem}.{digest}.{ext}"
+
+
+def _compress(body: bytes, mime: str):
+    bodies = {"identity": body}
+    if len(body) < STATIC_COMPRESS_MIN or not mime.startswith(COMPRESSIBLE):
+        return bodies
+    gz = gzip.compress(body, compresslevel=9, mtime=0)
+    if len(gz) < len(body):
+        bodies["gzip"] = gz
+    if brotli is not None:
+        br = brotli.compress(body, quality=11)
+        if len(br) < len(body):
+            bodies["br"] = br
+    return bodies
+
+
+def parse_accept_encoding(header: str | None):
+    """Devolve {codificação: q} do header Accept-Encoding."""
+    accepted = {}
+    for part in (header or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def choose_encoding(available, header: str | None) -> str:
+    accepted = parse_accept_encoding(header)
+    best, best_q = "identity", 0.0
+    for coding in ("br", "gzip"):  # em empate, brotli comprime melhor
+        if coding not in available:
+            continue
+        q = accepted.get(coding, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+class StaticAssets:
+    """App ASGI que substitui o `StaticFiles` no mount de `/static`."""
+
+    def __init__(self, directory, memory_max: int = STATIC_MEMORY_MAX):
+        self.directory = Path(directory)
+        self.memory_max = memory_max
+        self.assets = {}  # nome e nome com hash -> Asset
+        self.build()
+
+    def _files(self):
+        for root, dirs, files in os.walk(self.directory):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            for f in files:
+                if not f.startswith("."):
+                    path = Path(root) / f
+                    yield path.relative_to(self.directory).as_posix(), path
+
+    def _rewrite_html(self, name: str, body: bytes, hashed: dict) -> bytes:
+        base = name.rpartition("/")[0]
+
+        def sub(m):
+            ref = m["ref"]
+            target = hashed.get(os.path.normpath(f"{base}/{ref}" if base else ref))
+            if target is None:
+                return m.group(0)
+            # o hash só muda o nome do arquivo, o caminho relativo fica igual
+            folder, slash, _ = ref.rpartition("/")
+            return f"{m['attr']}{m['q']}{folder}{slash}{target.rpartition('/')[2]}{m['q']}"
+
+        return _REF.sub(sub, body.decode("utf-8")).encode("utf-8")
+
+    def _load(self, name: str, path: Path, body: bytes | None, st):
+        mime = guess_media_type(path, "application/octet-stream")
+        if body is None:
+            digest = hashlib.sha256()
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(chunk)
+            digest = digest.hexdigest()[:10]
+            return Asset(name, _fingerprint(name, digest), mime, f'"{digest}"', path, st.st_size, {})
+        digest = hashlib.sha256(body).hexdigest()[:10]
+        return Asset(name, _fingerprint(name, digest), mime, f'"{digest}"', path, len(body), _compress(body, mime))
+
+    def build(self):
+        """(Re)lê o diretório: primeiro os não-HTML, depois o HTML já reescrito."""
+        assets, hashed, html = {}, {}, []
+        for name, path in self._files():
+            st = path.stat()
+            if path.suffix.lower() in (".html", ".htm") and st.st_size <= self.memory_max:
+                html.append((name, path, st))
+                continue
+            body = path.read_bytes() if st.st_size <= self.memory_max else None
+            asset = self._load(name, path, body, st)
+            assets[name] = asset
+            hashed[name] = asset.hashed_name
+        for name, path, st in html:
+            body = self._rewrite_html(name, path.read_bytes(), hashed)
+            assets[name] = self._load(name, path, body, st)
+
+        by_name = {}
+        for asset in assets.values():
+            by_name[asset.name] = asset
+            by_name[asset.hashed_name] = asset
+        self.assets = by_name
+        return len(assets)
+
+    def url_for(self, name: str, prefix: str = "/static") -> str:
+        """URL com hash (imutável) de um arquivo; cai no nome simples se não existir."""
+        asset = self.assets.get(name)
+        return f"{prefix}/{asset.hashed_name if asset else name}"
+
+    def _response(self, request: Request, asset: Asset, immutable: bool):
+        cache_control = IMMUTABLE if immutable else REVALIDATE
+        if not asset.bodies:
+            return conditional_file_response(request, asset.path, media_type=asset.mime, cache_control=cache_control)
+
+        headers = request.headers
+        coding = choose_encoding(asset.bodies, headers.get("accept-encoding"))
+        etag = asset.etag if coding == "identity" else f'{asset.etag[:-1]}-{coding}"'
+        out = {"ETag": etag, "Cache-Control": cache_control}
+        if len(asset.bodies) > 1:
+            out["Vary"] = "Accept-Encoding"
+
+        inm = headers.get("if-none-match")
+        if inm is not None and etag_matches(inm, etag):
+            return Response(status_code=304, headers=out)
+
+        body = asset.bodies[coding]
+        if coding != "identity":
+            out["Content-Encoding"] = coding
+        if request.method == "HEAD":
+            out["Content-Length"] = str(len(body))
+            return Response(status_code=200, headers=out, media_type=asset.mime)
+        return Response(body, headers=out, media_type=asset.mime)
+
+    async def __call__(self, scope, receive, send):
+        assert scope["type"] == "http"
+        path, root_path = scope["path"], scope.get("root_path", "")
+        if root_path and path.startswith(root_path):
+            path = path[len(root_path):]
+        name = path.lstrip("/")
+
+        method = scope["method"]
+        if method not in ("GET", "HEAD"):
+            response = PlainTextResponse("Method Not Allowed", status_code=405, headers={"Allow": "GET, HEAD"})
+        else:
+            asset = self.assets.get(name)
+            if asset is None:
+                response = PlainTextResponse("Not Found", status_code=404)
+            else:
+                response = self._response(Request(scope), asset, immutable=name == asset.hashed_name)
+        await response(scope, receive, send)
+
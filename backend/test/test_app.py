@@ -1,9 +1,12 @@
+import json
 import os
 import tempfile
 from io import BytesIO
 from pathlib import Path
 import sys
 import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
 from starlette.datastructures import UploadFile
 
 # Force in-memory DB and isolate media writes for tests.
@@ -16,17 +19,27 @@ PROJECT_ROOT = Path(__file__).resolve().parents[1]
 if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
 
-from schemas import UserCreate, Login  # noqa: E402
+from schemas import UserCreate, Login, PlaylistBulk, PlaylistMover  # noqa: E402
+from database import add_musica, delete_musica, memory_db  # noqa: E402
+from covers import source_version  # noqa: E402
 from main import (  # noqa: E402
+    app,
+    cover_index,
     register,
     login,
     criar_album_route,
+    listar_albuns_route,
     criar_musica,
     stream_musica,
     editar_musica,
     criar_playlist_route,
     add_music,
     remover_musica_playlist,
+    excluir_playlist,
+    alterar_musicas_playlist,
+    musicas_da_playlist_route,
+    resumo_playlists_usuario,
+    mover_musica_playlist_route,
     upload_capa,
     get_capa,
     por_genero,
@@ -52,18 +65,33 @@ playlist_id = None
 # 🔵 RF01 — Cadastro e Login
 # ============================================================
 
-def test_register():
+@pytest.mark.asyncio
+async def test_register():
     global user_id
-    resp = register(UserCreate(nome="Teste User", email="teste@example.com", senha="123456"))
+    resp = await register(UserCreate(nome="Teste User", email="teste@example.com", senha="123456"))
     user_id = resp["id_usuario"]
     assert user_id is not None
 
 
-def test_login():
-    resp = login(Login(email="teste@example.com", senha="123456"))
+@pytest.mark.asyncio
+async def test_login():
+    resp = await login(Login(email="teste@example.com", senha="123456"))
     assert resp["id_usuario"] == user_id
 
 
+def test_register_com_fila_de_hash_cheia(monkeypatch):
+    import hashing
+
+    cheio = hashing.HashPool(workers=0, queue_max=0)
+    cheio._pending = cheio.capacity
+    monkeypatch.setattr(hashing, "hash_pool", cheio)
+    resp = TestClient(app).post(
+        "/register", json={"nome": "X", "email": "x@example.com", "senha": "123456"}
+    )
+    assert resp.status_code == 503
+    assert resp.headers["retry-after"]
+
+
 # ============================================================
 # 🟠 RF06 — Criar álbum
 # ============================================================
@@ -96,6 +124,23 @@ async def test_criar_musica():
     assert musica_id is not None
 
 
+@pytest.mark.asyncio
+async def test_criar_musica_desfaz_insert_se_o_arquivo_falha(monkeypatch):
+    import main
+
+    def falha(staged, destino):
+        raise OSError("disco cheio")
+
+    monkeypatch.setattr(main, "commit_upload", falha)
+    antes = dict(memory_db.musicas)
+    upload = UploadFile(file=BytesIO(b"abc"), filename="a.mp3", headers={"content-type": "audio/mpeg"})
+    with pytest.raises(OSError):
+        await criar_musica(nome="Orfa", genero="Indie", duracao_seg=10, id_album=album_id,
+                           id_usuario=user_id, id_playlist=None, arquivo=upload)
+    assert memory_db.musicas == antes
+    assert not [f for f in main.SONGS_DIR.rglob("*") if f.name.startswith(".upload-")]
+
+
 # ============================================================
 # 🎶 RF03 — Stream de música
 # ============================================================
@@ -105,6 +150,51 @@ def test_stream_musica():
     assert response.status_code == 200
 
 
+def test_metrics_endpoint():
+    client = TestClient(app)
+    client.get(f"/musicas/{musica_id}/stream", headers={"Range": "bytes=0-3"})
+    text = client.get("/metrics").text
+    assert 'http_requests_total{method="GET",route="/musicas/{id_musica}/stream",status="206"}' in text
+    assert 'media_stream_bytes_total{kind="song"}' in text
+    assert 'media_upload_bytes_total{kind="song"}' in text
+    assert f"/musicas/{musica_id}/stream" not in text
+
+
+def test_stream_musica_range_e_etag():
+    client = TestClient(app)
+    full = client.get(f"/musicas/{musica_id}/stream")
+    assert full.status_code == 200
+    assert full.headers["content-type"] == "audio/mpeg"
+    assert full.headers["accept-ranges"] == "bytes"
+    etag = full.headers["etag"]
+    assert not etag.startswith("W/")
+
+    parcial = client.get(f"/musicas/{musica_id}/stream", headers={"Range": "bytes=5-7"})
+    assert parcial.status_code == 206
+    assert parcial.content == TEST_AUDIO.getvalue()[5:8]
+
+    multi = client.get(f"/musicas/{musica_id}/stream", headers={"Range": "bytes=0-1,5-6"})
+    assert multi.status_code == 206
+    assert multi.headers["content-type"].startswith("multipart/byteranges")
+
+    # If-Range com ETag antiga ignora o Range e devolve o arquivo inteiro
+    antiga = client.get(
+        f"/musicas/{musica_id}/stream",
+        headers={"Range": "bytes=0-1", "If-Range": '"outra"'},
+    )
+    assert antiga.status_code == 200
+
+    cache = client.get(f"/musicas/{musica_id}/stream", headers={"If-None-Match": etag})
+    assert cache.status_code == 304
+    assert cache.content == b""
+
+    lm = client.get(
+        f"/musicas/{musica_id}/stream",
+        headers={"If-Modified-Since": full.headers["last-modified"]},
+    )
+    assert lm.status_code == 304
+
+
 # ============================================================
 # ✏️ Editar música
 # ============================================================
@@ -148,6 +238,69 @@ def test_remove_musica_playlist():
     assert resp["message"]
 
 
+# ============================================================
+# 📦 RF05 — Adicionar/remover músicas em lote
+# ============================================================
+
+def test_bulk_musicas_playlist():
+    resp = alterar_musicas_playlist(playlist_id, PlaylistBulk(add=[musica_id, 999999]))
+    assert resp["add"] == [
+        {"id_musica": musica_id, "status": "added"},
+        {"id_musica": 999999, "status": "not_found"},
+    ]
+    assert [m["id_musica"] for m in musicas_da_playlist_route(playlist_id)] == [musica_id]
+
+    resp = alterar_musicas_playlist(playlist_id, PlaylistBulk(add=[musica_id]))
+    assert resp["add"] == [{"id_musica": musica_id, "status": "exists"}]
+
+    resp = alterar_musicas_playlist(playlist_id, PlaylistBulk(remove=[musica_id, musica_id]))
+    assert resp["remove"] == [{"id_musica": musica_id, "status": "removed"}]
+    assert musicas_da_playlist_route(playlist_id) == []
+
+
+def test_reordenar_playlist():
+    outra = add_musica("Outra", "Indie", 90, album_id, user_id)["id_musica"]
+    alterar_musicas_playlist(playlist_id, PlaylistBulk(add=[musica_id, outra]))
+    assert [m["id_musica"] for m in musicas_da_playlist_route(playlist_id)] == [musica_id, outra]
+
+    resp = mover_musica_playlist_route(playlist_id, outra, PlaylistMover(antes_de=musica_id))
+    assert resp["posicao"] is not None
+    pagina = musicas_da_playlist_route(playlist_id, limit=1)
+    assert [m["id_musica"] for m in pagina] == [outra]
+    pagina = musicas_da_playlist_route(playlist_id, limit=1, cursor=pagina.next_cursor)
+    assert [m["id_musica"] for m in pagina] == [musica_id]
+
+    for destino, status in ((PlaylistMover(), 400), (PlaylistMover(depois_de=424242), 404)):
+        with pytest.raises(HTTPException) as exc:
+            mover_musica_playlist_route(playlist_id, outra, destino)
+        assert exc.value.status_code == status
+
+    alterar_musicas_playlist(playlist_id, PlaylistBulk(remove=[musica_id]))
+    delete_musica(outra)
+
+
+def test_resumo_playlists():
+    alterar_musicas_playlist(playlist_id, PlaylistBulk(add=[musica_id]))
+    resumo = {p["id_playlist"]: p for p in resumo_playlists_usuario(user_id)}[playlist_id]
+    assert resumo["qtd_musicas"] == 1
+    assert resumo["duracao_total_seg"] == 250
+    assert resumo["albuns"] == [album_id]
+    assert resumo["atualizada_em"] is not None
+
+    client = TestClient(app)
+    resp = client.get(f"/usuarios/{user_id}/playlists/resumo")
+    assert resp.status_code == 200
+    alterar_musicas_playlist(playlist_id, PlaylistBulk(remove=[musica_id]))
+    resp = client.get(f"/usuarios/{user_id}/playlists/resumo")
+    assert {p["id_playlist"]: p for p in resp.json()}[playlist_id]["qtd_musicas"] == 0
+
+
+def test_bulk_playlist_inexistente():
+    with pytest.raises(HTTPException) as exc:
+        alterar_musicas_playlist(424242, PlaylistBulk(add=[musica_id]))
+    assert exc.value.status_code == 404
+
+
 # ============================================================
 # 🖼️ RF06 — Upload capa de álbum
 # ============================================================
@@ -166,6 +319,48 @@ async def test_upload_capa():
 def test_get_capa():
     response = get_capa(album_id)
     assert response.status_code == 200
+    assert response.media_type == "image/jpeg"
+
+
+def test_get_capa_variante_e_cache_imutavel():
+    client = TestClient(app)
+    url = f"/albuns/{album_id}/capa?tamanho=thumb"
+    resp = client.get(url, headers={"Accept": "image/webp"})
+    assert resp.status_code == 200, resp.text
+    assert "Accept" in resp.headers["vary"]
+    assert resp.headers["cache-control"] == "public, no-cache"
+    # a capa de teste não é uma imagem de verdade: a variante cai no original
+    assert resp.content == TEST_COVER.getvalue()
+
+    versao = source_version(cover_index.get(album_id))
+    resp = client.get(f"{url}&v={versao}")
+    assert "immutable" in resp.headers["cache-control"]
+    assert client.get(f"/albuns/{album_id}/capa?tamanho=gigante").status_code == 400
+
+
+# ============================================================
+# 💿 Álbuns: listagem com filtros e busca em lote
+# ============================================================
+
+def test_listar_albuns_com_filtros():
+    albuns = listar_albuns_route(id_usuario=user_id)
+    assert [a["id_album"] for a in albuns] == [album_id]
+    assert albuns[0]["qtd_musicas"] >= 1
+    assert listar_albuns_route(id_usuario=user_id, ano_min=2100) == []
+    assert listar_albuns_route(titulo="zzz") == []
+
+
+def test_busca_em_lote():
+    client = TestClient(app)
+    resp = client.get("/musicas", params={"ids": f"999999,{musica_id}", "fields": "nome"})
+    assert resp.status_code == 200, resp.text
+    assert [set(m) for m in resp.json()] == [{"id_musica", "nome"}]
+
+    resp = client.get("/albuns", params={"ids": f"{album_id},424242", "include": "autor"})
+    assert resp.status_code == 200, resp.text
+    assert [a["id_album"] for a in resp.json()] == [album_id]
+    assert resp.json()[0]["autor"]["id_usuario"] == user_id
+    assert client.get("/albuns", params={"ids": "1,x"}).status_code == 400
 
 
 # ============================================================
@@ -191,6 +386,113 @@ def test_listar_musicas():
     assert isinstance(response, list)
 
 
+# ============================================================
+# 📄 RF02 — Paginação por cursor
+# ============================================================
+
+def test_paginacao_por_cursor():
+    client = TestClient(app)
+    ids = [add_musica(f"Pag {i}", "Paginada", 100, album_id, user_id)["id_musica"] for i in range(5)]
+    try:
+        vistos, tamanhos = [], []
+        url = "/musicas/genero/Paginada?limit=2"
+        while url:
+            resp = client.get(url)
+            assert resp.status_code == 200
+            vistos += [m["id_musica"] for m in resp.json()]
+            tamanhos.append(len(resp.json()))
+            url = resp.links.get("next", {}).get("url")
+        assert vistos == ids
+        assert tamanhos == [2, 2, 1]
+
+        # o frontend roda em outra origem e segue o cursor: o header precisa ser exposto
+        resp = client.get("/musicas/genero/Paginada?limit=2", headers={"Origin": "http://localhost:5500"})
+        assert resp.headers["x-next-cursor"]
+        assert "x-next-cursor" in resp.headers["access-control-expose-headers"].lower()
+
+        assert client.get("/musicas?cursor=nao-e-cursor").status_code == 400
+        assert client.get("/musicas?limit=0").status_code == 400
+    finally:
+        for mid in ids:
+            delete_musica(mid)
+
+
+def test_cache_de_listagem_etag_e_invalidacao():
+    client = TestClient(app)
+    url = f"/playlists/{playlist_id}/musicas"
+    primeira = client.get(url)
+    etag = primeira.headers["etag"]
+    assert primeira.headers["cache-control"] == "no-cache"
+
+    nao_mudou = client.get(url, headers={"If-None-Match": etag})
+    assert nao_mudou.status_code == 304
+
+    alterar_musicas_playlist(playlist_id, PlaylistBulk(add=[musica_id]))
+    depois = client.get(url, headers={"If-None-Match": etag})
+    assert depois.status_code == 200
+    assert depois.headers["etag"] != etag
+    assert musica_id in [m["id_musica"] for m in depois.json()]
+
+    alterar_musicas_playlist(playlist_id, PlaylistBulk(remove=[musica_id]))
+    assert client.get(url).json() == []
+
+
+def test_invalidacao_depois_da_escrita(monkeypatch):
+    import cache
+    import crud.albuns
+    import crud.playlists
+
+    def ler_album():
+        return cache.cached_response(
+            None, None, key=("teste_album", album_id),
+            loader=lambda: [dict(memory_db.albums[album_id])],
+            tags=lambda _: [f"album:{album_id}"],
+        )[0]["titulo"]
+
+    # uma leitura concorrente que cai no meio da escrita não pode ficar no cache
+    renomear = crud.albuns.mem_renomear_album
+    monkeypatch.setattr(crud.albuns, "mem_renomear_album", lambda i, t: (ler_album(), renomear(i, t))[1])
+    titulo = memory_db.albums[album_id]["titulo"]
+    try:
+        assert crud.albuns.atualizar_titulo_album(album_id, "Renomeado")
+        assert ler_album() == "Renomeado"
+    finally:
+        renomear(album_id, titulo)
+
+    # playlist criada na hora pelo MemoryDB: a lista do dono real cai
+    invalidadas = []
+    monkeypatch.setattr(crud.playlists, "invalidate", lambda *tags: invalidadas.extend(tags))
+    fantasma = memory_db.playlist_seq + 1000
+    add_music(fantasma, musica_id)
+    criada = memory_db.playlists[memory_db.playlist_seq - 1]
+    try:
+        assert f"usuario:{criada['id_dono']}:playlists" in invalidadas
+    finally:
+        remover_musica_playlist(fantasma, musica_id)
+        excluir_playlist(criada["id_playlist"])
+
+
+def test_exportar_musicas_em_streaming():
+    client = TestClient(app)
+    ids = [add_musica(f"Exp {i}", "Exportada", 100, album_id, user_id)["id_musica"] for i in range(5)]
+    try:
+        resp = client.get("/musicas/export", params={"genero": "Exportada", "fields": "nome"})
+        assert resp.status_code == 200 and resp.headers["content-type"] == "application/json"
+        assert resp.json() == [{"id_musica": mid, "nome": f"Exp {i}"} for i, mid in enumerate(ids)]
+
+        resp = client.get("/musicas/export", params={"id_album": album_id, "genero": "Exportada"},
+                          headers={"Accept": "application/x-ndjson"})
+        assert resp.headers["content-type"] == "application/x-ndjson"
+        assert [json.loads(linha)["id_musica"] for linha in resp.text.splitlines()] == ids
+
+        todas = client.get("/musicas/export?formato=ndjson").text.splitlines()
+        assert len(todas) == len(memory_db.musicas)
+        assert client.get("/musicas/export?formato=csv").status_code == 400
+    finally:
+        for mid in ids:
+            delete_musica(mid)
+
+
 # ============================================================
 # 🗑️ Remover música
 # ============================================================
@@ -198,3 +500,23 @@ def test_listar_musicas():
 def test_deletar_musica():
     response = deletar_musica(musica_id)
     assert response["message"]
+
+
+def test_rotas_admin_exigem_token(monkeypatch):
+    import auth
+
+    client = TestClient(app)
+    monkeypatch.setattr(auth, "ADMIN_TOKEN", None)
+    assert client.post("/admin/media/reconcile").status_code == 403
+
+    monkeypatch.setattr(auth, "ADMIN_TOKEN", "segredo")
+    assert client.post("/admin/media/reconcile").status_code == 401
+    assert client.post("/admin/media/reconcile", headers={"Authorization": "Bearer errado"}).status_code == 401
+    resp = client.post("/admin/media/reconcile", headers={"Authorization": "Bearer segredo"})
+    assert resp.status_code == 200 and "songs" in resp.json()
+
+    assert client.post("/admin/memory-store/snapshot").status_code == 401
+    assert client.delete("/admin/slow-queries").status_code == 401
+    assert client.delete("/admin/slow-queries", headers={"Authorization": "Bearer segredo"}).status_code == 200
+    # com token passa da autenticação (sem MEMORY_DB_DIR, 409)
+    assert client.post("/admin/memory-store/snapshot", headers={"Authorization": "Bearer segredo"}).status_code == 409
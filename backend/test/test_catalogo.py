@@ -0,0 +1,176 @@
+import os
+import sys
+from collections import Counter
+from pathlib import Path
+
+import pytest
+
+os.environ["USE_MEMORY_DB"] = "1"
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+import catalogo  # noqa: E402
+import database as db  # noqa: E402
+import sqlite_db  # noqa: E402
+from media import MediaIndex  # noqa: E402
+
+PEQUENO = dict(usuarios=20, albuns=60, musicas=800, playlists=120, faixas=15, senha_hash="x")
+
+
+@pytest.fixture
+def mem():
+    db.memory_db.reset()
+    yield db.memory_db
+    db.memory_db.reset()
+
+
+def test_gerar_e_deterministico_enviesado_e_em_ordem_de_fk():
+    linhas = list(catalogo.gerar(**PEQUENO))
+    assert linhas == list(catalogo.gerar(**PEQUENO))
+    tabelas = [t for t, _ in linhas]
+    assert list(dict.fromkeys(tabelas)) == list(catalogo.COLUNAS)
+    assert all(set(row) == set(catalogo.COLUNAS[t]) for t, row in linhas)
+
+    musicas = {r["id_musica"]: r for t, r in linhas if t == "musicas"}
+    albuns = {r["id_album"]: r for t, r in linhas if t == "albuns"}
+    assert all(albuns[m["id_album"]]["id_usuario"] == m["id_usuario"] for m in musicas.values())
+
+    generos = Counter(m["genero"] for m in musicas.values()).most_common()
+    assert generos[0][1] > 5 * generos[-1][1]
+    relacao = [(r["id_playlist"], r["id_musica"]) for t, r in linhas if t == "musica_playlist"]
+    assert len(relacao) == len(set(relacao)) and {mid for _, mid in relacao} <= set(musicas)
+    por_faixa = Counter(mid for _, mid in relacao).most_common()
+    assert por_faixa[0][1] > 10 * por_faixa[len(por_faixa) // 2][1]  # cabeça muito maior que a mediana
+
+
+def test_carregar_memoria_refaz_indices_e_agregados(mem):
+    contagem = catalogo.carregar_memoria(catalogo.gerar(**PEQUENO))
+    assert contagem["musicas"] == 800 and len(mem.musicas) == 800
+    pid = max(mem.playlist_ordem, key=lambda p: len(mem.playlist_ordem[p]))
+    faixas = db.musicas_da_playlist(pid)
+    pl = mem.playlists[pid]
+    assert pl["qtd_musicas"] == len(faixas) > 0
+    assert sum(p["qtd_musicas"] for p in mem.playlists.values()) == contagem["musica_playlist"]
+    assert pl["duracao_total_seg"] == sum(m["duracao_seg"] for m in faixas)
+    assert db.buscar_musicas(mem.musicas[1]["nome"], limit=1)[0][1]["nome"] == mem.musicas[1]["nome"]
+    # ids novos continuam depois dos carregados
+    assert db.add_musica("nova", "Pop", 100, 1, 1)["id_musica"] == 801
+
+
+def _estado(m):
+    return (m.users, m.albums, m.musicas, m.playlist_musicas,
+            {pid: (p["qtd_musicas"], p["duracao_total_seg"]) for pid, p in m.playlists.items()})
+
+
+def test_ndjson_ida_e_volta(mem, tmp_path):
+    catalogo.carregar_memoria(catalogo.gerar(**PEQUENO))
+    db.mover_musica_playlist(1, db.musicas_da_playlist(1)[-1]["id_musica"], antes_de=db.musicas_da_playlist(1)[0]["id_musica"])
+    antes = _estado(mem)
+    arquivo = tmp_path / "catalogo.ndjson.gz"
+    total = catalogo.gravar_ndjson(catalogo.linhas_do_banco(batch_size=100), arquivo)
+    assert total == sum(1 for _ in catalogo.ler_ndjson(arquivo))
+
+    mem.reset()
+    catalogo.carregar_memoria(catalogo.ler_ndjson(arquivo))
+    assert _estado(mem) == antes
+
+    (tmp_path / "ruim.ndjson").write_text('{"senhas": {"x": 1}}\n')
+    with pytest.raises(ValueError):
+        list(catalogo.ler_ndjson(tmp_path / "ruim.ndjson"))
+
+
+def test_carregar_no_modo_memoria_grava_snapshot(mem, tmp_path):
+    from memory_store import MemoryStore
+
+    catalogo.carregar(catalogo.gerar(**PEQUENO), memory_dir=tmp_path)
+    antes = _estado(mem)
+    assert mem.wal is None
+    with pytest.raises(ValueError):
+        catalogo.carregar(catalogo.gerar(**PEQUENO), memory_dir=tmp_path)
+
+    mem.reset()
+    store = MemoryStore(tmp_path, snapshot_seconds=0).abrir()
+    try:
+        assert _estado(mem) == antes and store.registros_no_log == 0
+    finally:
+        store.fechar(snapshot=False)
+
+
+def test_recarregar_no_mesmo_diretorio_substitui_o_snapshot(mem, tmp_path):
+    from memory_store import MemoryStore
+
+    catalogo.carregar(catalogo.gerar(**PEQUENO), memory_dir=tmp_path)
+    maior = dict(PEQUENO, musicas=1000, seed=7)
+    catalogo.carregar(catalogo.gerar(**maior), truncar=True, memory_dir=tmp_path)
+    antes = _estado(mem)
+    assert len(mem.musicas) == 1000
+
+    mem.reset()
+    store = MemoryStore(tmp_path, snapshot_seconds=0).abrir()
+    try:
+        assert _estado(mem) == antes
+    finally:
+        store.fechar(snapshot=False)
+
+
+def test_formato_texto_do_copy():
+    leitor = catalogo._LeitorCopy(
+        [{"a": 1, "b": "tab\there\\ e\nlinha"}, {"a": None, "b": "ç"}], ("a", "b"),
+    )
+    dados = b"".join(iter(lambda: leitor.read(7), b""))
+    assert dados.decode() == "1\ttab\\there\\\\ e\\nlinha\n\\N\tç\n"
+    assert leitor.linhas == 2
+
+
+def test_carregar_sqlite_recria_triggers_e_agregados(tmp_path):
+    path = str(tmp_path / "catalogo.db")
+    raw = sqlite_db.connect(path).raw
+    antes = raw.execute("SELECT type, name FROM sqlite_master ORDER BY name").fetchall()
+    contagem = catalogo.carregar_sqlite(catalogo.gerar(**PEQUENO), path)
+    assert raw.execute("SELECT type, name FROM sqlite_master ORDER BY name").fetchall() == antes
+    assert contagem["musica_playlist"] == raw.execute("SELECT count(*) AS n FROM musica_playlist").fetchone()["n"]
+    assert raw.execute(
+        """
+        SELECT count(*) AS erradas FROM playlists p
+        WHERE qtd_musicas <> (SELECT count(*) FROM musica_playlist WHERE id_playlist = p.id_playlist)
+           OR duracao_total_seg <> (SELECT COALESCE(sum(m.duracao_seg), 0) FROM musica_playlist mp
+                                    JOIN musicas m ON m.id_musica = mp.id_musica WHERE mp.id_playlist = p.id_playlist)
+        """
+    ).fetchone()["erradas"] == 0
+
+    # triggers de volta: inserir uma faixa atualiza o agregado; ids seguem a carga
+    qtd = raw.execute("SELECT qtd_musicas AS n FROM playlists WHERE id_playlist = 1").fetchone()["n"]
+    raw.execute("INSERT INTO musica_playlist (id_playlist, id_musica, posicao) "
+                "SELECT 1, max(id_musica), 99999999 FROM musicas "
+                "WHERE id_musica NOT IN (SELECT id_musica FROM musica_playlist WHERE id_playlist = 1)")
+    assert raw.execute("SELECT qtd_musicas AS n FROM playlists WHERE id_playlist = 1").fetchone()["n"] == qtd + 1
+    raw.execute("INSERT INTO usuarios (nome, email, senha_hash) VALUES ('n', 'n@x', 'x')")
+    assert raw.execute("SELECT max(id_usuario) AS m FROM usuarios").fetchone()["m"] == 21
+    catalogo.carregar_sqlite(catalogo.gerar(**PEQUENO), path, truncar=True)
+    assert raw.execute("SELECT count(*) AS n FROM usuarios").fetchone()["n"] == 20
+    sqlite_db.close_all()
+
+
+def test_midia_de_mentira_com_hard_links(tmp_path):
+    index = MediaIndex(tmp_path / "songs", sharded=True)
+    assert catalogo.gerar_midia(30, index) == 30
+    assert catalogo.gerar_midia(30, index) == 0
+    assert index.build() == 30
+    assert index.get(12).path == index.path_for(12, ".mp3")
+    assert index.get(12).stat.st_nlink > 1
+
+
+def test_exportar_so_pela_linha_de_comando(mem, tmp_path, capsys):
+    from fastapi.testclient import TestClient
+    from main import app
+
+    catalogo.carregar_memoria(catalogo.gerar(**PEQUENO))
+    arquivo = tmp_path / "backup.ndjson"
+    catalogo.main(["exportar", str(arquivo)])
+    total = sum(1 for _ in catalogo.linhas_do_banco())
+    assert '"registros": %d' % total in capsys.readouterr().out
+    assert arquivo.read_text().splitlines()[0].startswith('{"usuarios":')
+    # o fluxo leva senha_hash: nenhuma rota o expõe
+    assert TestClient(app).get("/admin/catalogo/export").status_code == 404
@@ -0,0 +1,73 @@
+import sys
+import threading
+import time
+from io import BytesIO
+from pathlib import Path
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+Image = pytest.importorskip("PIL.Image")
+
+import covers  # noqa: E402
+from covers import CoverVariants, negotiate_format  # noqa: E402
+from media import MediaIndex  # noqa: E402
+
+
+@pytest.fixture
+def capa(tmp_path):
+    index = MediaIndex(tmp_path, default_mime="image/jpeg")
+    path = tmp_path / "5.png"
+    Image.new("RGBA", (900, 600), (200, 10, 10, 128)).save(path)
+    index.add(5, path)
+    return CoverVariants(index)
+
+
+def test_variante_redimensionada_e_reencodada(capa):
+    path, mime, versao = capa.get(5, "thumb", "jpeg")
+    assert mime == "image/jpeg"
+    assert path.parent.parent.name == ".variantes"
+    with Image.open(path) as img:
+        assert img.format == "JPEG" and max(img.size) == 128
+
+    # mesma versão do original -> mesmo arquivo; capa nova -> outra versão
+    assert capa.get(5, "thumb", "jpeg") == (path, mime, versao)
+    assert capa.purge(5) == 1 and not path.exists()
+
+
+def test_negocia_formato_pelo_accept():
+    assert negotiate_format("image/avif,image/webp,*/*") in ("avif", "webp")
+    assert negotiate_format("image/webp,*/*") == "webp"
+    assert negotiate_format("*/*") == "jpeg"
+    assert negotiate_format(None) == "jpeg"
+
+
+def test_geracao_simultanea_deduplicada(capa, monkeypatch):
+    chamadas = []
+    render = covers._render
+
+    def lento(*args):
+        chamadas.append(args)
+        time.sleep(0.1)
+        render(*args)
+
+    monkeypatch.setattr(covers, "_render", lento)
+    resultados = []
+    threads = [threading.Thread(target=lambda: resultados.append(capa.get(5, "card", "webp"))) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(chamadas) == 1
+    assert len(set(resultados)) == 1 and resultados[0][1] == "image/webp"
+
+
+def test_original_ilegivel_serve_o_proprio(tmp_path):
+    index = MediaIndex(tmp_path, default_mime="image/jpeg")
+    (tmp_path / "9.jpg").write_bytes(b"nao-e-imagem")
+    index.add(9, tmp_path / "9.jpg")
+    path, mime, _ = CoverVariants(index).get(9, "thumb", "webp")
+    assert path == tmp_path / "9.jpg" and mime == "image/jpeg"
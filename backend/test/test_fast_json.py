@@ -0,0 +1,87 @@
+import sys
+from datetime import date
+from decimal import Decimal
+from pathlib import Path
+
+from fastapi import FastAPI, Response
+from fastapi.testclient import TestClient
+from pydantic import BaseModel
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+import json  # noqa: E402
+
+from fast_json import FastJSONResponse, FastJSONRoute, dumps, stream_json, streaming_response  # noqa: E402
+
+
+class Saida(BaseModel):
+    id: int
+
+
+def make_app():
+    app = FastAPI()
+    app.router.route_class = FastJSONRoute
+
+    @app.get("/linhas", status_code=201)
+    def linhas(n: int, response: Response = None):
+        response.headers["X-Total"] = str(n)
+        return [{"id": i, "em": date(2024, 1, i + 1)} for i in range(n)]
+
+    @app.get("/sem-response")
+    async def sem_response():
+        return {"preco": Decimal("1.50")}
+
+    @app.get("/modelo", response_model=Saida)
+    def modelo():
+        return {"id": 1, "senha_hash": "nao-pode-vazar"}
+
+    return app, linhas
+
+
+def test_rota_rapida_preserva_headers_e_status():
+    app, linhas = make_app()
+    client = TestClient(app)
+    resp = client.get("/linhas?n=2")
+    assert resp.status_code == 201
+    assert resp.headers["x-total"] == "2"
+    assert resp.json() == [{"id": 0, "em": "2024-01-01"}, {"id": 1, "em": "2024-01-02"}]
+    assert client.get("/sem-response").json() == {"preco": 1.5}
+    # response_model continua filtrando pelo caminho normal do FastAPI
+    assert client.get("/modelo").json() == {"id": 1}
+    # o parâmetro injetado não aparece na documentação
+    assert "parameters" not in client.get("/openapi.json").json()["paths"]["/sem-response"]["get"]
+
+
+def test_chamada_direta_continua_devolvendo_lista():
+    _, linhas = make_app()
+    assert linhas(1, Response()) == [{"id": 0, "em": date(2024, 1, 1)}]
+
+
+def test_dumps():
+    assert dumps({"a": [1, "é"], 2: None}) == '{"a":[1,"é"],"2":null}'.encode()
+    assert FastJSONResponse({"ok": True}).body == b'{"ok":true}'
+
+
+def test_stream_json_um_pedaco_por_lote():
+    lotes = [[{"id": 1}, {"id": 2}], [], [{"id": 3, "em": date(2024, 1, 1)}]]
+    pedacos = list(stream_json(iter(lotes)))
+    assert pedacos == [b"[", b'{"id":1},{"id":2}', b',{"id":3,"em":"2024-01-01"}', b"]"]
+    assert json.loads(b"".join(pedacos)) == [{"id": 1}, {"id": 2}, {"id": 3, "em": "2024-01-01"}]
+    assert b"".join(stream_json(iter([]))) == b"[]"
+    assert list(stream_json(iter(lotes), "ndjson")) == [b'{"id":1}\n{"id":2}\n', b'{"id":3,"em":"2024-01-01"}\n']
+
+
+def test_streaming_response_le_o_primeiro_lote_antes_do_status():
+    def lotes():
+        raise RuntimeError("banco fora do ar")
+        yield []
+
+    try:
+        streaming_response(lotes())
+    except RuntimeError:
+        pass
+    else:
+        raise AssertionError("o erro da consulta deveria sair antes da resposta")
+    assert streaming_response(iter([]), "ndjson").media_type == "application/x-ndjson"
@@ -0,0 +1,81 @@
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from hashing import HashPool, HashingBusy  # noqa: E402
+
+# parâmetros baratos para o teste não gastar 100 MB por hash
+LEVE = {"time_cost": 1, "memory_cost": 1024, "parallelism": 1}
+
+
+def test_hash_e_verify_em_processo():
+    pool = HashPool(workers=1, queue_max=1, params=LEVE)
+    try:
+        h = pool.hash("segredo")
+        assert pool.verify("segredo", h) == (True, None)
+        assert pool.verify("errada", h) == (False, None)
+        stats = pool.stats()
+        assert stats["completed"] == 3 and stats["rejected"] == 0
+        assert stats["queue_wait_seconds_max"] >= 0
+    finally:
+        pool.shutdown()
+
+
+def test_rehash_quando_parametros_mudam():
+    antigo = HashPool(workers=0, params=LEVE).hash("segredo")
+    novo_pool = HashPool(workers=0, params={**LEVE, "time_cost": 2})
+    ok, novo = novo_pool.verify("segredo", antigo)
+    assert ok and novo is not None and novo != antigo
+    assert novo_pool.verify("segredo", novo) == (True, None)
+    assert novo_pool.stats()["rehashed"] == 1
+
+
+def test_fila_cheia_recusa_na_hora():
+    pool = HashPool(workers=0, queue_max=0, params=LEVE)
+    entrou, liberar = threading.Event(), threading.Event()
+
+    def lento(params):
+        entrou.set()
+        liberar.wait(5)
+        return None, 0.0, 0.0
+
+    t = threading.Thread(target=pool._run, args=(lento,))
+    t.start()
+    entrou.wait(5)
+    try:
+        with pytest.raises(HashingBusy):
+            pool.hash("segredo")
+    finally:
+        liberar.set()
+        t.join()
+    assert pool.stats()["rejected"] == 1
+    pool.hash("segredo")  # a vaga foi liberada
+
+
+def test_versao_async_espera_sem_thread_e_respeita_a_fila():
+    import asyncio
+
+    pool = HashPool(workers=1, queue_max=1, params=LEVE)
+
+    async def rodar():
+        resultados = await asyncio.gather(
+            *(pool.hash_async("segredo") for _ in range(3)), return_exceptions=True
+        )
+        recusados = [r for r in resultados if isinstance(r, HashingBusy)]
+        hashes = [r for r in resultados if isinstance(r, str)]
+        assert len(recusados) == 1 and len(hashes) == 2
+        assert await pool.verify_async("segredo", hashes[0]) == (True, None)
+
+    try:
+        asyncio.run(rodar())
+        stats = pool.stats()
+        assert stats["completed"] == 3 and stats["rejected"] == 1
+        assert stats["in_flight"] == stats["queued"] == 0
+    finally:
+        pool.shutdown()
@@ -0,0 +1,83 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+os.environ["USE_MEMORY_DB"] = "1"
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+import database as db  # noqa: E402
+from cache import catalog_cache  # noqa: E402
+from crud.musicas import listar_musicas_do_album  # noqa: E402
+from includes import incluir, parse_fields, parse_include, select_list  # noqa: E402
+from main import app  # noqa: E402
+
+
+@pytest.fixture
+def catalogo():
+    db.memory_db.reset()
+    catalog_cache.clear()
+    u = db.add_user("Ana", "ana@example.com", "hash")
+    a = db.create_album("Disco", 2020, u["id_usuario"])
+    musicas = [db.add_musica(f"m{i}", "Rock", 100 + i, a["id_album"], u["id_usuario"]) for i in range(3)]
+    yield u, a, musicas
+    db.memory_db.reset()
+    catalog_cache.clear()
+
+
+def test_parse_fields_inclui_chave_e_estrangeiras():
+    assert parse_fields(None) is None
+    assert parse_fields("nome") == ("id_musica", "nome")
+    assert parse_fields("nome", include=("album",)) == ("id_musica", "nome", "id_album")
+    assert select_list(("id_musica", "nome"), "m") == "m.id_musica, m.nome"
+    assert select_list(None) == "*"
+    for fields, include in (("nome,senha_hash", None), (None, "dono")):
+        with pytest.raises(HTTPException) as exc:
+            parse_fields(fields, parse_include(include))
+        assert exc.value.status_code == 400
+
+
+def test_projecao_e_include_em_lote(catalogo, monkeypatch):
+    u, a, musicas = catalogo
+    chamadas = []
+    import includes
+    carregar = includes.MUSICA_INCLUDES["album"][1]
+    monkeypatch.setitem(
+        includes.MUSICA_INCLUDES, "album",
+        ("id_album", lambda ids: (chamadas.append(set(ids)), carregar(ids))[1], "album"),
+    )
+
+    incl = ("album", "autor")
+    page = listar_musicas_do_album(a["id_album"], limit=2, campos=parse_fields("nome", incl))
+    incluir(page, incl)
+    assert page.next_cursor is not None
+    assert [set(r) for r in page] == [{"id_musica", "nome", "id_album", "id_usuario", "album", "autor"}] * 2
+    assert page[0]["album"]["titulo"] == "Disco"
+    assert page[0]["autor"] == {"id_usuario": u["id_usuario"], "nome": "Ana"}
+    assert chamadas == [{a["id_album"]}]  # uma carga por página, não por linha
+    # as linhas da MemoryDB não ganham os campos embutidos
+    assert "album" not in musicas[0]
+
+
+def test_endpoint_include_fields(catalogo):
+    _, a, _ = catalogo
+    client = TestClient(app)
+    resp = client.get(f"/albuns/{a['id_album']}/musicas", params={"fields": "nome", "include": "album"})
+    assert resp.status_code == 200, resp.text
+    primeira = resp.json()[0]
+    album = primeira.pop("album")
+    assert primeira == {"id_musica": primeira["id_musica"], "nome": "m0", "id_album": a["id_album"]}
+    assert album["titulo"] == "Disco" and "capa" in album
+
+    # renomear o álbum invalida as páginas que o embutiram
+    client.put(f"/albuns/{a['id_album']}", data={"titulo": "Outro"})
+    resp = client.get(f"/albuns/{a['id_album']}/musicas", params={"fields": "nome", "include": "album"})
+    assert resp.json()[0]["album"]["titulo"] == "Outro"
+
+    assert client.get("/musicas", params={"include": "senha"}).status_code == 400
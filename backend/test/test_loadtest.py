@@ -0,0 +1,48 @@
+import asyncio
+import json
+import os
+import sys
+import tempfile
+from argparse import Namespace
+from pathlib import Path
+
+os.environ["USE_MEMORY_DB"] = "1"
+os.environ.setdefault("APP_MEDIA_DIR", tempfile.mkdtemp(prefix="test-media-"))
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+for path in (PROJECT_ROOT, PROJECT_ROOT / "benchmarks"):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
+
+import loadtest  # noqa: E402
+from main import app  # noqa: E402
+
+
+def test_percentile():
+    assert loadtest.percentile([], 50) is None
+    assert loadtest.percentile([10.0], 99) == 10.0
+    assert loadtest.percentile([1, 2, 3, 4], 50) == 2.5
+    assert loadtest.percentile(list(range(101)), 95) == 95
+
+
+def test_jornadas_em_processo():
+    args = Namespace(transport="asgi", users=3, duration=0.3, seed=1, seed_users=2, seed_songs=5)
+    result = asyncio.run(loadtest.run_load(app, args, None))
+    assert result["total"]["requests"] > 0
+    assert result["total"]["errors"] == 0
+    assert "POST /login" in result["routes"]
+    for r in result["routes"].values():
+        assert set(r["latency_ms"]) >= {"p50", "p95", "p99"}
+        # 503 só se o pool de hashing recusar login; o resto tem que dar certo
+        assert all(code in ("200", "206", "503") for code in r["statuses"])
+    json.dumps(result)
+
+
+def test_compare_aponta_regressao(tmp_path, capsys):
+    base = {"routes": {"GET /musicas": {"latency_ms": {"p95": 10.0}, "throughput_rps": 100.0}}}
+    pior = {"routes": {"GET /musicas": {"latency_ms": {"p95": 20.0}, "throughput_rps": 50.0}}}
+    (tmp_path / "a.json").write_text(json.dumps(base))
+    (tmp_path / "b.json").write_text(json.dumps(pior))
+    args = ["compare", str(tmp_path / "a.json"), str(tmp_path / "b.json"), "--fail-on-regression"]
+    assert loadtest.main(args) == 1
+    assert "regressão" in capsys.readouterr().out
@@ -0,0 +1,154 @@
+import hashlib
+import os
+import sys
+from io import BytesIO
+from pathlib import Path
+
+import pytest
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.testclient import TestClient
+from starlette.datastructures import UploadFile
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from media import MediaIndex, MaxBodySizeMiddleware, receive_upload, commit_upload  # noqa: E402
+
+
+def test_media_index_sharded(tmp_path):
+    index = MediaIndex(tmp_path, sharded=True)
+    destino = index.path_for(12301, ".flac")
+    assert destino == tmp_path / "01" / "23" / "12301.flac"
+
+    destino.parent.mkdir(parents=True)
+    destino.write_bytes(b"abc")
+    entry = index.add(12301, destino)
+    assert index.get(12301) is entry
+    assert entry.size == 3 and entry.mime == "audio/flac"
+
+    assert index.remove(12301)
+    assert not destino.exists()
+    assert index.get(12301) is None
+
+
+def test_media_index_reconcile(tmp_path):
+    (tmp_path / "7.mp3").write_bytes(b"x")
+    (tmp_path / ".upload-tmp").write_bytes(b"ignorar")
+    index = MediaIndex(tmp_path)
+    assert index.build() == 1
+
+    # arquivo apagado por fora e outro criado por fora
+    os.unlink(tmp_path / "7.mp3")
+    (tmp_path / "8.ogg").write_bytes(b"y")
+    diff = index.reconcile()
+    assert diff["added"] == [8] and diff["removed"] == [7]
+
+    # ativar sharding num diretório plano e realocar
+    index.sharded = True
+    diff = index.reconcile(relocate=True)
+    assert diff["moved"] == [8]
+    assert index.get(8).path == tmp_path / "08" / "00" / "8.ogg"
+    assert index.get(8).path.exists()
+
+
+
+@pytest.mark.parametrize("sharded", [True, False])
+def test_media_index_ve_arquivos_de_outro_worker(tmp_path, sharded):
+    # dois índices no mesmo diretório = dois workers
+    a = MediaIndex(tmp_path, sharded=sharded, default_mime="audio/mpeg")
+    b = MediaIndex(tmp_path, sharded=sharded, default_mime="audio/mpeg")
+    a.build(), b.build()
+
+    destino = a.path_for(4321, ".ogg")
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    destino.write_bytes(b"abc")
+    a.add(4321, destino)
+    assert b.get(4321).path == destino and 4321 in b
+
+    destino.write_bytes(b"abcdef")  # regravado pelo outro worker
+    assert b.get(4321).size == 6
+
+    a.remove(4321)
+    assert b.get(4321) is None and 4321 not in b
+
+
+def test_relocate_recusa_com_servidor_ativo(tmp_path):
+    (tmp_path / "8.ogg").write_bytes(b"y")
+    servidor = MediaIndex(tmp_path)
+    servidor.build()
+    servidor.marcar_em_uso()
+    cli = MediaIndex(tmp_path, sharded=True)
+    try:
+        assert cli.servidor_ativo()
+        with pytest.raises(RuntimeError):
+            cli.reconcile(relocate=True)
+        assert cli.reconcile()["total"] == 1  # sem mover, tudo bem
+    finally:
+        servidor.liberar_uso()
+    assert not cli.servidor_ativo()
+    assert cli.reconcile(relocate=True)["moved"] == [8]
+
+    # o índice do servidor (agora desatualizado) acha o arquivo no lugar novo
+    assert servidor.get(8) is None  # plano: 8.ogg saiu da raiz
+    servidor.sharded = True
+    assert servidor.get(8).path == tmp_path / "08" / "00" / "8.ogg"
+
+
+@pytest.mark.asyncio
+async def test_receive_upload_em_blocos(tmp_path):
+    data = b"0123456789" * 100
+    upload = UploadFile(file=BytesIO(data), filename="a.mp3")
+    staged = await receive_upload(upload, tmp_path, max_bytes=len(data), chunk_size=64)
+    assert staged.size == len(data)
+    assert staged.sha256 == hashlib.sha256(data).hexdigest()
+    assert staged.tmp_path.name.startswith(".upload-")
+
+    destino = tmp_path / "1.mp3"
+    commit_upload(staged, destino)
+    assert destino.read_bytes() == data
+    assert not staged.tmp_path.exists()
+
+
+@pytest.mark.asyncio
+async def test_receive_upload_limite(tmp_path):
+    upload = UploadFile(file=BytesIO(b"x" * 1000), filename="a.mp3")
+    with pytest.raises(HTTPException) as exc:
+        await receive_upload(upload, tmp_path, max_bytes=100, chunk_size=64)
+    assert exc.value.status_code == 413
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_max_body_size_middleware():
+    app = FastAPI()
+    app.add_middleware(MaxBodySizeMiddleware, max_bytes=10)
+
+    @app.post("/eco")
+    async def eco(request: Request):
+        return {"n": len(await request.body())}
+
+    client = TestClient(app)
+    assert client.post("/eco", content=b"123").json() == {"n": 3}
+    assert client.post("/eco", content=b"x" * 11).status_code == 413
+
+    def gerador():
+        yield b"x" * 8
+        yield b"x" * 8
+
+    # sem Content-Length (chunked): o limite é aplicado ao contar os bytes
+    assert client.post("/eco", content=gerador()).status_code == 413
+
+
+def test_max_body_size_por_rota():
+    app = FastAPI()
+    app.add_middleware(MaxBodySizeMiddleware, max_bytes=100, por_rota=[(r"/capa/\d+", 10)])
+
+    @app.post("/{rota:path}")
+    async def eco(request: Request):
+        return {"n": len(await request.body())}
+
+    client = TestClient(app)
+    assert client.post("/musica", content=b"x" * 50).json() == {"n": 50}
+    assert client.post("/capa/7", content=b"x" * 50).status_code == 413
+    assert client.post("/capa/7", content=iter([b"x" * 8, b"x" * 8])).status_code == 413
+    assert client.post("/capa/7/outra", content=b"x" * 50).json() == {"n": 50}
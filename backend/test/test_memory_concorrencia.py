@@ -0,0 +1,133 @@
+import os
+import random
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+os.environ["USE_MEMORY_DB"] = "1"
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+import database as db  # noqa: E402
+
+ESCRITORES = 8
+LEITORES = 8
+OPERACOES = 400
+
+
+@pytest.fixture
+def mem():
+    db.memory_db.reset()
+    intervalo = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)  # troca de thread o tempo todo: expõe as corridas
+    yield db.memory_db
+    sys.setswitchinterval(intervalo)
+    db.memory_db.reset()
+
+
+def _rodar(alvos):
+    erros = []
+    barreira = threading.Barrier(len(alvos))
+
+    def envolver(fn, *args):
+        def run():
+            barreira.wait()
+            try:
+                fn(*args)
+            except BaseException as exc:  # noqa: BLE001 - repassado ao teste
+                erros.append(exc)
+        return run
+
+    threads = [threading.Thread(target=envolver(fn, *args)) for fn, *args in alvos]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    if erros:
+        raise erros[0]
+
+
+def test_escritores_e_leitores_concorrentes(mem):
+    u = db.add_user("Ana", "ana@example.com", "x")["id_usuario"]
+    albuns = [db.create_album(f"A{i}", 2000 + i, u)["id_album"] for i in range(4)]
+    playlists = [db.create_playlist(f"P{i}", u)["id_playlist"] for i in range(4)]
+    criadas = [[] for _ in range(ESCRITORES)]
+    parar = threading.Event()
+
+    def escritor(n):
+        rnd = random.Random(n)
+        minhas = criadas[n]
+        for i in range(OPERACOES):
+            op = rnd.random()
+            if op < 0.45 or not minhas:
+                m = db.add_musica(f"musica {n} {i}", rnd.choice(["Rock", "Pop"]), rnd.randint(1, 300),
+                                  rnd.choice(albuns), u)
+                minhas.append(m["id_musica"])
+                db.add_musica_playlist(rnd.choice(playlists), m["id_musica"])
+            elif op < 0.6:
+                db.delete_musica(minhas.pop(rnd.randrange(len(minhas))))
+            elif op < 0.75:
+                pid = rnd.choice(playlists)
+                ordem = db.musicas_da_playlist(pid)
+                if len(ordem) >= 2:
+                    a, b = rnd.sample(ordem, 2)
+                    db.mover_musica_playlist(pid, a["id_musica"], antes_de=b["id_musica"])
+            elif op < 0.85:
+                db.add_musicas_playlist(rnd.choice(playlists), rnd.sample(minhas, min(3, len(minhas))))
+            else:
+                db.update_musica(rnd.choice(minhas), f"editada {n} {i}", "Jazz", rnd.randint(1, 300))
+
+    def leitor():
+        while not parar.is_set():
+            db.listar_por_genero("Rock", limit=20)
+            db.musicas_por_album(albuns[0])
+            db.listar_albuns(prefixo="a")
+            db.buscar_musicas("musica 1", limit=10)
+            db.buscar_musicas("mu")
+            for pid in playlists:
+                faixas = db.faixas_da_playlist(pid)
+                posicoes = [pos for pos, _ in faixas]
+                assert posicoes == sorted(posicoes)
+                pl = db.memory_db.playlists[pid]
+                assert pl["qtd_musicas"] >= 0
+
+    def escritores():
+        try:
+            _rodar([(escritor, n) for n in range(ESCRITORES)])
+        finally:
+            parar.set()
+
+    _rodar([(escritores,)] + [(leitor,)] * LEITORES)
+
+    # ids únicos e sequenciais, índices e agregados consistentes no fim
+    vivos = [mid for lista in criadas for mid in lista]
+    assert len(vivos) == len(set(vivos))
+    assert set(mem.musicas) == set(vivos)
+    assert mem.music_seq > max(vivos)
+    for genero, ids in mem.musicas_by_genero.items():
+        assert all(mem.musicas[i]["genero"] == genero for i in ids)
+    assert sum(len(ids) for ids in mem.musicas_by_genero.values()) == len(mem.musicas)
+    for pid in playlists:
+        ordem = mem.playlist_ordem.get(pid, [])
+        assert ordem == sorted(ordem)
+        assert {mid: pos for pos, mid in ordem} == mem.playlist_musicas.get(pid, {})
+        pl = mem.playlists[pid]
+        assert pl["qtd_musicas"] == len(ordem)
+        assert pl["duracao_total_seg"] == sum(mem.musicas[mid]["duracao_seg"] for _, mid in ordem)
+
+
+def test_ids_atomicos(mem):
+    ids = [[] for _ in range(16)]
+
+    def criar(n):
+        for i in range(200):
+            ids[n].append(db.add_user(f"u{n}-{i}", f"u{n}-{i}@example.com", "x")["id_usuario"])
+
+    _rodar([(criar, n) for n in range(16)])
+    todos = [i for lista in ids for i in lista]
+    assert sorted(todos) == list(range(1, 16 * 200 + 1))
+    assert mem.user_seq == 16 * 200 + 1
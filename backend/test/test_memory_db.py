@@ -0,0 +1,146 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+os.environ["USE_MEMORY_DB"] = "1"
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+import database as db  # noqa: E402
+
+
+@pytest.fixture
+def mem():
+    db.memory_db.reset()
+    yield db.memory_db
+    db.memory_db.reset()
+
+
+def test_indices_acompanham_mutacoes(mem):
+    u = db.add_user("Ana", "ana@example.com", "x")
+    a1 = db.create_album("A1", 2020, u["id_usuario"])
+    a2 = db.create_album("A2", 2021, u["id_usuario"])
+    m1 = db.add_musica("m1", "Rock", 100, a1["id_album"], u["id_usuario"])
+    m2 = db.add_musica("m2", "Rock", 100, a2["id_album"], u["id_usuario"])
+    p = db.create_playlist("P", u["id_usuario"])
+    db.add_musica_playlist(p["id_playlist"], m1["id_musica"])
+    db.add_musica_playlist(p["id_playlist"], m2["id_musica"])
+
+    assert db.find_user_by_email("ana@example.com") is u
+    assert db.listar_por_genero("Rock") == [m1, m2]
+    assert db.musicas_por_album(a2["id_album"]) == [m2]
+
+    db.update_musica_metadata(m1["id_musica"], "m1", "Jazz")
+    assert db.listar_por_genero("Rock") == [m2]
+    assert db.listar_por_genero("Jazz") == [{**m1, "genero": "Jazz"}]
+    assert m1["genero"] == "Rock"  # linhas não mudam no lugar: quem já leu não vê a troca
+
+    db.delete_album(a1["id_album"])
+    assert db.musicas_da_playlist(p["id_playlist"]) == [m2]
+    assert db.listar_por_artista(u["id_usuario"]) == [m2]
+    assert "Jazz" not in mem.musicas_by_genero
+
+    db.deletar_playlist(p["id_playlist"])
+    assert db.playlists_by_user(u["id_usuario"]) == []
+    assert mem.musica_playlists == {} and mem.playlist_musicas == {}
+
+
+def _ordem(pid):
+    return [m["id_musica"] for m in db.musicas_da_playlist(pid)]
+
+
+def test_mover_musica_so_muda_a_faixa_movida(mem):
+    u = db.add_user("Ana", "ana@example.com", "x")
+    a = db.create_album("A", 2020, u["id_usuario"])
+    mids = [db.add_musica(f"m{i}", "Rock", 100, a["id_album"], u["id_usuario"])["id_musica"] for i in range(4)]
+    pid = db.create_playlist("P", u["id_usuario"])["id_playlist"]
+    for mid in mids:
+        db.add_musica_playlist(pid, mid)
+    antes = dict(mem.playlist_musicas[pid])
+
+    assert db.mover_musica_playlist(pid, mids[3], antes_de=mids[0]) < antes[mids[0]]
+    assert _ordem(pid) == [mids[3], mids[0], mids[1], mids[2]]
+    assert db.mover_musica_playlist(pid, mids[0], depois_de=mids[2]) is not None
+    assert _ordem(pid) == [mids[3], mids[1], mids[2], mids[0]]
+    # só as faixas movidas trocaram de posição
+    assert {m for m in mids if mem.playlist_musicas[pid][m] != antes[m]} == {mids[0], mids[3]}
+
+    assert db.mover_musica_playlist(pid, mids[0], depois_de=999) is None
+    db.remove_musica_playlist(pid, mids[1])
+    assert _ordem(pid) == [mids[3], mids[2], mids[0]]
+    db.add_musica_playlist(pid, mids[1])
+    assert _ordem(pid)[-1] == mids[1]
+
+
+def test_mover_musica_renumera_quando_acaba_o_espaco(mem, monkeypatch):
+    u = db.add_user("Ana", "ana@example.com", "x")
+    a = db.create_album("A", 2020, u["id_usuario"])
+    m1, m2, m3 = (db.add_musica(f"m{i}", "Rock", 100, a["id_album"], u["id_usuario"])["id_musica"] for i in range(3))
+    pid = db.create_playlist("P", u["id_usuario"])["id_playlist"]
+    for mid in (m1, m2, m3):
+        db.add_musica_playlist(pid, mid)
+
+    # cada movimento divide ao meio o intervalo logo depois de m1: em ~10
+    # passos não sobra inteiro e a playlist tem de ser renumerada
+    renumeracoes = []
+    original = db._rebalancear
+    monkeypatch.setattr(db, "_rebalancear", lambda p: (renumeracoes.append(p), original(p)))
+    for _ in range(20):
+        db.mover_musica_playlist(pid, m3, depois_de=m1)
+        db.mover_musica_playlist(pid, m2, depois_de=m1)
+    assert _ordem(pid) == [m1, m2, m3]
+    assert renumeracoes
+    posicoes = [p for p, _ in mem.playlist_ordem[pid]]
+    assert posicoes == sorted(set(posicoes))
+    assert db.delete_musica(m3)
+    assert _ordem(pid) == [m1, m2]
+
+
+def test_agregados_da_playlist_acompanham_mutacoes(mem):
+    u = db.add_user("Ana", "ana@example.com", "x")
+    a1 = db.create_album("A1", 2020, u["id_usuario"])
+    a2 = db.create_album("A2", 2021, u["id_usuario"])
+    m1 = db.add_musica("m1", "Rock", 100, a1["id_album"], u["id_usuario"])["id_musica"]
+    m2 = db.add_musica("m2", "Rock", 200, a2["id_album"], u["id_usuario"])["id_musica"]
+    m3 = db.add_musica("m3", "Rock", 300, a1["id_album"], u["id_usuario"])["id_musica"]
+    pl = db.create_playlist("P", u["id_usuario"])
+    pid = pl["id_playlist"]
+    criada = pl["atualizada_em"]
+
+    def agregados():
+        pl = mem.playlists[pid]
+        return pl["qtd_musicas"], pl["duracao_total_seg"]
+
+    db.add_musicas_playlist(pid, [m1, m2, m3])
+    assert agregados() == (3, 600)
+    assert mem.playlists[pid]["atualizada_em"] >= criada
+    assert db.albuns_da_playlist(pid, 20, 4) == [a1["id_album"], a2["id_album"]]
+
+    db.update_musica(m2, "m2", "Rock", 250)
+    assert agregados() == (3, 650)
+    db.remove_musica_playlist(pid, m1)
+    assert agregados() == (2, 550)
+    db.delete_album(a2["id_album"])
+    assert agregados() == (1, 300)
+    assert db.albuns_da_playlist(pid, 20, 4) == [a1["id_album"]]
+
+
+def test_listar_albuns_filtros(mem):
+    ana = db.add_user("Ana", "ana@example.com", "x")["id_usuario"]
+    bia = db.add_user("Bia", "bia@example.com", "x")["id_usuario"]
+    a1 = db.create_album("Rock Antigo", 1995, ana)
+    a2 = db.create_album("rock novo", 2021, ana)
+    a3 = db.create_album("Jazz", 2010, bia)
+
+    assert db.listar_albuns(id_usuario=ana) == [a1, a2]
+    assert db.listar_albuns(prefixo="ROCK") == [a1, a2]
+    assert db.listar_albuns(ano_min=2000) == [a2, a3]
+    assert db.listar_albuns(ano_min=2000, ano_max=2015) == [a3]
+    assert db.listar_albuns(after=a1["id_album"], limit=1) == [a2]
+
+    db.delete_album(a1["id_album"])
+    assert db.listar_albuns(id_usuario=ana) == [a2]
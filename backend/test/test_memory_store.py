@@ -0,0 +1,105 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+os.environ["USE_MEMORY_DB"] = "1"
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+import database as db  # noqa: E402
+from memory_store import MemoryStore  # noqa: E402
+
+
+def _estado():
+    m = db.memory_db
+    return (
+        m.users, m.albums, m.musicas, m.playlists, m.playlist_musicas, m.playlist_ordem,
+        m.musicas_by_genero, m.musica_playlists, m.albums_by_usuario, m.playlists_by_dono,
+        (m.user_seq, m.album_seq, m.music_seq, m.playlist_seq),
+    )
+
+
+def _copia():
+    import copy
+    return copy.deepcopy(_estado())
+
+
+@pytest.fixture
+def store_dir(tmp_path):
+    db.memory_db.reset()
+    yield tmp_path
+    db.memory_db.wal = None
+    db.memory_db.reset()
+
+
+def _popular():
+    u = db.add_user("Ana", "ana@example.com", "h")
+    a = db.create_album("Disco", 2020, u["id_usuario"])
+    mids = [db.add_musica(f"Canção {i}", "Rock", 100 + i, a["id_album"], u["id_usuario"])["id_musica"]
+            for i in range(5)]
+    p = db.create_playlist("mix", u["id_usuario"])
+    db.add_musicas_playlist(p["id_playlist"], mids)
+    return u, a, p, mids
+
+
+def test_restaura_snapshot_mais_log(store_dir):
+    store = MemoryStore(store_dir, snapshot_seconds=0).abrir()
+    u, a, p, mids = _popular()
+    assert store.snapshot() == 2
+    # depois do snapshot: só no log
+    db.mover_musica_playlist(p["id_playlist"], mids[4], antes_de=mids[0])
+    db.update_musica(mids[1], "Outra", "Pop", 50)
+    db.delete_musica(mids[2])
+    db.add_musica_playlist(99, mids[3])  # cria a playlist 99 (chamada aninhada)
+    db.renomear_playlist(p["id_playlist"], "novo nome")
+    antes = _copia()
+    assert sorted(f.name for f in store_dir.iterdir()) == ["snapshot-000002.bin", "wal-000002.log"]
+
+    # "queda": sem snapshot final
+    db.memory_db.wal = None
+    db.memory_db.reset()
+    MemoryStore(store_dir, snapshot_seconds=0).abrir()
+    assert _copia() == antes
+    assert [h.id for h in db.memory_db.musicas_busca.search("cancao 3")][:1] == [mids[3]]
+    assert db.add_user("Bia", "bia@example.com", "h")["id_usuario"] == u["id_usuario"] + 1
+
+
+def test_fechar_grava_snapshot_e_apaga_log(store_dir):
+    store = MemoryStore(store_dir, snapshot_seconds=0).abrir()
+    _popular()
+    antes = _copia()
+    store.fechar()
+    assert db.memory_db.wal is None
+    assert sorted(f.name for f in store_dir.iterdir()) == ["snapshot-000002.bin", "wal-000002.log"]
+    assert (store_dir / "wal-000002.log").stat().st_size == 0
+
+    db.memory_db.reset()
+    novo = MemoryStore(store_dir, snapshot_seconds=0).abrir()
+    assert _copia() == antes and novo.registros_no_log == 0
+
+
+def test_registro_cortado_no_fim_e_descartado(store_dir):
+    store = MemoryStore(store_dir, snapshot_seconds=0).abrir()
+    db.add_user("Ana", "ana@example.com", "h")
+    db.add_user("Bia", "bia@example.com", "h")
+    log = store_dir / f"wal-{store.segmento:06d}.log"
+    tamanho = log.stat().st_size
+    with open(log, "ab") as f:
+        f.write(b"\x40\x00\x00\x00\x00\x00\x00\x00parcial")  # queda no meio de um registro
+
+    db.memory_db.wal = None
+    db.memory_db.reset()
+    MemoryStore(store_dir, snapshot_seconds=0).abrir()
+    assert [u["nome"] for u in db.memory_db.users.values()] == ["Ana", "Bia"]
+    assert log.stat().st_size == tamanho
+
+
+def test_operacao_sem_efeito_nao_vai_para_o_log(store_dir):
+    store = MemoryStore(store_dir, snapshot_seconds=0).abrir()
+    assert db.delete_musica(12345) is False
+    assert db.renomear_album(1, "x") is False
+    assert store.registros_no_log == 0
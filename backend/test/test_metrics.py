@@ -0,0 +1,93 @@
+import sys
+from pathlib import Path
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+import metrics  # noqa: E402
+from database import TimedConnection  # noqa: E402
+from metrics import Counter, Histogram, MetricsMiddleware  # noqa: E402
+
+
+class FakeCursor:
+    def __init__(self, rows):
+        self.rows = list(rows)
+
+    def execute(self, query, params=None):
+        self.query = query
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+    def fetchone(self):
+        return self.rows.pop(0) if self.rows else None
+
+    def close(self):
+        pass
+
+
+class FakeConn:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def cursor(self):
+        return FakeCursor(self.rows)
+
+    def commit(self):
+        self.committed = True
+
+
+def make_app():
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/itens/{id_item}")
+    def item(id_item: int):
+        cur = TimedConnection(FakeConn([{"id": 1}, {"id": 2}, {"id": 3}])).cursor()
+        cur.execute("SELECT 1")
+        return {"rows": len(cur.fetchall())}
+
+    return app
+
+
+def test_histograma_e_formato_texto():
+    h = Histogram("t_seconds", "teste", ("route",), buckets=(0.1, 1.0))
+    h.observe(0.05, "/a")
+    h.observe(0.5, "/a")
+    h.observe(5, "/a")
+    text = "\n".join(h.render())
+    assert '# TYPE t_seconds histogram' in text
+    assert 't_seconds_bucket{route="/a",le="0.1"} 1' in text
+    assert 't_seconds_bucket{route="/a",le="1"} 2' in text
+    assert 't_seconds_bucket{route="/a",le="+Inf"} 3' in text
+    assert 't_seconds_count{route="/a"} 3' in text
+
+    c = Counter("t_total", "teste", ("nome",))
+    c.inc('com "aspas"', amount=2)
+    assert 't_total{nome="com \\"aspas\\""} 2' in c.render()
+
+
+def test_middleware_rotula_pela_rota_template():
+    client = TestClient(make_app())
+    route = "/itens/{id_item}"
+    antes = metrics.http_requests.value("GET", route, "200")
+    consultas = metrics.db_queries.value(route)
+    linhas = metrics.db_rows.value(route)
+
+    for i in range(3):
+        assert client.get(f"/itens/{i}").json() == {"rows": 3}
+    client.get("/nao-existe")
+
+    assert metrics.http_requests.value("GET", route, "200") == antes + 3
+    assert metrics.http_requests.value("GET", metrics.UNMATCHED, "404") >= 1
+    assert metrics.http_in_flight.value("GET", route) == 0
+    assert metrics.db_queries.value(route) == consultas + 3
+    assert metrics.db_rows.value(route) == linhas + 9
+    text = metrics.render()
+    assert 'http_request_duration_seconds_count{method="GET",route="/itens/{id_item}"}' in text
+    assert 'route="/itens/1"' not in text
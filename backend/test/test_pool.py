@@ -0,0 +1,86 @@
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from database import ConnectionPool, PoolTimeout  # noqa: E402
+
+
+class FakeConn:
+    def __init__(self):
+        self.closed = False
+        self.rollbacks = 0
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = True
+
+
+def make_pool(**kwargs):
+    created = []
+
+    def connect():
+        conn = FakeConn()
+        created.append(conn)
+        return conn
+
+    opts = {"minconn": 0, "maxconn": 2, "timeout": 0.05, "max_uses": 0, "healthcheck_idle": -1}
+    opts.update(kwargs)
+    return ConnectionPool(connect, **opts), created
+
+
+def test_pool_reutiliza_conexao():
+    pool, created = make_pool()
+    conn = pool.getconn()
+    pool.putconn(conn)
+    assert pool.getconn() is conn
+    assert len(created) == 1
+    assert conn.rollbacks == 1
+
+
+def test_pool_timeout_quando_esgotado():
+    pool, _ = make_pool(maxconn=1)
+    pool.getconn()
+    with pytest.raises(PoolTimeout):
+        pool.getconn()
+    assert pool.stats()["timeouts"] == 1
+
+
+def test_pool_recicla_apos_max_uses():
+    pool, created = make_pool(max_uses=2)
+    conn = pool.getconn()
+    pool.putconn(conn)
+    conn = pool.getconn()
+    pool.putconn(conn)
+    assert conn.closed
+    assert pool.getconn() is not conn
+    assert pool.stats()["recycled"] == 1
+    assert len(created) == 2
+
+
+def test_pool_descarta_conexao_fechada():
+    pool, _ = make_pool()
+    conn = pool.getconn()
+    conn.closed = True
+    pool.putconn(conn)
+    stats = pool.stats()
+    assert stats["idle"] == 0 and stats["size"] == 0 and stats["discarded"] == 1
+
+
+def test_pool_libera_quem_espera():
+    pool, _ = make_pool(maxconn=1, timeout=2)
+    conn = pool.getconn()
+    got = []
+    t = threading.Thread(target=lambda: got.append(pool.getconn()))
+    t.start()
+    pool.putconn(conn)
+    t.join()
+    assert got == [conn]
+    assert pool.stats()["in_use"] == 1
@@ -0,0 +1,49 @@
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from search import TrigramIndex, normalize  # noqa: E402
+
+
+def make_index():
+    index = TrigramIndex()
+    for i, nome in enumerate([
+        "Canção do Mar",
+        "Mar Aberto",
+        "Garota de Ipanema",
+        "Águas de Março",
+        "Marcha Soldado",
+    ], start=1):
+        index.add(i, nome)
+    return index
+
+
+def test_normalize_remove_acentos():
+    assert normalize("  Canção, do MAR! ") == "cancao do mar"
+
+
+def test_busca_sem_acento_e_ranking():
+    index = make_index()
+    ids = [h.id for h in index.search("mar")]
+    # prefixo antes de substring; "Águas de Março" casa sem acento
+    assert ids[:2] == [2, 5]
+    assert set(ids) >= {1, 2, 4, 5}
+    assert [h.id for h in index.search("AGUAS")] == [4]
+
+
+def test_busca_tolera_erro_de_digitacao():
+    index = make_index()
+    resultado = index.search("ipanemma")
+    assert resultado and resultado[0].id == 3 and resultado[0].tier == 3
+    assert index.search("xyzxyz") == []
+
+
+def test_remove_e_atualiza():
+    index = make_index()
+    index.remove(3)
+    assert index.search("ipanema") == []
+    index.add(2, "Outro Nome")
+    assert 2 not in [h.id for h in index.search("aberto")]
@@ -0,0 +1,80 @@
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+import slowlog  # noqa: E402
+from database import TimedCursor  # noqa: E402
+from slowlog import SlowQueryLog, normalize_sql, redact  # noqa: E402
+
+
+class FakeConn:
+    def __init__(self):
+        self.executed = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.connection = conn
+        self._rows = []
+
+    def execute(self, sql, params=None):
+        self.connection.executed.append(sql)
+        if sql.startswith("EXPLAIN"):
+            self._rows = [{"QUERY PLAN": "Seq Scan on musicas"}, {"QUERY PLAN": "Execution Time: 9.1 ms"}]
+
+    def fetchall(self):
+        return self._rows
+
+    def close(self):
+        pass
+
+
+def test_normalize_sql():
+    sql = """
+        SELECT * FROM musicas
+        WHERE LOWER(nome) LIKE '%rock%' AND id_album = 12 AND id_musica > %s;
+    """
+    assert normalize_sql(sql) == "SELECT * FROM musicas WHERE LOWER(nome) LIKE ? AND id_album = ? AND id_musica > %s"
+
+
+def test_redact():
+    assert redact(("segredo", 42, None, [1, 2])) == ["<str len=7>", "<int>", None, "<list len=2>"]
+    assert redact({"email": "a@b.c"}) == {"email": "<str len=5>"}
+
+
+def test_top_n_e_explain_so_em_leitura():
+    log = SlowQueryLog(threshold_ms=10, top_n=2, explain_rate=1.0, params_mode="redact")
+    conn = FakeConn()
+    cur = conn.cursor()
+    log.record(cur, "SELECT * FROM musicas WHERE id=%s", (1,), 0.020, route="/musicas")
+    log.record(cur, "DELETE FROM musicas WHERE id=%s", (1,), 0.050, route="/musicas/{id_musica}")
+    log.record(cur, "SELECT 1", None, 0.011, route="/ping")
+
+    snap = log.snapshot()
+    assert [e["duration_ms"] for e in snap["top"]] == [50.0, 20.0]
+    assert [e["route"] for e in snap["recent"]] == ["/ping", "/musicas/{id_musica}"]  # só as N últimas
+    select, delete = snap["top"][1], snap["top"][0]
+    assert select["explain"] == "Seq Scan on musicas\nExecution Time: 9.1 ms"
+    assert select["params"] == ["<int>"]
+    assert delete["explain"] is None  # EXPLAIN ANALYZE executaria o DELETE
+    assert "EXPLAIN (ANALYZE, BUFFERS) SELECT * FROM musicas WHERE id=%s" in conn.executed
+    assert conn.executed[-1] == "RELEASE SAVEPOINT slowlog_explain"
+
+
+def test_cursor_instrumentado_registra_so_acima_do_limite(monkeypatch):
+    log = SlowQueryLog(threshold_ms=0.0001, top_n=5, explain_rate=0)
+    monkeypatch.setattr(slowlog, "slow_log", log)
+    monkeypatch.setattr("database.slow_log", log)
+    TimedCursor(FakeCursor(FakeConn())).execute("SELECT nome FROM musicas WHERE id_musica=%s", (7,))
+    assert log.snapshot()["top"][0]["sql"] == "SELECT nome FROM musicas WHERE id_musica=%s"
+
+    desligado = SlowQueryLog(threshold_ms=0)
+    monkeypatch.setattr("database.slow_log", desligado)
+    TimedCursor(FakeCursor(FakeConn())).execute("SELECT 1")
+    assert desligado.snapshot()["total"] == 0
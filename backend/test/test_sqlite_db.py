@@ -0,0 +1,211 @@
+import json
+import os
+import subprocess
+import sys
+import textwrap
+import threading
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+import sqlite_db  # noqa: E402
+from sqlite_db import traduzir  # noqa: E402
+
+
+def test_traduz_dialeto_postgres():
+    sql, trava = traduzir("SELECT id FROM playlists WHERE id_playlist=%s FOR UPDATE;")
+    assert sql == "SELECT id FROM playlists WHERE id_playlist=?;" and trava
+    sql, trava = traduzir("SELECT * FROM musicas WHERE id_musica = ANY(%s) AND (%s::bigint IS NULL OR id_musica > %s)")
+    assert sql == "SELECT * FROM musicas WHERE id_musica IN (SELECT value FROM json_each(?)) AND (? IS NULL OR id_musica > ?)"
+    assert not trava
+    sql, _ = traduzir("SELECT 1 WHERE lower(nome) LIKE %(sub)s AND %(q)s <> '%%'")
+    assert sql == "SELECT 1 WHERE lower(nome) LIKE :sub ESCAPE '\\' AND :q <> '%'"
+    assert "strftime" in traduzir("UPDATE playlists SET atualizada_em=NOW()")[0]
+
+
+def test_conexao_por_thread_e_agregados(tmp_path):
+    path = str(tmp_path / "catalogo.db")
+    conn = sqlite_db.connect(path)
+    assert sqlite_db.connect(path) is conn
+    cur = conn.cursor()
+    cur.execute("PRAGMA journal_mode")
+    assert cur.fetchone()["journal_mode"] == "wal"
+
+    cur.execute("INSERT INTO usuarios (nome, email, senha_hash) VALUES (%s, %s, %s) RETURNING id_usuario;",
+                ("Ana", "ana@example.com", "x"))
+    uid = cur.fetchone()["id_usuario"]
+    cur.execute("INSERT INTO albuns (titulo, ano, id_usuario) VALUES (%s, %s, %s) RETURNING id_album;",
+                ("Disco", 2020, uid))
+    aid = cur.fetchone()["id_album"]
+    cur.executemany("INSERT INTO musicas (nome, duracao_seg, id_album, id_usuario) VALUES (%s, %s, %s, %s);",
+                    [("a", 100, aid, uid), ("b", 50, aid, uid)])
+    cur.execute("INSERT INTO playlists (nome, id_dono) VALUES (%s, %s) RETURNING id_playlist;", ("p", uid))
+    pid = cur.fetchone()["id_playlist"]
+    cur.executemany("INSERT INTO musica_playlist (id_playlist, id_musica, posicao) VALUES (%s, %s, %s);",
+                    [(pid, 1, 1024), (pid, 2, 2048)])
+    conn.commit()
+
+    cur.execute("DELETE FROM musicas WHERE id_musica = ANY(%s);", ([1],))  # cascade em musica_playlist
+    conn.rollback()  # transação desfeita: nada muda
+    cur.execute("SELECT qtd_musicas, duracao_total_seg FROM playlists WHERE id_playlist=%s;", (pid,))
+    assert cur.fetchone() == {"qtd_musicas": 2, "duracao_total_seg": 150}
+
+    cur.execute("DELETE FROM musicas WHERE id_musica = ANY(%s);", ([1],))
+    conn.commit()
+    cur.execute("SELECT qtd_musicas, duracao_total_seg FROM playlists WHERE id_playlist=%s;", (pid,))
+    assert cur.fetchone() == {"qtd_musicas": 1, "duracao_total_seg": 50}
+    sqlite_db.close_all()
+    assert sqlite_db.connect(path) is not conn
+
+
+def test_cursor_nomeado_le_em_lotes_num_snapshot(tmp_path):
+    path = str(tmp_path / "catalogo.db")
+    conn = sqlite_db.connect(path)
+    cur = conn.cursor()
+    cur.execute("INSERT INTO usuarios (nome, email, senha_hash) VALUES ('Ana', 'a@example.com', 'x');")
+    cur.executemany("INSERT INTO albuns (titulo, ano, id_usuario) VALUES (%s, 2020, 1);",
+                    [(f"A{i}",) for i in range(10)])
+    conn.commit()
+
+    stream = conn.cursor(name="stream_1")
+    stream.execute("SELECT id_album FROM albuns WHERE id_album > %s ORDER BY id_album;", (0,))
+    assert [r["id_album"] for r in stream.fetchmany(4)] == [1, 2, 3, 4]
+    # escrita concorrente (pela conexão da thread) não aparece no snapshot do cursor
+    cur.execute("INSERT INTO albuns (titulo, ano, id_usuario) VALUES ('novo', 2021, 1);")
+    conn.commit()
+    assert [r["id_album"] for r in stream.fetchmany(100)] == [5, 6, 7, 8, 9, 10]
+    assert stream.fetchmany(100) == []
+    stream.close()
+    assert stream.connection.closed and not conn.closed
+    sqlite_db.close_all()
+
+
+def test_stream_query_nao_desfaz_transacao_de_outra_thread(tmp_path, monkeypatch):
+    import database
+
+    path = str(tmp_path / "catalogo.db")
+    monkeypatch.setattr(database, "USE_SQLITE", True)
+    monkeypatch.setattr(database, "SQLITE_PATH", path)
+    conn = sqlite_db.connect(path)
+    cur = conn.cursor()
+    cur.execute("INSERT INTO usuarios (nome, email, senha_hash) VALUES ('Ana', 'a@example.com', 'x');")
+    cur.executemany("INSERT INTO albuns (titulo, ano, id_usuario) VALUES (%s, 2020, 1);",
+                    [(f"A{i}",) for i in range(5)])
+    conn.commit()
+
+    # a thread principal começa o stream e abre uma transação na sua conexão
+    stream = database.stream_query("SELECT id_album FROM albuns ORDER BY id_album;", batch_size=2)
+    assert [r["id_album"] for r in next(stream)] == [1, 2]
+    cur.execute("INSERT INTO albuns (titulo, ano, id_usuario) VALUES ('pendente', 2021, 1);")
+
+    # ...e o gerador termina em outra thread (como no threadpool do Starlette)
+    lotes = []
+    t = threading.Thread(target=lambda: lotes.extend(stream))
+    t.start()
+    t.join()
+    assert [r["id_album"] for lote in lotes for r in lote] == [3, 4, 5]
+
+    assert conn.raw.in_transaction
+    conn.commit()
+    cur.execute("SELECT count(*) AS n FROM albuns;")
+    assert cur.fetchone() == {"n": 6}
+    sqlite_db.close_all()
+
+
+_WORKER = textwrap.dedent("""
+    import sys
+    sys.path.insert(0, {root!r})
+    from fastapi.testclient import TestClient
+    from main import app
+
+    client = TestClient(app)
+    for i in range({n}):
+        r = client.post("/musicas/criar", data={{
+            "nome": f"w{{sys.argv[1]}}-{{i}}", "genero": "Rock", "duracao_seg": 10,
+            "id_album": 1, "id_usuario": 1, "id_playlist": 1,
+        }}, files={{"arquivo": ("x.mp3", b"ID3", "audio/mpeg")}})
+        assert r.status_code == 200, r.text
+""")
+
+_FLOW = textwrap.dedent("""
+    import json, sys
+    sys.path.insert(0, {root!r})
+    from fastapi.testclient import TestClient
+    from main import app
+
+    client = TestClient(app)
+    out = {{}}
+    out["busca"] = [m["nome"] for m in client.get("/musicas", params={{"nome": "cancao"}}).json()]
+    out["typo"] = [m["nome"] for m in client.get("/musicas", params={{"nome": "Cançao azl"}}).json()]
+    bulk = client.post("/playlists/1/musicas/bulk", json={{"add": [2, 3, 999], "remove": [1]}}).json()
+    out["bulk"] = [r["status"] for r in bulk["add"] + bulk["remove"]]
+    out["mover"] = client.post("/playlists/1/musicas/3/mover", json={{"antes_de": 2}}).status_code
+    out["ordem"] = [m["id_musica"] for m in client.get("/playlists/1/musicas").json()]
+    out["resumo"] = client.get("/usuarios/1/playlists/resumo").json()[0]
+    out["albuns"] = client.get("/albuns", params={{"titulo": "dis", "include": "autor"}}).json()
+    out["lote"] = [m["id_musica"] for m in client.get("/musicas", params={{"ids": "3,2"}}).json()]
+    out["export"] = client.get("/musicas/export?formato=ndjson&genero=Pop").text.count("\\n")
+    out["login"] = client.post("/login", json={{"email": "ana@example.com", "senha": "segredo123"}}).status_code
+    out["del_album"] = client.delete("/albuns/1").status_code
+    out["resumo_depois"] = client.get("/usuarios/1/playlists/resumo").json()[0]["qtd_musicas"]
+    print(json.dumps(out))
+""")
+
+
+def _run(script, env, *args):
+    proc = subprocess.Popen(
+        [sys.executable, "-c", script, *args], env=env, cwd=PROJECT_ROOT,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+    )
+    return proc
+
+
+def test_workers_compartilham_o_arquivo(tmp_path):
+    db_path = tmp_path / "catalogo.db"
+    env = {**os.environ, "USE_MEMORY_DB": "0", "SQLITE_PATH": str(db_path),
+           "APP_MEDIA_DIR": str(tmp_path / "media")}
+
+    conn = sqlite_db.connect(str(db_path))
+    cur = conn.cursor()
+    from hashing import hash_password
+    cur.execute("INSERT INTO usuarios (nome, email, senha_hash) VALUES (%s, %s, %s);",
+                ("Ana", "ana@example.com", hash_password("segredo123")))
+    cur.execute("INSERT INTO albuns (titulo, ano, id_usuario) VALUES ('Disco', 2020, 1);")
+    cur.execute("INSERT INTO playlists (nome, id_dono) VALUES ('mix', 1);")
+    cur.executemany("INSERT INTO musicas (nome, genero, duracao_seg, id_album, id_usuario) VALUES (%s, 'Pop', 60, 1, 1);",
+                    [("Canção Azul",), ("Outra",), ("Cancao",)])
+    cur.execute("INSERT INTO musica_playlist (id_playlist, id_musica, posicao) VALUES (1, 1, 1024);")
+    conn.commit()
+    sqlite_db.close_all()
+
+    # dois "workers" gravando ao mesmo tempo na mesma playlist
+    workers = [_run(_WORKER.format(root=str(PROJECT_ROOT), n=15), env, str(w)) for w in range(2)]
+    for proc in workers:
+        _, err = proc.communicate(timeout=120)
+        assert proc.returncode == 0, err
+
+    conn = sqlite_db.connect(str(db_path))
+    cur = conn.cursor()
+    cur.execute("SELECT count(*) AS n, count(DISTINCT posicao) AS pos FROM musica_playlist WHERE id_playlist=1;")
+    assert cur.fetchone() == {"n": 31, "pos": 31}
+    cur.execute("SELECT qtd_musicas, duracao_total_seg FROM playlists WHERE id_playlist=1;")
+    assert cur.fetchone() == {"qtd_musicas": 31, "duracao_total_seg": 60 + 30 * 10}
+    sqlite_db.close_all()
+
+    proc = _run(_FLOW.format(root=str(PROJECT_ROOT)), env)
+    stdout, err = proc.communicate(timeout=120)
+    assert proc.returncode == 0, err
+    out = json.loads(stdout.strip().splitlines()[-1])
+    assert out["busca"] == ["Cancao", "Canção Azul"]
+    assert out["typo"][0] == "Canção Azul"  # parecido, mais similar primeiro
+    assert out["bulk"] == ["added", "added", "not_found", "removed"]
+    assert out["mover"] == 200
+    assert out["ordem"][-2:] == [3, 2]
+    assert out["resumo"]["qtd_musicas"] == 32 and out["resumo"]["albuns"] == [1]
+    assert out["albuns"][0]["qtd_musicas"] == 33 and out["albuns"][0]["autor"]["nome"] == "Ana"
+    assert out["lote"] == [3, 2]
+    assert out["export"] == 3
+    assert out["login"] == 200
+    assert out["del_album"] == 200 and out["resumo_depois"] == 0
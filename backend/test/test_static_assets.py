@@ -0,0 +1,77 @@
+import sys
+from pathlib import Path
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from static_assets import StaticAssets, choose_encoding  # noqa: E402
+
+CSS = b"body { color: red; }\n" * 40
+
+
+def make_client(tmp_path, **kwargs):
+    (tmp_path / "css").mkdir()
+    (tmp_path / "css" / "app.css").write_bytes(CSS)
+    (tmp_path / "index.html").write_text(
+        '<link rel="stylesheet" href="css/app.css"><a href="https://x.org/app.css">x</a>'
+        '<a href="outra.html">y</a>'
+    )
+    (tmp_path / ".escondido").write_text("nao servir")
+    assets = StaticAssets(tmp_path, **kwargs)
+    app = FastAPI()
+    app.mount("/static", assets)
+    return TestClient(app), assets
+
+
+def test_html_aponta_para_url_com_hash(tmp_path):
+    client, assets = make_client(tmp_path)
+    hashed = assets.assets["css/app.css"].hashed_name
+    assert hashed.startswith("css/app.") and hashed.endswith(".css") and hashed != "css/app.css"
+    html = client.get("/static/index.html").text
+    assert f'href="{hashed}"' in html
+    assert 'href="https://x.org/app.css"' in html and 'href="outra.html"' in html
+
+    imutavel = client.get(assets.url_for("css/app.css"))
+    assert imutavel.status_code == 200 and "immutable" in imutavel.headers["cache-control"]
+    assert client.get("/static/css/app.css").headers["cache-control"] == "public, no-cache"
+    assert client.get("/static/.escondido").status_code == 404
+    assert client.post("/static/index.html").status_code == 405
+
+
+def test_variante_por_accept_encoding_e_304(tmp_path):
+    client, _ = make_client(tmp_path)
+    resp = client.get("/static/css/app.css", headers={"Accept-Encoding": "gzip"})
+    assert resp.headers["content-encoding"] == "gzip"
+    assert resp.headers["vary"] == "Accept-Encoding"
+    assert int(resp.headers["content-length"]) < len(CSS)
+    assert resp.content == CSS  # httpx descomprime
+
+    plain = client.get("/static/css/app.css", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+    assert plain.headers["etag"] != resp.headers["etag"]
+
+    again = client.get(
+        "/static/css/app.css",
+        headers={"Accept-Encoding": "gzip", "If-None-Match": resp.headers["etag"]},
+    )
+    assert again.status_code == 304
+
+
+def test_arquivo_grande_vai_do_disco(tmp_path):
+    client, assets = make_client(tmp_path, memory_max=100)
+    assert assets.assets["css/app.css"].bodies == {}
+    resp = client.get("/static/css/app.css", headers={"Accept-Encoding": "gzip"})
+    assert resp.status_code == 200 and "content-encoding" not in resp.headers
+    assert client.get("/static/css/app.css", headers={"If-None-Match": resp.headers["etag"]}).status_code == 304
+
+
+def test_choose_encoding():
+    available = {"identity": b"", "gzip": b"", "br": b""}
+    assert choose_encoding(available, "gzip, deflate, br") == "br"
+    assert choose_encoding(available, "br;q=0, gzip") == "gzip"
+    assert choose_encoding(available, "") == "identity"
+    assert choose_encoding({"identity": b"", "gzip": b""}, "*") == "gzip"
@@ -0,0 +1,27 @@
+-- Migração para bancos criados antes da busca por nome com trigramas:
+-- extensões pg_trgm e unaccent, o wrapper IMMUTABLE f_unaccent (usado por
+-- `_buscar_pg` em crud/musicas.py) e o índice GIN de idx_musicas_nome_trgm.
+--
+-- Idempotente (IF NOT EXISTS / CREATE OR REPLACE). pg_trgm e unaccent são
+-- extensões "trusted" desde o PostgreSQL 13: o dono do banco pode criá-las;
+-- em versões anteriores rode como superusuário. O CREATE INDEX trava as
+-- escritas em musicas até o COMMIT (em tabelas grandes, prefira criar o
+-- índice antes com CREATE INDEX CONCURRENTLY, fora de transação).
+--
+--   psql -v ON_ERROR_STOP=1 -d <banco> -f db/migrations/007_busca_trigramas.sql
+
+BEGIN;
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE EXTENSION IF NOT EXISTS unaccent;
+
+-- unaccent() não é IMMUTABLE (depende do search_path); este wrapper é, e
+-- por isso pode ser usado em índices de expressão.
+CREATE OR REPLACE FUNCTION f_unaccent(text) RETURNS text
+  LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+  AS $$ SELECT public.unaccent('public.unaccent', $1) $$;
+
+-- busca de músicas por nome (LIKE '%x%' e word_similarity via <%)
+CREATE INDEX IF NOT EXISTS idx_musicas_nome_trgm ON musicas USING gin (lower(f_unaccent(nome)) gin_trgm_ops);
+
+COMMIT;
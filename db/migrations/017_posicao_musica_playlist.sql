@@ -0,0 +1,41 @@
+-- Migração para bancos criados antes das playlists ordenadas: adiciona
+-- musica_playlist.posicao (múltiplos de POSICAO_PASSO = 1024, como o
+-- setup.sql atual espera) e troca idx_mp_playlist por idx_mp_posicao.
+--
+-- Idempotente: rodar de novo (ou num banco já criado pelo setup.sql novo)
+-- não muda nada. Uma transação só; o ALTER TABLE trava musica_playlist até
+-- o COMMIT, então rode com a API parada ou fora do horário de pico.
+--
+--   psql -v ON_ERROR_STOP=1 -d <banco> -f db/migrations/017_posicao_musica_playlist.sql
+
+BEGIN;
+
+ALTER TABLE musica_playlist ADD COLUMN IF NOT EXISTS posicao BIGINT;
+
+-- faixas sem posição entram na ordem em que foram adicionadas, depois das
+-- que já têm posição (na primeira execução nenhuma tem)
+WITH ultima AS (
+  SELECT id_playlist, COALESCE(MAX(posicao), 0) AS posicao
+  FROM musica_playlist
+  GROUP BY id_playlist
+), novas AS (
+  SELECT id_playlist, id_musica,
+         row_number() OVER (PARTITION BY id_playlist ORDER BY created_at, id_musica) AS n
+  FROM musica_playlist
+  WHERE posicao IS NULL
+)
+UPDATE musica_playlist mp
+SET posicao = u.posicao + nv.n * 1024
+FROM novas nv
+JOIN ultima u ON u.id_playlist = nv.id_playlist
+WHERE mp.id_playlist = nv.id_playlist
+  AND mp.id_musica = nv.id_musica;
+
+ALTER TABLE musica_playlist ALTER COLUMN posicao SET NOT NULL;
+
+-- leitura da playlist em ordem (e o cursor por posição) sem sort; o índice
+-- antigo (id_playlist, id_musica) fica coberto por este
+CREATE INDEX IF NOT EXISTS idx_mp_posicao ON musica_playlist(id_playlist, posicao, id_musica);
+DROP INDEX IF EXISTS idx_mp_playlist;
+
+COMMIT;
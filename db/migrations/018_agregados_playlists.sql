@@ -0,0 +1,97 @@
+-- Migração para bancos criados antes do resumo das playlists: adiciona
+-- qtd_musicas / duracao_total_seg / atualizada_em em playlists, os triggers
+-- que os mantêm e calcula os valores atuais uma vez a partir de
+-- musica_playlist.
+--
+-- Idempotente: colunas com IF NOT EXISTS, funções com CREATE OR REPLACE,
+-- triggers recriados e o recálculo só grava o que diverge. Uma transação
+-- só; as travas abaixo seguram as escritas nas duas tabelas até o COMMIT,
+-- então nenhuma faixa entra entre a criação dos triggers e o recálculo.
+--
+--   psql -v ON_ERROR_STOP=1 -d <banco> -f db/migrations/018_agregados_playlists.sql
+
+BEGIN;
+
+LOCK TABLE musica_playlist, musicas IN SHARE ROW EXCLUSIVE MODE;
+
+ALTER TABLE playlists
+  ADD COLUMN IF NOT EXISTS qtd_musicas       INTEGER NOT NULL DEFAULT 0,
+  ADD COLUMN IF NOT EXISTS duracao_total_seg BIGINT NOT NULL DEFAULT 0,
+  ADD COLUMN IF NOT EXISTS atualizada_em     TIMESTAMPTZ NOT NULL DEFAULT NOW();
+
+-- mesmas funções e triggers do setup.sql
+
+CREATE OR REPLACE FUNCTION f_playlist_agregados() RETURNS trigger
+  LANGUAGE plpgsql AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    UPDATE playlists
+    SET qtd_musicas = qtd_musicas + 1,
+        duracao_total_seg = duracao_total_seg
+          + COALESCE((SELECT duracao_seg FROM musicas WHERE id_musica = NEW.id_musica), 0),
+        atualizada_em = NOW()
+    WHERE id_playlist = NEW.id_playlist;
+  ELSE
+    -- se a música já foi apagada (cascade), f_musica_duracao descontou a duração
+    UPDATE playlists
+    SET qtd_musicas = qtd_musicas - 1,
+        duracao_total_seg = duracao_total_seg
+          - COALESCE((SELECT duracao_seg FROM musicas WHERE id_musica = OLD.id_musica), 0),
+        atualizada_em = NOW()
+    WHERE id_playlist = OLD.id_playlist;
+  END IF;
+  RETURN NULL;
+END $$;
+
+DROP TRIGGER IF EXISTS trg_musica_playlist_agregados ON musica_playlist;
+CREATE TRIGGER trg_musica_playlist_agregados
+  AFTER INSERT OR DELETE ON musica_playlist
+  FOR EACH ROW EXECUTE FUNCTION f_playlist_agregados();
+
+CREATE OR REPLACE FUNCTION f_musica_duracao() RETURNS trigger
+  LANGUAGE plpgsql AS $$
+BEGIN
+  IF TG_OP = 'UPDATE' THEN
+    UPDATE playlists p
+    SET duracao_total_seg = p.duracao_total_seg
+          + COALESCE(NEW.duracao_seg, 0) - COALESCE(OLD.duracao_seg, 0),
+        atualizada_em = NOW()
+    FROM musica_playlist mp
+    WHERE mp.id_musica = NEW.id_musica AND p.id_playlist = mp.id_playlist;
+    RETURN NEW;
+  END IF;
+  UPDATE playlists p
+  SET duracao_total_seg = p.duracao_total_seg - COALESCE(OLD.duracao_seg, 0)
+  FROM musica_playlist mp
+  WHERE mp.id_musica = OLD.id_musica AND p.id_playlist = mp.id_playlist;
+  RETURN OLD;
+END $$;
+
+DROP TRIGGER IF EXISTS trg_musicas_duracao ON musicas;
+CREATE TRIGGER trg_musicas_duracao
+  AFTER UPDATE OF duracao_seg ON musicas
+  FOR EACH ROW WHEN (OLD.duracao_seg IS DISTINCT FROM NEW.duracao_seg)
+  EXECUTE FUNCTION f_musica_duracao();
+
+DROP TRIGGER IF EXISTS trg_musicas_apagada ON musicas;
+CREATE TRIGGER trg_musicas_apagada
+  BEFORE DELETE ON musicas
+  FOR EACH ROW EXECUTE FUNCTION f_musica_duracao();
+
+-- recálculo único (inclusive das playlists vazias, que ficam em 0)
+UPDATE playlists p
+SET qtd_musicas = a.n,
+    duracao_total_seg = a.d
+FROM (
+  SELECT pl.id_playlist,
+         count(mp.id_musica) AS n,
+         COALESCE(sum(m.duracao_seg), 0) AS d
+  FROM playlists pl
+  LEFT JOIN musica_playlist mp ON mp.id_playlist = pl.id_playlist
+  LEFT JOIN musicas m ON m.id_musica = mp.id_musica
+  GROUP BY pl.id_playlist
+) AS a
+WHERE p.id_playlist = a.id_playlist
+  AND (p.qtd_musicas, p.duracao_total_seg) IS DISTINCT FROM (a.n, a.d);
+
+COMMIT;
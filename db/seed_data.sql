@@ -72,11 +72,12 @@ BEGIN
   END IF;
 
   -- Playlist contents
-  INSERT INTO musica_playlist (id_playlist, id_musica)
-  SELECT pl1, id_musica FROM musicas WHERE nome IN ('Skyline Dreams', 'Midnight Echoes')
+  INSERT INTO musica_playlist (id_playlist, id_musica, posicao)
+  SELECT pl1, id_musica, 1024 * row_number() OVER (ORDER BY id_musica)
+  FROM musicas WHERE nome IN ('Skyline Dreams', 'Midnight Echoes')
   ON CONFLICT DO NOTHING;
 
-  INSERT INTO musica_playlist (id_playlist, id_musica)
-  SELECT pl2, id_musica FROM musicas WHERE nome = 'Riff Runner'
+  INSERT INTO musica_playlist (id_playlist, id_musica, posicao)
+  SELECT pl2, id_musica, 1024 FROM musicas WHERE nome = 'Riff Runner'
   ON CONFLICT DO NOTHING;
 END$$;
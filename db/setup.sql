@@ -1,5 +1,17 @@
+-- Schema de um banco novo. Bancos criados com uma versão anterior deste
+-- arquivo: aplique os scripts de db/migrations/ em ordem (são idempotentes).
+
 -- Habilita hashing seguro (bcrypt) para cadastro e login
 CREATE EXTENSION IF NOT EXISTS pgcrypto;
+-- Busca por nome: trigramas + remoção de acentos
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE EXTENSION IF NOT EXISTS unaccent;
+
+-- unaccent() não é IMMUTABLE (depende do search_path); este wrapper é, e
+-- por isso pode ser usado em índices de expressão.
+CREATE OR REPLACE FUNCTION f_unaccent(text) RETURNS text
+  LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+  AS $$ SELECT public.unaccent('public.unaccent', $1) $$;
 
 -- ======================
 -- TABELAS
@@ -36,21 +48,98 @@ CREATE TABLE playlists (
   id_playlist    BIGSERIAL PRIMARY KEY,
   nome           VARCHAR(120) NOT NULL,
   id_dono        BIGINT NOT NULL REFERENCES usuarios(id_usuario) ON DELETE CASCADE,
-  created_at     TIMESTAMPTZ NOT NULL DEFAULT NOW()
+  created_at     TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  -- resumo mantido pelos triggers abaixo (nunca recalculado varrendo a relação)
+  qtd_musicas       INTEGER NOT NULL DEFAULT 0,
+  duracao_total_seg BIGINT NOT NULL DEFAULT 0,
+  atualizada_em     TIMESTAMPTZ NOT NULL DEFAULT NOW()
 );
 
 -- relação N:N entre playlists e músicas
+-- posicao: ordem na playlist, com folga entre faixas (múltiplos de 1024) para
+-- mover/inserir no meio sem renumerar a lista inteira
 CREATE TABLE musica_playlist (
   id_musica      BIGINT NOT NULL REFERENCES musicas(id_musica) ON DELETE CASCADE,
   id_playlist    BIGINT NOT NULL REFERENCES playlists(id_playlist) ON DELETE CASCADE,
+  posicao        BIGINT NOT NULL,
   created_at     TIMESTAMPTZ NOT NULL DEFAULT NOW(),
   PRIMARY KEY (id_musica, id_playlist)
 );
 
+-- ======================
+-- AGREGADOS DAS PLAYLISTS
+-- ======================
+
+-- cada faixa que entra/sai da playlist ajusta contagem e duração
+CREATE OR REPLACE FUNCTION f_playlist_agregados() RETURNS trigger
+  LANGUAGE plpgsql AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    UPDATE playlists
+    SET qtd_musicas = qtd_musicas + 1,
+        duracao_total_seg = duracao_total_seg
+          + COALESCE((SELECT duracao_seg FROM musicas WHERE id_musica = NEW.id_musica), 0),
+        atualizada_em = NOW()
+    WHERE id_playlist = NEW.id_playlist;
+  ELSE
+    -- se a música já foi apagada (cascade), f_musica_duracao descontou a duração
+    UPDATE playlists
+    SET qtd_musicas = qtd_musicas - 1,
+        duracao_total_seg = duracao_total_seg
+          - COALESCE((SELECT duracao_seg FROM musicas WHERE id_musica = OLD.id_musica), 0),
+        atualizada_em = NOW()
+    WHERE id_playlist = OLD.id_playlist;
+  END IF;
+  RETURN NULL;
+END $$;
+
+CREATE TRIGGER trg_musica_playlist_agregados
+  AFTER INSERT OR DELETE ON musica_playlist
+  FOR EACH ROW EXECUTE FUNCTION f_playlist_agregados();
+
+-- duração editada/música apagada: ajusta as playlists que a contêm
+CREATE OR REPLACE FUNCTION f_musica_duracao() RETURNS trigger
+  LANGUAGE plpgsql AS $$
+BEGIN
+  IF TG_OP = 'UPDATE' THEN
+    UPDATE playlists p
+    SET duracao_total_seg = p.duracao_total_seg
+          + COALESCE(NEW.duracao_seg, 0) - COALESCE(OLD.duracao_seg, 0),
+        atualizada_em = NOW()
+    FROM musica_playlist mp
+    WHERE mp.id_musica = NEW.id_musica AND p.id_playlist = mp.id_playlist;
+    RETURN NEW;
+  END IF;
+  UPDATE playlists p
+  SET duracao_total_seg = p.duracao_total_seg - COALESCE(OLD.duracao_seg, 0)
+  FROM musica_playlist mp
+  WHERE mp.id_musica = OLD.id_musica AND p.id_playlist = mp.id_playlist;
+  RETURN OLD;
+END $$;
+
+CREATE TRIGGER trg_musicas_duracao
+  AFTER UPDATE OF duracao_seg ON musicas
+  FOR EACH ROW WHEN (OLD.duracao_seg IS DISTINCT FROM NEW.duracao_seg)
+  EXECUTE FUNCTION f_musica_duracao();
+
+CREATE TRIGGER trg_musicas_apagada
+  BEFORE DELETE ON musicas
+  FOR EACH ROW EXECUTE FUNCTION f_musica_duracao();
+
 -- ======================
 -- ÍNDICES ÚTEIS
 -- ======================
-CREATE INDEX idx_musicas_album   ON musicas(id_album);
-CREATE INDEX idx_musicas_usuario ON musicas(id_usuario);
-CREATE INDEX idx_playlists_dono  ON playlists(id_dono);
-CREATE INDEX idx_mp_playlist     ON musica_playlist(id_playlist);
+-- (filtro, id) atende tanto o WHERE quanto o ORDER BY da paginação por cursor
+CREATE INDEX idx_musicas_album   ON musicas(id_album, id_musica);
+CREATE INDEX idx_musicas_usuario ON musicas(id_usuario, id_musica);
+CREATE INDEX idx_musicas_genero  ON musicas(genero, id_musica);
+CREATE INDEX idx_playlists_dono  ON playlists(id_dono, id_playlist);
+CREATE INDEX idx_albuns_usuario  ON albuns(id_usuario, id_album);
+CREATE INDEX idx_albuns_ano      ON albuns(ano, id_album);
+-- GET /albuns?titulo=<prefixo>: lower(titulo) LIKE 'x%' usa este índice
+CREATE INDEX idx_albuns_titulo   ON albuns(lower(titulo) text_pattern_ops);
+-- leitura da playlist em ordem (e o cursor por posição) sem sort
+CREATE INDEX idx_mp_posicao      ON musica_playlist(id_playlist, posicao, id_musica);
+
+-- busca de músicas por nome (LIKE '%x%' e word_similarity via <%)
+CREATE INDEX idx_musicas_nome_trgm ON musicas USING gin (lower(f_unaccent(nome)) gin_trgm_ops);
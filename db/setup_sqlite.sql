@@ -0,0 +1,113 @@
+-- Esquema do backend SQLite embutido (SQLITE_PATH). Espelha db/setup.sql:
+-- mesmas tabelas, colunas, índices e agregados mantidos por trigger.
+-- Idempotente: aplicado por backend/sqlite_db.py ao abrir o arquivo.
+
+-- ======================
+-- TABELAS
+-- ======================
+
+CREATE TABLE IF NOT EXISTS usuarios (
+  id_usuario     INTEGER PRIMARY KEY AUTOINCREMENT,
+  nome           VARCHAR(120) NOT NULL,
+  email          VARCHAR(255) NOT NULL UNIQUE,
+  senha_hash     TEXT NOT NULL,
+  role           VARCHAR(20) NOT NULL DEFAULT 'user',
+  created_at     TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
+);
+
+-- o teto do ano (ano corrente) fica na aplicação: CHECK não aceita 'now'
+CREATE TABLE IF NOT EXISTS albuns (
+  id_album       INTEGER PRIMARY KEY AUTOINCREMENT,
+  titulo         VARCHAR(160) NOT NULL,
+  ano            INTEGER CHECK (ano IS NULL OR ano >= 1900),
+  id_usuario     INTEGER NOT NULL REFERENCES usuarios(id_usuario) ON DELETE CASCADE,
+  created_at     TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
+);
+
+CREATE TABLE IF NOT EXISTS musicas (
+  id_musica      INTEGER PRIMARY KEY AUTOINCREMENT,
+  nome           VARCHAR(160) NOT NULL,
+  genero         VARCHAR(60),
+  duracao_seg    INTEGER CHECK (duracao_seg IS NULL OR duracao_seg >= 0),
+  id_album       INTEGER NOT NULL REFERENCES albuns(id_album) ON DELETE CASCADE,
+  id_usuario     INTEGER NOT NULL REFERENCES usuarios(id_usuario) ON DELETE CASCADE,
+  created_at     TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
+);
+
+CREATE TABLE IF NOT EXISTS playlists (
+  id_playlist    INTEGER PRIMARY KEY AUTOINCREMENT,
+  nome           VARCHAR(120) NOT NULL,
+  id_dono        INTEGER NOT NULL REFERENCES usuarios(id_usuario) ON DELETE CASCADE,
+  created_at     TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now')),
+  qtd_musicas       INTEGER NOT NULL DEFAULT 0,
+  duracao_total_seg INTEGER NOT NULL DEFAULT 0,
+  atualizada_em     TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
+);
+
+CREATE TABLE IF NOT EXISTS musica_playlist (
+  id_musica      INTEGER NOT NULL REFERENCES musicas(id_musica) ON DELETE CASCADE,
+  id_playlist    INTEGER NOT NULL REFERENCES playlists(id_playlist) ON DELETE CASCADE,
+  posicao        INTEGER NOT NULL,
+  created_at     TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now')),
+  PRIMARY KEY (id_musica, id_playlist)
+);
+
+-- ======================
+-- AGREGADOS DAS PLAYLISTS
+-- ======================
+
+CREATE TRIGGER IF NOT EXISTS trg_musica_playlist_inserida
+AFTER INSERT ON musica_playlist
+BEGIN
+  UPDATE playlists
+  SET qtd_musicas = qtd_musicas + 1,
+      duracao_total_seg = duracao_total_seg
+        + COALESCE((SELECT duracao_seg FROM musicas WHERE id_musica = NEW.id_musica), 0),
+      atualizada_em = strftime('%Y-%m-%dT%H:%M:%fZ', 'now')
+  WHERE id_playlist = NEW.id_playlist;
+END;
+
+-- se a música já foi apagada (cascade), trg_musicas_apagada descontou a duração
+CREATE TRIGGER IF NOT EXISTS trg_musica_playlist_removida
+AFTER DELETE ON musica_playlist
+BEGIN
+  UPDATE playlists
+  SET qtd_musicas = qtd_musicas - 1,
+      duracao_total_seg = duracao_total_seg
+        - COALESCE((SELECT duracao_seg FROM musicas WHERE id_musica = OLD.id_musica), 0),
+      atualizada_em = strftime('%Y-%m-%dT%H:%M:%fZ', 'now')
+  WHERE id_playlist = OLD.id_playlist;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_musicas_duracao
+AFTER UPDATE OF duracao_seg ON musicas
+WHEN OLD.duracao_seg IS NOT NEW.duracao_seg
+BEGIN
+  UPDATE playlists
+  SET duracao_total_seg = duracao_total_seg
+        + COALESCE(NEW.duracao_seg, 0) - COALESCE(OLD.duracao_seg, 0),
+      atualizada_em = strftime('%Y-%m-%dT%H:%M:%fZ', 'now')
+  WHERE id_playlist IN (SELECT id_playlist FROM musica_playlist WHERE id_musica = NEW.id_musica);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_musicas_apagada
+BEFORE DELETE ON musicas
+BEGIN
+  UPDATE playlists
+  SET duracao_total_seg = duracao_total_seg - COALESCE(OLD.duracao_seg, 0)
+  WHERE id_playlist IN (SELECT id_playlist FROM musica_playlist WHERE id_musica = OLD.id_musica);
+END;
+
+-- ======================
+-- ÍNDICES ÚTEIS
+-- ======================
+CREATE INDEX IF NOT EXISTS idx_musicas_album   ON musicas(id_album, id_musica);
+CREATE INDEX IF NOT EXISTS idx_musicas_usuario ON musicas(id_usuario, id_musica);
+CREATE INDEX IF NOT EXISTS idx_musicas_genero  ON musicas(genero, id_musica);
+CREATE INDEX IF NOT EXISTS idx_playlists_dono  ON playlists(id_dono, id_playlist);
+CREATE INDEX IF NOT EXISTS idx_albuns_usuario  ON albuns(id_usuario, id_album);
+CREATE INDEX IF NOT EXISTS idx_albuns_ano      ON albuns(ano, id_album);
+CREATE INDEX IF NOT EXISTS idx_albuns_titulo   ON albuns(lower(titulo));
+CREATE INDEX IF NOT EXISTS idx_mp_posicao      ON musica_playlist(id_playlist, posicao, id_musica);
+-- (sem equivalente ao GIN de trigramas: a busca por nome filtra com
+-- f_unaccent/word_similarity registradas pela conexão)